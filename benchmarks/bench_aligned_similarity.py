@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+基准测试：对比按偏移逐一比较与 FFT 互相关的时间对齐相似度耗时
+
+对不同长度的视频(每秒一帧)，第二个视频是第一个视频去掉开头后的片段。分别计时逐个偏移
+计算 phash/colorhist 相似度 (O(n²)) 和 video_similarity_aligned (O(n log n))，并检查二者
+找到的偏移一致。
+
+用法:
+    python benchmarks/bench_aligned_similarity.py --lengths 60 300 1200
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from similarity import (phash_similarity, histogram_similarity, video_similarity_aligned,
+                        COLORHIST_BINS, PHASH_WEIGHT, COLORHIST_WEIGHT)
+
+
+def brute_force_aligned(phash1, hist1, phash2, hist2, min_overlap=0.5):
+    """逐个偏移直接计算重叠帧的相似度"""
+    n1, n2 = len(phash1), len(phash2)
+    min_frames = max(1, int(np.ceil(min_overlap * min(n1, n2))))
+    best_score, best_offset = -1.0, 0
+    for offset in sorted(range(-(n2 - 1), n1), key=abs):
+        start = max(0, -offset)
+        end = min(n2, n1 - offset)
+        if end - start < min_frames and offset != 0:
+            continue
+        score = (PHASH_WEIGHT * phash_similarity(phash1[start + offset:end + offset], phash2[start:end]) +
+                 COLORHIST_WEIGHT * histogram_similarity(hist1[start + offset:end + offset], hist2[start:end]))
+        if score > best_score:
+            best_score, best_offset = score, offset
+    return best_score, best_offset
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aligned similarity benchmark")
+    parser.add_argument("--lengths", type=int, nargs='+', default=[60, 300, 1200],
+                        help="Frames of the longer video")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed repetitions")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for length in args.lengths:
+        phash = rng.integers(0, 2 ** 63, size=length, dtype=np.uint64)
+        hist = rng.dirichlet(np.full(COLORHIST_BINS, 0.1), size=length).astype(np.float32)
+        trim = length // 5
+        phash2, hist2 = phash[trim:length - trim // 2], hist[trim:length - trim // 2]
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            brute = brute_force_aligned(phash, hist, phash2, hist2)
+        brute_time = (time.perf_counter() - start) / args.repeat
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            fft = video_similarity_aligned(phash, hist, phash2, hist2)
+        fft_time = (time.perf_counter() - start) / args.repeat
+
+        print(f"{length} 帧 vs {len(phash2)} 帧: 逐偏移 {brute_time * 1000:.1f}毫秒 (偏移 {brute[1]}, {brute[0]:.4f})，"
+              f"FFT {fft_time * 1000:.2f}毫秒 (偏移 {fft[1]}, {fft[0]:.4f})，"
+              f"加速 {brute_time / fft_time:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
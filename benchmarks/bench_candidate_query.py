@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+基准测试：在合成元数据库上比较 query_candidates 的 SQL 索引筛选与读出全部记录后在 Python 中
+解析 "宽x高" 字符串筛选的耗时
+
+用法:
+    python benchmarks/bench_candidate_query.py --videos 200000 --repeat 5
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+import statistics
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from video_analyzer import VideoAnalyzer
+
+RESOLUTIONS = ((1920, 1080), (1280, 720), (1080, 1920), (720, 1280), (1080, 1080), (3840, 2160), (640, 480))
+CODECS = ('h264', 'hevc', 'vp9', 'mpeg4')
+
+# (名称, query_candidates 参数)
+QUERIES = (
+    ('portrait', {'aspect_range': (0.0, 0.99)}),
+    ('portrait_5_15s', {'aspect_range': (0.0, 0.99), 'min_duration': 5.0, 'max_duration': 15.0}),
+    ('hd_hevc', {'min_height': 1080, 'codec': 'hevc'}),
+    ('uhd', {'min_height': 2160, 'limit': 100}),
+)
+
+
+def populate_metadata(db_path: str, videos: int, seed: int = 0):
+    """直接写入随机的元数据行(时长、分辨率、帧率、编码)"""
+    rng = np.random.default_rng(seed)
+    now = datetime.now()
+    conn = sqlite3.connect(db_path)
+    rows = []
+    for video_id in range(1, videos + 1):
+        width, height = RESOLUTIONS[int(rng.integers(len(RESOLUTIONS)))]
+        rows.append((video_id, f"/synthetic/clip_{video_id:07d}.mp4", float(rng.uniform(1.0, 60.0)),
+                     f"{width}x{height}", width, height, width / height, float(rng.choice([24, 25, 30, 60])),
+                     CODECS[int(rng.integers(len(CODECS)))], 0, now, "v1.0", now))
+    conn.executemany('''
+    INSERT INTO video_metadata (id, file_path, duration, resolution, width, height, aspect_ratio, fps, codec,
+                                file_size, last_modified, feature_version, analyzed_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.commit()
+    conn.close()
+
+
+def filter_in_python(db_path: str, min_duration: float = 0.0, max_duration: float = float('inf'),
+                     aspect_range=None, min_height=None, codec=None, limit=None):
+    """旧的方式：读出全部记录，解析分辨率字符串后筛选"""
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT id, file_path, duration, resolution, codec FROM video_metadata "
+                        "WHERE alias_of IS NULL").fetchall()
+    conn.close()
+    matches = []
+    for video_id, file_path, duration, resolution, video_codec in rows:
+        width, height = (int(value) for value in resolution.split('x'))
+        if not min_duration <= duration <= max_duration:
+            continue
+        if aspect_range and not aspect_range[0] <= width / height <= aspect_range[1]:
+            continue
+        if min_height and height < min_height:
+            continue
+        if codec and video_codec != codec:
+            continue
+        matches.append(video_id)
+    return matches[:limit] if limit else matches
+
+
+def _median_ms(func, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Candidate query benchmark")
+    parser.add_argument("--videos", type=int, default=200000, help="Number of synthetic metadata rows")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per query (median is reported)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_path = os.path.join(temp_dir, 'candidates.db')
+        analyzer = VideoAnalyzer(db_path=db_path)
+        start = time.perf_counter()
+        populate_metadata(db_path, args.videos)
+        print(f"写入 {args.videos} 行元数据，耗时 {time.perf_counter() - start:.1f}秒")
+
+        print(f"{'查询':<16} {'结果数':>8} {'SQL索引':>10} {'Python筛选':>12}")
+        for name, filters in QUERIES:
+            found = len(analyzer.query_candidates(fields=('id',), **filters))
+            sql_ms = _median_ms(lambda: analyzer.query_candidates(fields=('id',), **filters), args.repeat)
+            python_ms = _median_ms(lambda: filter_in_python(db_path, **filters), args.repeat)
+            print(f"{name:<16} {found:>8} {sql_ms:>8.1f}毫秒 {python_ms:>10.1f}毫秒")
+        analyzer.db.close()
+
+
+if __name__ == "__main__":
+    main()
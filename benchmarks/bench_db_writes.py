@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+基准测试：对比扫描结果的两种写入方式
+  - 逐文件: 每个文件新建连接、逐条插入特征、提交后关闭 (默认日志模式)
+  - 批量:   每线程一个长连接 (WAL, synchronous=NORMAL)，executemany 插入特征，每 N 个文件提交一次
+
+用法:
+    python benchmarks/bench_db_writes.py --files 2000 --frames 30 --batch-size 50
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from video_analyzer import VideoAnalyzer
+from similarity import COLORHIST_BINS
+
+
+def make_results(files: int, frames: int, seed: int = 0):
+    """生成模拟的 (plan, result) 分析结果"""
+    rng = np.random.default_rng(seed)
+    now = datetime.now()
+    results = []
+    for i in range(files):
+        plan = {
+            'file_path': f"/synthetic/clip_{i:06d}.mp4",
+            'name': f"clip_{i:06d}.mp4",
+            'file_size': int(rng.integers(1 << 20, 1 << 26)),
+            'last_modified': now,
+            'video_id': None,
+            'up_to_date': False
+        }
+        result = {
+            'metadata': {'duration': float(frames), 'resolution': "1920x1080"},
+            'features': {
+                'phash': rng.integers(0, 2 ** 63, size=frames, dtype=np.uint64).tobytes(),
+                'colorhist': rng.random((frames, COLORHIST_BINS), dtype=np.float32).tobytes()
+            }
+        }
+        results.append((plan, result))
+    return results
+
+
+def write_per_file(db_path: str, analyzer: VideoAnalyzer, results):
+    """旧的写入方式：每个文件一个连接和一个事务"""
+    for plan, result in results:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM video_metadata WHERE file_path = ?", (plan['file_path'],))
+        cursor.fetchone()
+        metadata = result['metadata']
+        cursor.execute('''
+        INSERT INTO video_metadata
+        (file_path, duration, resolution, file_size, last_modified, feature_version, analyzed_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (plan['file_path'], metadata['duration'], metadata['resolution'], plan['file_size'],
+              plan['last_modified'].isoformat(), analyzer.current_feature_version, datetime.now().isoformat()))
+        video_id = cursor.lastrowid
+        cursor.execute("DELETE FROM video_features WHERE video_id = ?", (video_id,))
+        for feature_type, feature_data in result['features'].items():
+            cursor.execute('''
+            INSERT INTO video_features (video_id, feature_type, feature_data)
+            VALUES (?, ?, ?)
+            ''', (video_id, feature_type, feature_data))
+        conn.commit()
+        conn.close()
+
+
+def write_batched(analyzer: VideoAnalyzer, results):
+    """新的写入方式：长连接 + 每 write_batch_size 个文件提交一次"""
+    cursor = analyzer.db.connection().cursor()
+    for start in range(0, len(results), analyzer.write_batch_size):
+        batch = results[start:start + analyzer.write_batch_size]
+        for plan, _ in batch:
+            cursor.execute("SELECT id FROM video_metadata WHERE file_path = ?", (plan['file_path'],))
+            cursor.fetchone()
+        analyzer._write_results(cursor, batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Database write benchmark")
+    parser.add_argument("--files", type=int, default=2000, help="Number of analysed files to store")
+    parser.add_argument("--frames", type=int, default=30, help="Sampled frames per file")
+    parser.add_argument("--batch-size", type=int, default=50, help="Files per transaction in batched mode")
+    args = parser.parse_args()
+
+    results = make_results(args.files, args.frames)
+    timings = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # 逐文件写入使用默认日志模式的独立数据库，避免继承 WAL 设置
+        legacy_path = os.path.join(temp_dir, 'legacy.db')
+        legacy_analyzer = VideoAnalyzer(db_path=legacy_path)
+        legacy_analyzer.db.connection().execute("PRAGMA journal_mode=DELETE")
+        legacy_analyzer.db.close()
+        start = time.perf_counter()
+        write_per_file(legacy_path, legacy_analyzer, results)
+        timings['逐文件'] = time.perf_counter() - start
+
+        analyzer = VideoAnalyzer(db_path=os.path.join(temp_dir, 'batched.db'))
+        analyzer.write_batch_size = args.batch_size
+        start = time.perf_counter()
+        write_batched(analyzer, results)
+        timings['批量'] = time.perf_counter() - start
+        analyzer.db.close()
+
+    print(f"写入 {args.files} 个文件的分析结果 (每个 {args.frames} 帧)，批量大小 {args.batch_size}")
+    print(f"{'方式':<8}{'总耗时(秒)':>12}{'每文件(毫秒)':>14}")
+    for name, elapsed in timings.items():
+        print(f"{name:<8}{elapsed:>12.2f}{elapsed / args.files * 1000:>14.2f}")
+    print(f"加速比: {timings['逐文件'] / timings['批量']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
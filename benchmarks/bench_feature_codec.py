@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+基准测试：对比不同特征编码下的数据库大小和完整特征索引的加载耗时
+
+合成特征接近真实视频：相邻采样帧的 pHash 只相差少数几位，颜色直方图集中在少数几个
+颜色分箱上 (按 L2 归一化，与 cv2.normalize 相同)。每种编码各写入一个数据库，然后计时
+FeatureIndex.refresh() 的完整加载。
+
+用法:
+    python benchmarks/bench_feature_codec.py --videos 50000 --frames 10
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from video_analyzer import VideoAnalyzer
+from feature_index import FeatureIndex
+from feature_codec import encode_feature, lz4_available
+from similarity import COLORHIST_BINS
+
+
+def synthetic_features(rng: np.random.Generator, frames: int):
+    """生成一个视频的 pHash 序列和颜色直方图"""
+    n = int(rng.integers(max(1, frames // 2), frames * 2))
+    flips = rng.integers(0, 64, size=(n, 4)).astype(np.uint64)
+    keep = rng.random((n, 4)) < 0.5
+    drift = np.bitwise_or.reduce(np.where(keep, np.uint64(1) << flips, np.uint64(0)), axis=1)
+    phash = np.bitwise_xor.accumulate(np.concatenate([[rng.integers(0, 2 ** 63, dtype=np.uint64)], drift[1:]]))
+    hist = rng.dirichlet(np.full(COLORHIST_BINS, 0.1), size=n).astype(np.float32)
+    hist /= np.linalg.norm(hist, axis=1, keepdims=True)
+    return phash, hist
+
+
+def populate_database(analyzer: VideoAnalyzer, corpus, encoding):
+    """按给定编码写入所有视频的特征；encoding 为 None 时写入 v1.0 的原始字节"""
+    now = datetime.now().isoformat()
+    with analyzer.db.transaction() as cursor:
+        for video_id, (phash, hist) in enumerate(corpus, start=1):
+            cursor.execute('''
+            INSERT INTO video_metadata (id, file_path, duration, resolution, file_size,
+                                        last_modified, feature_version, analyzed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (video_id, f"/synthetic/clip_{video_id:06d}.mp4", float(len(phash)), "1920x1080",
+                  0, now, analyzer.current_feature_version, now))
+            if encoding is None:
+                blobs = (phash.tobytes(), hist.tobytes())
+            else:
+                hist_transform, compression = encoding
+                blobs = (encode_feature(phash, 'delta', compression),
+                         encode_feature(hist, hist_transform, compression))
+            cursor.executemany('''
+            INSERT INTO video_features (video_id, feature_type, feature_data) VALUES (?, ?, ?)
+            ''', [(video_id, 'phash', blobs[0]), (video_id, 'colorhist', blobs[1])])
+    analyzer.db.connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    analyzer.db.connection().execute("VACUUM")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Feature codec benchmark")
+    parser.add_argument("--videos", type=int, default=50000, help="Number of synthetic videos")
+    parser.add_argument("--frames", type=int, default=10, help="Average sampled frames per video")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    corpus = [synthetic_features(rng, args.frames) for _ in range(args.videos)]
+
+    encodings = {
+        'v1.0 原始字节': None,
+        'uint8 + 无压缩': ('uint8', 'none'),
+        'uint8 + zlib (默认)': ('uint8', 'zlib'),
+        'float16 + zlib': ('float16', 'zlib'),
+    }
+    if lz4_available():
+        encodings['uint8 + lz4'] = ('uint8', 'lz4')
+
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for i, (name, encoding) in enumerate(encodings.items()):
+            db_path = os.path.join(temp_dir, f'bench_{i}.db')
+            analyzer = VideoAnalyzer(db_path=db_path)
+            populate_database(analyzer, corpus, encoding)
+            size = os.path.getsize(db_path)
+
+            index = FeatureIndex(analyzer)
+            start = time.perf_counter()
+            index.refresh()
+            load_time = time.perf_counter() - start
+            analyzer.db.close()
+            results.append((name, size, load_time, len(index.video_ids)))
+
+    raw_size, raw_time = results[0][1], results[0][2]
+    print(f"{args.videos} 个视频，平均 {args.frames} 帧")
+    for name, size, load_time, loaded in results:
+        print(f"{name:<20} 数据库 {size / 2 ** 20:7.1f} MiB ({size / raw_size:5.1%})  "
+              f"加载索引 {load_time:.2f}秒 ({raw_time / load_time:.2f}x)，{loaded} 个视频")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+基准测试：在合成特征库上测量 find_similar_videos 的查询耗时，对比穷举比较与 LSH 候选的耗时和召回率
+
+用法:
+    python benchmarks/bench_feature_index.py --videos 50000 --frames 10 --probe-radius 1
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from video_analyzer import VideoAnalyzer
+from similarity import COLORHIST_BINS
+
+
+def populate_database(db_path: str, videos: int, frames: int, seed: int = 0,
+                      duplicate_every: int = 10, max_flipped_bits: int = 6):
+    """
+    直接写入随机的 phash/colorhist 特征，模拟一个已分析的视频库
+
+    每 duplicate_every 个视频中有一个是前一个视频的近似副本：每帧哈希随机翻转
+    最多 max_flipped_bits 位，直方图加入少量噪声。
+    """
+    rng = np.random.default_rng(seed)
+    now = datetime.now()
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    phash = hist = None
+    for video_id in range(1, videos + 1):
+        if duplicate_every and video_id % duplicate_every == 0 and phash is not None:
+            flips = rng.integers(0, 64, size=(len(phash), max_flipped_bits)).astype(np.uint64)
+            keep = rng.random((len(phash), max_flipped_bits)) < 0.5
+            flip_masks = np.bitwise_or.reduce(np.where(keep, np.uint64(1) << flips, np.uint64(0)), axis=1)
+            phash = phash ^ flip_masks
+            hist = hist + rng.random(hist.shape, dtype=np.float32) * 0.05
+        else:
+            n = int(rng.integers(max(1, frames // 2), frames * 2))
+            phash = rng.integers(0, 2 ** 63, size=n, dtype=np.uint64)
+            hist = rng.random((n, COLORHIST_BINS), dtype=np.float32)
+        cursor.execute('''
+        INSERT INTO video_metadata (id, file_path, duration, resolution, file_size,
+                                    last_modified, feature_version, analyzed_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (video_id, f"/synthetic/clip_{video_id:06d}.mp4", float(n), "1920x1080",
+              0, now, "v1.0", now))
+        cursor.executemany('''
+        INSERT INTO video_features (video_id, feature_type, feature_data) VALUES (?, ?, ?)
+        ''', [(video_id, 'phash', phash.tobytes()), (video_id, 'colorhist', hist.tobytes())])
+    conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Feature index benchmark")
+    parser.add_argument("--videos", type=int, default=50000, help="Number of synthetic videos")
+    parser.add_argument("--frames", type=int, default=10, help="Average sampled frames per video")
+    parser.add_argument("--queries", type=int, default=20, help="Number of timed queries")
+    parser.add_argument("--probe-radius", type=int, default=1, help="LSH probe radius")
+    parser.add_argument("--min-band-hits", type=int, default=2, help="LSH minimum band hits")
+    parser.add_argument("--threshold", type=float, default=0.8, help="Similarity threshold")
+    parser.add_argument("--select-count", type=int, default=360,
+                        help="Videos requested from get_random_dissimilar_videos (3 min audio / 1s segments * 2)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_path = os.path.join(temp_dir, 'bench.db')
+        analyzer = VideoAnalyzer(db_path=db_path)
+
+        start = time.perf_counter()
+        populate_database(db_path, args.videos, args.frames)
+        print(f"生成 {args.videos} 个视频的特征，耗时 {time.perf_counter() - start:.1f}秒")
+
+        start = time.perf_counter()
+        analyzer.get_feature_index()
+        load_time = time.perf_counter() - start
+
+        analyzer.lsh_probe_radius = args.probe_radius
+        analyzer.lsh_min_band_hits = args.min_band_hits
+        analyzer.lsh_min_videos = 0
+        analyzer.use_similarity_cache = False
+
+        # 查询近似副本的原始视频，保证每次查询都有应当找到的结果
+        rng = np.random.default_rng(1)
+        query_ids = rng.integers(1, args.videos // 10 + 1, size=args.queries) * 10 - 1
+        timings = {'exhaustive': [], 'lsh': []}
+        found = expected = 0
+        for video_id in query_ids:
+            start = time.perf_counter()
+            exact = analyzer.find_similar_videos(int(video_id), args.threshold, exhaustive=True)
+            timings['exhaustive'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            approx = analyzer.find_similar_videos(int(video_id), args.threshold)
+            timings['lsh'].append(time.perf_counter() - start)
+
+            expected += len(exact)
+            found += len({vid for vid, _ in exact} & {vid for vid, _ in approx})
+
+        select_timings = {}
+        for select_threshold in (args.threshold, 0.5):
+            start = time.perf_counter()
+            selected = analyzer.get_random_dissimilar_videos(args.select_count, select_threshold)
+            select_timings[select_threshold] = (time.perf_counter() - start, len(selected))
+
+        # 相似度缓存：首次查询计算并写入缓存行，新的分析器实例再次查询时直接读取
+        cache_timings = []
+        for _ in range(2):
+            cached_analyzer = VideoAnalyzer(db_path=db_path)
+            start = time.perf_counter()
+            for video_id in query_ids:
+                cached_analyzer.find_similar_videos(int(video_id), args.threshold)
+            cache_timings.append((time.perf_counter() - start) / len(query_ids))
+
+    print(f"索引加载耗时: {load_time:.2f}秒")
+    print(f"{'路径':<12}{'中位数(毫秒)':>14}{'最大(毫秒)':>12}")
+    for name, values in timings.items():
+        values = np.array(values) * 1000
+        print(f"{name:<12}{np.median(values):>14.1f}{values.max():>12.1f}")
+    for select_threshold, (elapsed, selected) in select_timings.items():
+        print(f"get_random_dissimilar_videos(count={args.select_count}, threshold={select_threshold}): "
+              f"选出 {selected} 个，耗时 {elapsed * 1000:.1f}毫秒")
+    print(f"相似度缓存查询耗时(毫秒): 首次 {cache_timings[0] * 1000:.1f} (含加载特征索引), "
+          f"命中 {cache_timings[1] * 1000:.1f}")
+    print(f"LSH 召回率 (probe_radius={args.probe_radius}, min_band_hits={args.min_band_hits}): {found / max(expected, 1):.3f} ({found}/{expected})")
+
+
+if __name__ == "__main__":
+    main()
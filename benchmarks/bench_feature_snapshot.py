@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+基准测试：对比从 SQLite 加载特征索引与映射特征快照的耗时
+
+在合成特征库上分别计时：新进程从数据库完整加载索引、写入快照、新进程映射快照并完成
+第一次相似度查询，以及修改 1% 的视频后增量更新快照。
+
+用法:
+    python benchmarks/bench_feature_snapshot.py --videos 50000 --frames 10
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from video_analyzer import VideoAnalyzer
+from bench_feature_index import populate_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Feature snapshot benchmark")
+    parser.add_argument("--videos", type=int, default=50000, help="Number of synthetic videos")
+    parser.add_argument("--frames", type=int, default=10, help="Average sampled frames per video")
+    parser.add_argument("--changed", type=float, default=0.01, help="Fraction of videos changed before the update")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_path = os.path.join(temp_dir, 'bench.db')
+        snapshot_dir = os.path.join(temp_dir, 'snapshot')
+        VideoAnalyzer(db_path=db_path).db.close()
+        populate_database(db_path, args.videos, args.frames)
+
+        start = time.perf_counter()
+        analyzer = VideoAnalyzer(db_path=db_path)
+        analyzer.get_feature_index()
+        db_load_time = time.perf_counter() - start
+
+        writer = VideoAnalyzer(db_path=db_path, snapshot_dir=snapshot_dir)
+        start = time.perf_counter()
+        writer.update_feature_snapshot()
+        first_write_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        reader = VideoAnalyzer(db_path=db_path, snapshot_dir=snapshot_dir)
+        index = reader.get_feature_index()
+        map_time = time.perf_counter() - start
+        start = time.perf_counter()
+        index.find_similar(int(index.video_ids[0]), 0.8)
+        query_time = time.perf_counter() - start
+
+        # 修改部分视频的 analyzed_at，模拟重新分析
+        changed = max(1, int(args.videos * args.changed))
+        with writer.db.transaction() as cursor:
+            cursor.executemany("UPDATE video_metadata SET analyzed_at = ? WHERE id = ?",
+                               [(datetime.now().isoformat(), video_id) for video_id in range(1, changed + 1)])
+            cursor.execute("UPDATE video_features SET feature_data = feature_data WHERE video_id <= ?", (changed,))
+        start = time.perf_counter()
+        writer.update_feature_snapshot()
+        update_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        reader.get_feature_index()
+        reader_refresh_time = time.perf_counter() - start
+        for instance in (analyzer, writer, reader):
+            instance.db.close()
+
+    print(f"{args.videos} 个视频，平均 {args.frames} 帧")
+    print(f"从数据库加载索引: {db_load_time:.2f}秒")
+    print(f"首次写入快照 (含加载索引): {first_write_time:.2f}秒")
+    print(f"映射快照: {map_time:.3f}秒，随后第一次查询 {query_time:.3f}秒")
+    print(f"修改 {changed} 个视频后增量更新快照: {update_time:.2f}秒，已映射快照的进程增量刷新 {reader_refresh_time:.2f}秒")
+
+
+if __name__ == "__main__":
+    main()
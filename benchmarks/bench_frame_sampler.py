@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+基准测试：每个视频文件的特征提取耗时，对比逐特征各自解码与共享帧采样单次解码
+
+用法:
+    python benchmarks/bench_frame_sampler.py --files 5 --seconds 20 --size 1280x720
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from video_analyzer import VideoAnalyzer
+
+
+def make_synthetic_video(path: str, seconds: int, fps: int, width: int, height: int, seed: int):
+    """使用 OpenCV 生成一个带运动和噪声的合成视频"""
+    rng = np.random.default_rng(seed)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+    base = rng.integers(0, 256, size=(height // 8, width // 8, 3), dtype=np.uint8)
+    base = cv2.resize(base, (width, height), interpolation=cv2.INTER_LINEAR)
+    for i in range(seconds * fps):
+        frame = np.roll(base, shift=i * 4, axis=1)
+        cv2.putText(frame, str(i), (20, height // 2), cv2.FONT_HERSHEY_SIMPLEX, 3, (255, 255, 255), 5)
+        writer.write(frame)
+    writer.release()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Frame sampler benchmark")
+    parser.add_argument("--files", type=int, default=3, help="Number of synthetic videos")
+    parser.add_argument("--seconds", type=int, default=10, help="Duration of each video")
+    parser.add_argument("--fps", type=int, default=30, help="Frame rate of each video")
+    parser.add_argument("--size", default="1280x720", help="Resolution WxH")
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.split('x'))
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        files = []
+        for i in range(args.files):
+            path = os.path.join(temp_dir, f"clip_{i:03d}.avi")
+            make_synthetic_video(path, args.seconds, args.fps, width, height, seed=i)
+            files.append(path)
+
+        analyzer = VideoAnalyzer(db_path=os.path.join(temp_dir, 'bench.db'))
+
+        # 旧路径：每种特征单独打开并完整解码一次文件
+        start = time.perf_counter()
+        for path in files:
+            analyzer._extract_phash_features(path)
+            analyzer._extract_color_histogram_features(path)
+        before = (time.perf_counter() - start) / len(files)
+
+        # 新路径：共享帧采样，每个文件只解码一次
+        start = time.perf_counter()
+        for path in files:
+            analyzer._extract_video_features(path)
+        after = (time.perf_counter() - start) / len(files)
+
+    print(f"文件数: {args.files}, 每个 {args.seconds}s @ {args.fps}fps, {width}x{height}")
+    print(f"{'路径':<24}{'每文件耗时(秒)':>16}")
+    print(f"{'per-extractor decode':<24}{before:>16.3f}")
+    print(f"{'shared frame sampler':<24}{after:>16.3f}")
+    print(f"加速比: {before / after:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+基准测试：命令行和库模块的启动耗时
+
+每项都在新的 Python 进程中运行并取多次的中位数：导入各模块(减去空解释器的启动时间)、
+video_audio_sync.py --help，以及在小型合成特征库上创建 VideoComposer 并完成一次
+select_videos 的小型合成任务。另外用 -X importtime 列出导入 video_audio_sync 时
+自身耗时最多的模块。
+
+用法:
+    python benchmarks/bench_import_time.py --repeat 5
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+SRC_DIR = str(Path(__file__).resolve().parent.parent / 'src')
+MODULES = ('frame_sampler', 'video_analyzer', 'video_composer', 'video_audio_sync')
+
+COMPOSE_CODE = '''
+import sys
+from video_composer import VideoComposer
+composer = VideoComposer(db_path=sys.argv[1])
+segments = composer.select_videos(audio_duration=30.0, min_segment_duration=1.0, max_segment_duration=5.0)
+assert segments
+'''
+
+
+def _run(args: List[str], cwd: str) -> float:
+    """在新进程中运行，返回耗时(秒)"""
+    env = dict(os.environ, PYTHONPATH=SRC_DIR)
+    start = time.perf_counter()
+    subprocess.run(args, cwd=cwd, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def _median(args: List[str], cwd: str, repeat: int) -> float:
+    return statistics.median(_run(args, cwd) for _ in range(repeat))
+
+
+def measure_startup(repeat: int = 5) -> Dict[str, float]:
+    """
+    测量启动耗时
+
+    Returns:
+        名称 -> 秒：'python' (空解释器)、'import.<模块>' (已减去空解释器)、'help' 和 'compose_small'
+    """
+    from video_analyzer import VideoAnalyzer
+    from bench_feature_index import populate_database
+
+    results = {}
+    # 在空目录中运行，同时确认没有写出日志文件等副作用
+    with tempfile.TemporaryDirectory() as cwd:
+        baseline = _median([sys.executable, '-c', 'pass'], cwd, repeat)
+        results['python'] = baseline
+        for module in MODULES:
+            results[f'import.{module}'] = _median([sys.executable, '-c', f'import {module}'], cwd, repeat) - baseline
+        results['help'] = _median([sys.executable, os.path.join(SRC_DIR, 'video_audio_sync.py'), '--help'],
+                                  cwd, repeat)
+
+        db_path = os.path.join(cwd, 'small.db')
+        VideoAnalyzer(db_path=db_path).db.close()
+        populate_database(db_path, 200, 10)
+        results['compose_small'] = _median([sys.executable, '-c', COMPOSE_CODE, db_path], cwd, repeat)
+        os.remove(db_path)
+        for name in os.listdir(cwd):
+            if not name.startswith('small.db'):
+                print(f"警告: 启动时写出了文件 {name}")
+    return results
+
+
+def slowest_imports(module: str, top: int = 10) -> List[Tuple[str, int]]:
+    """用 -X importtime 找出导入 module 时自身耗时最多的模块，返回 (模块, 微秒)"""
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            env=dict(os.environ, PYTHONPATH=SRC_DIR), capture_output=True, text=True).stderr
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        entries.append((name.strip(), int(self_us)))
+    return sorted(entries, key=lambda entry: -entry[1])[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup and import time benchmark")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement (median is reported)")
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to list")
+    args = parser.parse_args()
+
+    results = measure_startup(args.repeat)
+    print(f"空解释器启动: {results.pop('python') * 1000:.0f}毫秒")
+    for name, seconds in results.items():
+        print(f"{name:<28} {seconds * 1000:>8.0f}毫秒")
+
+    print(f"\n导入 video_audio_sync 时自身耗时最多的 {args.top} 个模块:")
+    for name, microseconds in slowest_imports('video_audio_sync', args.top):
+        print(f"{name:<40} {microseconds / 1000:>8.1f}毫秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+基准测试：在合成元数据库上比较 ORDER BY RANDOM() 与 LibrarySampler 随机抽取视频的耗时
+
+ORDER BY RANDOM() 每次都要读出并排序全部匹配行；LibrarySampler 按 rowid 范围随机抽取，
+耗时只随抽取的行数增长。另外检查抽样是否均匀：多次抽取后按 ID 分段统计次数的卡方统计量。
+
+用法:
+    python benchmarks/bench_random_sampling.py --videos 1000000 --count 200 --repeat 5
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+import statistics
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from video_analyzer import VideoAnalyzer, _candidate_filter
+from bench_candidate_query import populate_metadata
+
+# (名称, _candidate_filter 参数)
+FILTERS = (
+    ('all', {}),
+    ('min_1.5s', {'min_duration': 1.5}),
+    ('portrait_5_15s', {'aspect_range': (0.0, 0.99), 'min_duration': 5.0, 'max_duration': 15.0}),
+    ('hd_hevc', {'min_height': 1080, 'codec': 'hevc'}),
+)
+
+
+def order_by_random(db_path: str, count: int, where: str, params) -> list:
+    """旧的方式：ORDER BY RANDOM() LIMIT count"""
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute(f"SELECT id, file_path, duration, resolution FROM video_metadata WHERE {where} "
+                        f"ORDER BY RANDOM() LIMIT ?", [*params, count]).fetchall()
+    conn.close()
+    return rows
+
+
+def _median_ms(func, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def uniformity(analyzer: VideoAnalyzer, videos: int, draws: int, bins: int = 100) -> float:
+    """抽取 draws 次单个视频，按 ID 分成 bins 段统计次数，返回卡方统计量 / 自由度 (均匀时约为 1)"""
+    where, params = _candidate_filter()
+    counts = np.zeros(bins)
+    for _ in range(draws):
+        (video_id,), = analyzer.sampler.sample(1, where, params, ('id',))
+        counts[(video_id - 1) * bins // videos] += 1
+    expected = draws / bins
+    return float(((counts - expected) ** 2 / expected).sum()) / (bins - 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Random sampling benchmark")
+    parser.add_argument("--videos", type=int, default=1000000, help="Number of synthetic metadata rows")
+    parser.add_argument("--count", type=int, default=200, help="Videos drawn per call")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement (median is reported)")
+    parser.add_argument("--uniformity-draws", type=int, default=20000,
+                        help="Single-row draws for the uniformity check (0 to skip)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_path = os.path.join(temp_dir, 'sampling.db')
+        analyzer = VideoAnalyzer(db_path=db_path)
+        start = time.perf_counter()
+        populate_metadata(db_path, args.videos)
+        conn = sqlite3.connect(db_path)
+        # 使用次数随机分布，供 inverse_usage 加权
+        conn.execute("UPDATE video_metadata SET use_count = abs(random()) % 5")
+        conn.commit()
+        conn.close()
+        # 与扫描后一样更新查询规划统计
+        analyzer._update_query_statistics()
+        print(f"写入 {args.videos} 行元数据，耗时 {time.perf_counter() - start:.1f}秒")
+
+        print(f"{'筛选':<16} {'ORDER BY RANDOM()':>18} {'uniform':>10} {'duration':>10} {'inverse_usage':>14}")
+        for name, filters in FILTERS:
+            where, params = _candidate_filter(**filters)
+            fields = ('id', 'file_path', 'duration', 'resolution')
+            baseline_ms = _median_ms(lambda: order_by_random(db_path, args.count, where, params), args.repeat)
+            sampled = [_median_ms(lambda: analyzer.sampler.sample(args.count, where, params, fields, weighting),
+                                  args.repeat)
+                       for weighting in ('uniform', 'duration', 'inverse_usage')]
+            print(f"{name:<16} {baseline_ms:>16.1f}毫秒 " + " ".join(f"{ms:>8.1f}毫秒" for ms in sampled))
+
+        if args.uniformity_draws:
+            ratio = uniformity(analyzer, args.videos, args.uniformity_draws)
+            print(f"均匀性: 抽取 {args.uniformity_draws} 次，按 ID 分 100 段，卡方/自由度 = {ratio:.2f} (均匀时约为 1)")
+        analyzer.db.close()
+
+
+if __name__ == "__main__":
+    main()
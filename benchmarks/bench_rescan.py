@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+基准测试：测量没有任何变化的视频库重新扫描的耗时
+
+生成指定数量的空视频文件，并按其大小和修改时间写入"已分析"的数据库记录，然后分别计时
+目录遍历 (rglob / os.scandir / 复用目录缓存)、规划 (逐文件 SELECT / 批量比对) 和完整的
+scan_video_library (增量扫描 / rescan=True)。
+
+用法:
+    python benchmarks/bench_rescan.py --files 100000
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from video_analyzer import VideoAnalyzer, SUPPORTED_VIDEO_FORMATS
+
+
+def populate_library(video_dir: str, analyzer: VideoAnalyzer, files: int, per_directory: int = 1000):
+    """创建空视频文件，并写入与文件状态一致的数据库记录"""
+    now = datetime.now().isoformat()
+    rows = []
+    for i in range(files):
+        subdir = os.path.join(video_dir, f"dir_{i // per_directory:04d}")
+        if i % per_directory == 0:
+            os.makedirs(subdir)
+        path = os.path.join(subdir, f"clip_{i:06d}.mp4")
+        with open(path, 'wb'):
+            pass
+        stat = os.stat(path)
+        rows.append((path, 1.0, "1920x1080", stat.st_size,
+                     datetime.fromtimestamp(stat.st_mtime).isoformat(),
+                     analyzer.current_feature_version, now))
+
+    # 目录修改时间设为过去，使其可以写入目录缓存
+    past = time.time() - 60
+    for entry in os.scandir(video_dir):
+        os.utime(entry.path, (past, past))
+    os.utime(video_dir, (past, past))
+
+    with analyzer.db.transaction() as cursor:
+        cursor.executemany('''
+        INSERT INTO video_metadata
+        (file_path, duration, resolution, file_size, last_modified, feature_version, analyzed_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="No-change rescan benchmark")
+    parser.add_argument("--files", type=int, default=100000, help="Number of files in the library")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        video_dir = os.path.join(temp_dir, 'videos')
+        analyzer = VideoAnalyzer(db_path=os.path.join(temp_dir, 'bench.db'))
+
+        start = time.perf_counter()
+        populate_library(video_dir, analyzer, args.files)
+        print(f"生成 {args.files} 个文件及数据库记录，耗时 {time.perf_counter() - start:.1f}秒")
+
+        walk_times = {}
+        start = time.perf_counter()
+        rglob_files = [path for path in Path(video_dir).rglob('*')
+                       if path.is_file() and path.suffix.lower() in SUPPORTED_VIDEO_FORMATS]
+        walk_times['rglob'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        video_files = analyzer._find_video_files(Path(video_dir), reuse_listings=False)
+        walk_times['scandir'] = time.perf_counter() - start
+        assert len(video_files) == len(rglob_files)
+
+        start = time.perf_counter()
+        analyzer._find_video_files(Path(video_dir))
+        walk_times['scandir+目录缓存'] = time.perf_counter() - start
+
+        # 旧的规划方式：每个文件一次 SELECT
+        cursor = analyzer.db.connection().cursor()
+        start = time.perf_counter()
+        for file_path, _ in video_files:
+            analyzer._plan_video_file(cursor, Path(file_path))
+        per_file_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        plans, up_to_date, _, missing = analyzer._plan_library(Path(video_dir), video_files)
+        bulk_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        analyzer.scan_video_library(video_dir)
+        scan_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        count = analyzer.scan_video_library(video_dir, rescan=True)
+        rescan_time = time.perf_counter() - start
+        analyzer.db.close()
+
+    for name, elapsed in walk_times.items():
+        print(f"遍历目录 ({name}): {elapsed:.2f}秒")
+    print(f"逐文件 SELECT 规划: {per_file_time:.2f}秒")
+    print(f"批量比对规划: {bulk_time:.2f}秒 (需要分析 {len(plans)} 个，最新 {up_to_date} 个，已删除 {len(missing)} 个)")
+    print(f"增量扫描 (复用目录缓存): {scan_time:.2f}秒")
+    print(f"完整重新扫描 (rescan=True): {rescan_time:.2f}秒，计为成功 {count} 个")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+基准测试套件：在确定性的合成数据上测量扫描、相似度查询、选片和合成的性能，并与基线比较
+
+- scan: 用 synthetic_corpus 生成的 lavfi 视频库，计时 scan_video_library 的吞吐量
+  (文件/秒、帧/秒、MB/秒) 和各阶段耗时的中位数，--workers 大于 1 时另计时并行扫描，
+  另计时只读取元数据的第一阶段 (features=False)
+- similarity: 在 1k/10k/100k 个视频的合成特征库上，计时加载特征索引、find_similar_videos
+  的查询延迟 (p50/p90) 和 get_random_dissimilar_videos
+- compose: 在扫描得到的库上计时 select_videos 和 compose_video 端到端(未安装 moviepy 时跳过)
+- startup: 新进程中导入各模块、video_audio_sync.py --help 和小型选片任务的耗时 (见 bench_import_time)
+
+结果写入 JSON；与基线文件比较时，每个指标按其方向(越低越好或越高越好)变差超过容差即
+标记为回归。基线中记录了运行参数，参数不同的结果不可直接比较。
+
+用法:
+    python benchmarks/bench_suite.py --output bench_results.json
+    python benchmarks/bench_suite.py --save-baseline
+    python benchmarks/bench_suite.py --only similarity --rows 1000 10000 --fail-on-regression
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from video_analyzer import VideoAnalyzer
+from video_composer import VideoComposer
+from bench_feature_index import populate_database
+from synthetic_corpus import build_corpus, make_audio, ffmpeg_available
+from bench_import_time import measure_startup
+
+DEFAULT_BASELINE = str(Path(__file__).resolve().parent / 'baseline.json')
+SUITES = ('scan', 'similarity', 'compose', 'startup')
+# 影响结果可比性的参数；各库大小的指标名称不同，rows 不影响可比性
+CONFIG_KEYS = ('videos', 'seconds', 'workers', 'frames', 'queries', 'select_count', 'compose_seconds')
+
+
+def metric(value: float, unit: str, better: str = 'lower') -> Dict[str, Any]:
+    """一个指标: 数值、单位和方向 ('lower' 或 'higher' 越好)"""
+    return {'value': float(value), 'unit': unit, 'better': better}
+
+
+def bench_scan(work_dir: str, args) -> Tuple[Dict[str, Dict[str, Any]], str]:
+    """生成合成视频库并计时扫描，返回 (指标, 扫描得到的数据库路径)"""
+    corpus_dir = os.path.join(work_dir, 'corpus')
+    start = time.perf_counter()
+    build_corpus(corpus_dir, args.videos, args.seconds, seed=0)
+    print(f"生成 {args.videos} 个合成视频，耗时 {time.perf_counter() - start:.1f}秒")
+
+    results = {}
+    db_path = os.path.join(work_dir, 'scan.db')
+    analyzer = VideoAnalyzer(db_path=db_path)
+    start = time.perf_counter()
+    count = analyzer.scan_video_library(corpus_dir)
+    elapsed = time.perf_counter() - start
+    stats = analyzer.stats()
+    counters = stats['counters']
+    results['scan.seconds'] = metric(elapsed, 's')
+    results['scan.files_per_second'] = metric(count / elapsed, 'files/s', 'higher')
+    results['scan.frames_per_second'] = metric(counters.get('frames', 0) / elapsed, 'frames/s', 'higher')
+    results['scan.mb_per_second'] = metric(counters.get('input_bytes', 0) / 1e6 / elapsed, 'MB/s', 'higher')
+    for stage, entry in stats['stages'].items():
+        results[f'scan.stage.{stage}.p50'] = metric(entry['p50'] * 1000, 'ms')
+    analyzer.db.close()
+
+    if args.workers > 1:
+        parallel = VideoAnalyzer(db_path=os.path.join(work_dir, 'scan_parallel.db'))
+        start = time.perf_counter()
+        parallel.scan_video_library(corpus_dir, workers=args.workers)
+        elapsed = time.perf_counter() - start
+        results['scan.parallel.seconds'] = metric(elapsed, 's')
+        results['scan.parallel.files_per_second'] = metric(count / elapsed, 'files/s', 'higher')
+        parallel.db.close()
+
+    # 两阶段扫描的第一阶段：只用 ffprobe 读取元数据，之后即可选片
+    quick = VideoAnalyzer(db_path=os.path.join(work_dir, 'scan_metadata.db'))
+    start = time.perf_counter()
+    quick.scan_video_library(corpus_dir, features=False)
+    elapsed = time.perf_counter() - start
+    results['scan.metadata_phase.seconds'] = metric(elapsed, 's')
+    results['scan.metadata_phase.files_per_second'] = metric(count / elapsed, 'files/s', 'higher')
+    quick.db.close()
+
+    # 增量扫描：没有任何变化时只比对文件状态
+    analyzer = VideoAnalyzer(db_path=db_path)
+    start = time.perf_counter()
+    analyzer.scan_video_library(corpus_dir)
+    results['scan.unchanged.seconds'] = metric(time.perf_counter() - start, 's')
+    analyzer.db.close()
+    return results, db_path
+
+
+def bench_similarity(work_dir: str, rows: int, args) -> Dict[str, Dict[str, Any]]:
+    """在 rows 个视频的合成特征库上计时相似度查询和选片"""
+    db_path = os.path.join(work_dir, f'similarity_{rows}.db')
+    VideoAnalyzer(db_path=db_path).db.close()
+    start = time.perf_counter()
+    populate_database(db_path, rows, args.frames)
+    print(f"生成 {rows} 个视频的特征，耗时 {time.perf_counter() - start:.1f}秒")
+
+    prefix = f'similarity.{rows // 1000}k' if rows % 1000 == 0 else f'similarity.{rows}'
+    results = {}
+    analyzer = VideoAnalyzer(db_path=db_path)
+    # 测量计算本身，不使用持久化的相似度缓存
+    analyzer.use_similarity_cache = False
+    start = time.perf_counter()
+    analyzer.get_feature_index()
+    results[f'{prefix}.index_load'] = metric(time.perf_counter() - start, 's')
+
+    rng = np.random.default_rng(1)
+    # 第一次查询会建立 LSH 等派生结构，不计入延迟
+    analyzer.find_similar_videos(1, 0.8)
+    timings = []
+    for video_id in rng.integers(1, rows + 1, size=args.queries):
+        start = time.perf_counter()
+        analyzer.find_similar_videos(int(video_id), 0.8)
+        timings.append(time.perf_counter() - start)
+    timings = np.array(timings) * 1000
+    results[f'{prefix}.find_similar.p50'] = metric(np.percentile(timings, 50), 'ms')
+    results[f'{prefix}.find_similar.p90'] = metric(np.percentile(timings, 90), 'ms')
+
+    select_timings = []
+    for _ in range(3):
+        start = time.perf_counter()
+        analyzer.get_random_dissimilar_videos(args.select_count, 0.5)
+        select_timings.append(time.perf_counter() - start)
+    results[f'{prefix}.random_dissimilar'] = metric(np.median(select_timings) * 1000, 'ms')
+    analyzer.db.close()
+    os.remove(db_path)
+    return results
+
+
+def bench_compose(work_dir: str, db_path: str, args) -> Dict[str, Dict[str, Any]]:
+    """在扫描得到的库上计时选片和端到端合成"""
+    results = {}
+    audio_path = make_audio(os.path.join(work_dir, 'audio.mp3'), args.compose_seconds)
+    composer = VideoComposer(db_path=db_path)
+    start = time.perf_counter()
+    segments = composer.select_videos(audio_duration=args.compose_seconds, min_segment_duration=1.0,
+                                      max_segment_duration=2.0)
+    results['compose.select_videos'] = metric((time.perf_counter() - start) * 1000, 'ms')
+
+    start = time.perf_counter()
+    try:
+        composer.compose_video(segments, audio_path, os.path.join(work_dir, 'output.mp4'),
+                               target_resolution=(640, 360))
+    except ImportError as e:
+        print(f"跳过 compose_video: {e}")
+    else:
+        results['compose.compose_video'] = metric(time.perf_counter() - start, 's')
+    composer.analyzer.db.close()
+    return results
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+            tolerance: float) -> List[Tuple[str, float, float, float, bool]]:
+    """
+    与基线逐项比较
+
+    Returns:
+        列表 (指标, 基线值, 当前值, 变化比例, 是否回归)，只包含两边都有的指标
+    """
+    rows = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None or base['value'] == 0:
+            continue
+        change = (current['value'] - base['value']) / base['value']
+        worse = change if current['better'] == 'lower' else -change
+        rows.append((name, base['value'], current['value'], change, worse > tolerance))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic-corpus benchmark suite")
+    parser.add_argument("--only", nargs='+', choices=SUITES, default=list(SUITES), help="Suites to run")
+    parser.add_argument("--videos", type=int, default=12, help="Synthetic videos in the scanned library")
+    parser.add_argument("--seconds", type=float, default=5.0, help="Duration of each synthetic video")
+    parser.add_argument("--workers", type=int, default=2, help="Worker processes of the parallel scan (1 skips it)")
+    parser.add_argument("--rows", type=int, nargs='+', default=[1000, 10000, 100000],
+                        help="Library sizes of the similarity suite")
+    parser.add_argument("--frames", type=int, default=10, help="Average sampled frames per synthetic feature row")
+    parser.add_argument("--queries", type=int, default=20, help="Timed find_similar_videos queries per size")
+    parser.add_argument("--select-count", type=int, default=100,
+                        help="Videos requested from get_random_dissimilar_videos")
+    parser.add_argument("--compose-seconds", type=float, default=10.0, help="Duration of the composed video")
+    parser.add_argument("--output", default=None, help="Write the results to this JSON file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON file to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Relative change in the worse direction reported as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 on regressions")
+    parser.add_argument("--verbose", action="store_true", help="Keep the analyzer's INFO logging")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    if ('scan' in args.only or 'compose' in args.only) and not ffmpeg_available():
+        parser.error("the scan and compose suites need ffmpeg and ffprobe")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        scan_db = None
+        if 'scan' in args.only or 'compose' in args.only:
+            scan_results, scan_db = bench_scan(work_dir, args)
+            if 'scan' in args.only:
+                results.update(scan_results)
+        if 'similarity' in args.only:
+            for rows in args.rows:
+                results.update(bench_similarity(work_dir, rows, args))
+        if 'compose' in args.only:
+            results.update(bench_compose(work_dir, scan_db, args))
+        if 'startup' in args.only:
+            startup = measure_startup()
+            startup.pop('python')
+            results.update({f'startup.{name}': metric(seconds * 1000, 'ms') for name, seconds in startup.items()})
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(),
+                    'processor': platform.processor() or platform.machine(), 'cpus': os.cpu_count()},
+        'config': {key: getattr(args, key) for key in CONFIG_KEYS + ('rows',)},
+        'results': results,
+    }
+
+    width = max(len(name) for name in results) if results else 0
+    for name, entry in results.items():
+        print(f"{name:<{width}}  {entry['value']:>12.3f} {entry['unit']}")
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if {key: baseline.get('config', {}).get(key) for key in CONFIG_KEYS} != \
+                {key: report['config'][key] for key in CONFIG_KEYS}:
+            print(f"警告: 基线的运行参数不同，结果仅供参考: {baseline.get('config')}")
+        print(f"\n与基线比较 ({args.baseline}，{baseline.get('created')}):")
+        for name, base, current, change, regressed in compare(results, baseline['results'], args.tolerance):
+            flag = '  <-- 回归' if regressed else ''
+            print(f"{name:<{width}}  {base:>12.3f} -> {current:>12.3f}  {change:+7.1%}{flag}")
+            if regressed:
+                regressions.append(name)
+        print(f"{len(regressions)} 个指标变差超过 {args.tolerance:.0%}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"结果已写入: {args.output}")
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"已保存基线: {args.baseline}")
+
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+用 ffmpeg lavfi 信号源生成确定性的合成视频库，供基准测试和测试使用
+
+每个视频的信号源 (testsrc、testsrc2、mandelbrot、noise、cellauto)、帧率、分辨率和
+编码器 (H.264/MP4、MPEG-4/AVI、MJPEG/MOV、VP8/MKV) 由序号和随机种子决定；每隔几个
+视频生成一个前一视频去掉开头并换用其他编码和分辨率的副本，使相似度查询有真实的
+近似重复。同样的参数总是生成同样的文件列表和内容。
+
+用法:
+    python benchmarks/synthetic_corpus.py --output test_data/videos --count 12 --seconds 5
+"""
+
+import os
+import shutil
+import argparse
+import subprocess
+from functools import lru_cache
+from typing import List
+
+import numpy as np
+
+SOURCES = ('testsrc', 'testsrc2', 'mandelbrot', 'noise', 'cellauto')
+FRAME_RATES = (24, 25, 30, 60)
+RESOLUTIONS = ((320, 240), (640, 360), (1280, 720), (360, 640))
+# (扩展名, 编码器, 编码参数)
+CODECS = (
+    ('mp4', 'libx264', ['-preset', 'veryfast', '-pix_fmt', 'yuv420p', '-threads', '1']),
+    ('avi', 'mpeg4', ['-q:v', '5']),
+    ('mov', 'mjpeg', ['-q:v', '5', '-pix_fmt', 'yuvj420p']),
+    ('mkv', 'libvpx', ['-b:v', '1M', '-deadline', 'good', '-cpu-used', '5', '-threads', '1']),
+)
+
+
+@lru_cache(maxsize=None)
+def available_encoders() -> frozenset:
+    """本机 ffmpeg 支持的编码器名称"""
+    output = subprocess.run(['ffmpeg', '-hide_banner', '-encoders'], capture_output=True, text=True).stdout
+    names = set()
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) >= 2 and len(parts[0]) == 6:
+            names.add(parts[1])
+    return frozenset(names)
+
+
+def ffmpeg_available() -> bool:
+    """ffmpeg 和 ffprobe 是否都在 PATH 中"""
+    return bool(shutil.which('ffmpeg') and shutil.which('ffprobe'))
+
+
+def _source_filter(source: str, width: int, height: int, fps: int, seconds: float, seed: int) -> str:
+    size = f"{width}x{height}"
+    if source == 'mandelbrot':
+        # 不同的起点得到不同的画面
+        start_x = -0.743643887037158704752191506114774 + (seed % 7) * 1e-3
+        return f"mandelbrot=size={size}:rate={fps}:start_x={start_x}"
+    if source == 'noise':
+        color = f"0x{seed * 2654435761 % 0xFFFFFF:06X}"
+        return (f"color=c={color}:size={size}:rate={fps}:duration={seconds},"
+                f"noise=alls=60:allf=t+u:all_seed={seed}")
+    if source == 'cellauto':
+        return f"cellauto=rule={(seed * 37) % 256}:size={size}:rate={fps}:seed={seed}"
+    return f"{source}=size={size}:rate={fps}:duration={seconds}"
+
+
+def _codec(index: int):
+    ext, encoder, args = CODECS[index % len(CODECS)]
+    if encoder not in available_encoders():
+        # 缺少的编码器退回到 ffmpeg 内置的 MPEG-4
+        return 'avi', 'mpeg4', ['-q:v', '5']
+    return ext, encoder, args
+
+
+def _run_ffmpeg(args: List[str], output: str):
+    # bitexact 去掉编码器版本、随机 UID 等，使输出文件逐字节可复现
+    subprocess.run(['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y'] + args +
+                   ['-fflags', '+bitexact', '-flags', '+bitexact', output], check=True)
+
+
+def build_corpus(directory: str, count: int, seconds: float = 5.0, seed: int = 0,
+                 duplicate_every: int = 4) -> List[str]:
+    """
+    生成 count 个合成视频
+
+    Args:
+        directory: 输出目录，不存在时创建
+        count: 视频个数
+        seconds: 每个视频的时长(秒)
+        seed: 随机种子
+        duplicate_every: 每隔该数目生成一个前一视频的转码副本，0 表示不生成
+
+    Returns:
+        生成的文件路径，按序号排列
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(count):
+        width, height = RESOLUTIONS[int(rng.integers(len(RESOLUTIONS)))]
+        fps = FRAME_RATES[int(rng.integers(len(FRAME_RATES)))]
+        ext, encoder, codec_args = _codec(int(rng.integers(len(CODECS))))
+        duplicate = duplicate_every and i % duplicate_every == duplicate_every - 1 and paths
+        source = 'copy' if duplicate else SOURCES[i % len(SOURCES)]
+        path = os.path.join(directory, f"clip_{i:04d}_{source}.{ext}")
+        if duplicate:
+            # 前一视频去掉开头 1 秒，换成其他分辨率和编码
+            _run_ffmpeg(['-ss', '1', '-i', paths[-1], '-vf', f"scale={width}:{height}",
+                         '-an', '-c:v', encoder] + codec_args, path)
+        else:
+            _run_ffmpeg(['-f', 'lavfi', '-i', _source_filter(source, width, height, fps, seconds, seed + i),
+                         '-t', str(seconds), '-an', '-c:v', encoder] + codec_args, path)
+        paths.append(path)
+    return paths
+
+
+def make_audio(path: str, seconds: float, frequency: int = 440) -> str:
+    """用 sine 信号源生成一段音频，扩展名决定编码格式(如 .mp3、.m4a)"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    _run_ffmpeg(['-f', 'lavfi', '-i', f"sine=frequency={frequency}:duration={seconds}"], path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a synthetic video library with ffmpeg lavfi sources")
+    parser.add_argument("--output", required=True, help="Output directory")
+    parser.add_argument("--count", type=int, default=12, help="Number of videos")
+    parser.add_argument("--seconds", type=float, default=5.0, help="Duration of each video")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--audio", default=None, help="Also write a sine tone audio file to this path")
+    args = parser.parse_args()
+
+    if not ffmpeg_available():
+        parser.error("ffmpeg and ffprobe are required")
+    paths = build_corpus(args.output, args.count, args.seconds, args.seed)
+    print(f"已生成 {len(paths)} 个视频: {args.output}")
+    if args.audio:
+        make_audio(args.audio, args.seconds * args.count)
+        print(f"已生成音频: {args.audio}")
+
+
+if __name__ == "__main__":
+    main()
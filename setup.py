@@ -7,7 +7,8 @@ from setuptools import setup
 
 APP = ['video_tools_gui.py']
 DATA_FILES = [
-    ('src', ['src/video-combiner.py', 'src/split-video.py', 'src/sort-videos-by-ratio.py']),
+    ('src', ['src/video-combiner.py', 'src/split-video.py', 'src/sort-videos-by-ratio.py',
+             'src/library_walker.py']),
     ('', ['requirements.txt', 'requirements_gui.txt', 'README.md'])
 ]
 OPTIONS = {
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+logger = logging.getLogger('database')
+
+# 页缓存大小，负数表示 KiB (64 MiB)
+DEFAULT_CACHE_SIZE = -64000
+
+# 其他连接持有写锁时的等待时间(秒)
+DEFAULT_BUSY_TIMEOUT = 30.0
+
+
+class Database:
+    """
+    Long-lived SQLite connections to one database file, one per thread.
+
+    Every connection is opened in WAL journal mode, so readers (the
+    composer, the GUI) are not blocked while a scan writes, with
+    synchronous=NORMAL and a larger page cache. Connections are reopened
+    after a fork, since a SQLite connection must not cross processes.
+    """
+
+    def __init__(self, db_path: str, cache_size: int = DEFAULT_CACHE_SIZE,
+                 synchronous: str = 'NORMAL', busy_timeout: float = DEFAULT_BUSY_TIMEOUT):
+        """
+        Initialize the Database.
+
+        Args:
+            db_path: Path to the SQLite database file
+            cache_size: PRAGMA cache_size (pages, or KiB when negative)
+            synchronous: PRAGMA synchronous (OFF, NORMAL, FULL)
+            busy_timeout: Seconds to wait for a lock held by another connection
+        """
+        self.db_path = db_path
+        self.cache_size = cache_size
+        self.synchronous = synchronous
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+
+    def connection(self) -> sqlite3.Connection:
+        """Get this thread's connection, opening it on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout)
+        journal_mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+        if journal_mode.lower() != 'wal':
+            # 内存数据库等不支持 WAL，继续使用默认日志模式
+            logger.debug(f"数据库不支持 WAL，日志模式: {journal_mode}")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute(f"PRAGMA cache_size={int(self.cache_size)}")
+
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        logger.debug(f"打开数据库连接: {self.db_path} (线程 {threading.current_thread().name})")
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Cursor]:
+        """
+        Run a block in a transaction on this thread's connection.
+
+        Commits when the block finishes and rolls back if it raises.
+        """
+        conn = self.connection()
+        cursor = conn.cursor()
+        try:
+            yield cursor
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def close(self):
+        """Close this thread's connection."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+        self._local.conn = None
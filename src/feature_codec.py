@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Self-describing binary format for stored feature arrays.
+
+An encoded feature is a fixed header followed by the payload:
+
+    magic       4s   b'\\x93VCF'
+    version     B    format version (1)
+    dtype       3s   numpy dtype string of the decoded array, e.g. b'<u8'
+    transform   B    how the values were transformed before compression
+    compression B    payload compression
+    ndim        B    number of dimensions, followed by ndim uint32 sizes
+    scale       f4   quantization scale ('uint8' transform only)
+    length      I    payload length in bytes
+
+Transforms:
+    raw     values stored as they are
+    delta   integer sequences XOR-ed with the previous element, so runs of
+            similar frame hashes become mostly zero bits
+    uint8   floats quantized to 0..255 of [0, scale]
+    float16 floats stored in half precision
+
+Blobs written before the codec existed (feature version v1.0) are the raw
+array bytes with no header; decode_feature() falls back to reading them
+with the dtype given by the caller.
+"""
+
+import math
+import zlib
+import struct
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger('feature_codec')
+
+MAGIC = b'\x93VCF'
+FORMAT_VERSION = 1
+
+TRANSFORMS = ('raw', 'delta', 'uint8', 'float16')
+COMPRESSIONS = ('none', 'zlib', 'lz4')
+
+_PREFIX_SIZE = struct.calcsize('<4sB3sBBB')
+# ndim -> 完整头部 (魔数, 版本, dtype, 变换, 压缩, ndim, 各维大小, scale, 数据长度)
+_HEADERS = {ndim: struct.Struct('<4sB3sBBB' + 'I' * ndim + 'fI') for ndim in range(1, 9)}
+
+# 允许出现在头部中的解码后数据类型
+_DTYPES = {np.dtype(name).str.encode('ascii'): np.dtype(name)
+           for name in ('<u8', '<i8', '<u4', '<i4', '<f4', '<f8', '<f2', '|u1')}
+
+
+def _import_lz4():
+    """Lazy import of lz4.frame; None when it is not installed."""
+    try:
+        import lz4.frame
+        return lz4.frame
+    except ImportError:
+        return None
+
+
+def lz4_available() -> bool:
+    """Whether the lz4 compression is available."""
+    return _import_lz4() is not None
+
+
+def _compress(payload: bytes, compression: str, level: int) -> bytes:
+    if compression == 'zlib':
+        return zlib.compress(payload, level)
+    if compression == 'lz4':
+        return _import_lz4().compress(payload)
+    return payload
+
+
+def _decompress(payload: bytes, compression: str) -> bytes:
+    if compression == 'zlib':
+        return zlib.decompress(payload)
+    if compression == 'lz4':
+        lz4_frame = _import_lz4()
+        if lz4_frame is None:
+            raise ImportError("Feature data is lz4-compressed but lz4 is not installed: pip install lz4")
+        return lz4_frame.decompress(payload)
+    return payload
+
+
+def encode_feature(feature: np.ndarray, transform: str = 'raw', compression: str = 'zlib',
+                   level: int = 6) -> bytes:
+    """
+    Encode a feature array with a self-describing header.
+
+    Args:
+        feature: Feature array
+        transform: One of TRANSFORMS; 'delta' needs an integer array, 'uint8'
+            and 'float16' a float array
+        compression: One of COMPRESSIONS; 'lz4' falls back to 'zlib' when
+            lz4 is not installed, and data that does not shrink is stored
+            uncompressed
+        level: zlib compression level
+
+    Returns:
+        Encoded bytes
+    """
+    if transform not in TRANSFORMS:
+        raise ValueError(f"Unknown feature transform: {transform}")
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown feature compression: {compression}")
+    if compression == 'lz4' and not lz4_available():
+        logger.warning("未安装 lz4，改用 zlib 压缩特征")
+        compression = 'zlib'
+
+    feature = np.ascontiguousarray(feature)
+    dtype = feature.dtype.newbyteorder('<') if feature.dtype.byteorder == '>' else feature.dtype
+    feature = feature.astype(dtype, copy=False)
+    if dtype.str.encode('ascii') not in _DTYPES:
+        raise ValueError(f"Unsupported feature dtype: {dtype}")
+
+    scale = 0.0
+    if transform == 'delta':
+        if dtype.kind not in 'iu':
+            raise ValueError("delta transform needs an integer feature")
+        flat = feature.reshape(-1)
+        values = flat.copy()
+        values[1:] ^= flat[:-1]
+    elif transform == 'uint8':
+        if dtype.kind != 'f':
+            raise ValueError("uint8 transform needs a float feature")
+        scale = float(feature.max()) if feature.size else 0.0
+        if scale > 0:
+            values = np.rint(np.clip(feature / scale, 0.0, 1.0) * 255).astype(np.uint8)
+        else:
+            values = np.zeros(feature.shape, dtype=np.uint8)
+    elif transform == 'float16':
+        if dtype.kind != 'f':
+            raise ValueError("float16 transform needs a float feature")
+        values = feature.astype('<f2')
+    else:
+        values = feature
+
+    if feature.ndim not in _HEADERS:
+        raise ValueError(f"Unsupported feature dimensions: {feature.ndim}")
+    payload = values.tobytes()
+    if compression != 'none':
+        compressed = _compress(payload, compression, level)
+        # 很短的数据(如几帧的哈希)压缩后反而变大，此时不压缩，读取时也省去解压
+        if len(compressed) < len(payload):
+            payload = compressed
+        else:
+            compression = 'none'
+    header = _HEADERS[feature.ndim].pack(MAGIC, FORMAT_VERSION, dtype.str.encode('ascii'),
+                                         TRANSFORMS.index(transform), COMPRESSIONS.index(compression),
+                                         feature.ndim, *feature.shape, scale, len(payload))
+    return header + payload
+
+
+def _parse_header(data: bytes) -> Optional[Tuple[np.dtype, str, str, Tuple[int, ...], float, int]]:
+    """
+    Parse and validate the header of an encoded feature.
+
+    Returns:
+        Tuple (dtype, transform, compression, shape, scale, payload_offset),
+        or None when data does not start with a valid header
+    """
+    if data[:4] != MAGIC or len(data) <= _PREFIX_SIZE:
+        return None
+    header = _HEADERS.get(data[_PREFIX_SIZE - 1])
+    if header is None or len(data) < header.size:
+        return None
+    _, version, dtype, transform, compression, _, *shape, scale, length = header.unpack_from(data)
+    if version != FORMAT_VERSION or dtype not in _DTYPES or transform >= len(TRANSFORMS) \
+            or compression >= len(COMPRESSIONS) or len(data) != header.size + length:
+        return None
+    return _DTYPES[dtype], TRANSFORMS[transform], COMPRESSIONS[compression], tuple(shape), scale, header.size
+
+
+def is_encoded(data: bytes) -> bool:
+    """Whether data carries a valid codec header (as opposed to a legacy raw blob)."""
+    return _parse_header(data) is not None
+
+
+def decode_feature(data: bytes, legacy_dtype) -> np.ndarray:
+    """
+    Decode a stored feature.
+
+    Args:
+        data: Bytes written by encode_feature(), or a legacy headerless blob
+        legacy_dtype: dtype of legacy blobs
+
+    Returns:
+        Feature array (read-only view for raw, uncompressed data)
+    """
+    header = _parse_header(data)
+    if header is None:
+        return np.frombuffer(data, dtype=legacy_dtype)
+    dtype, transform, compression, shape, scale, offset = header
+
+    payload = _decompress(memoryview(data)[offset:], compression)
+    if transform == 'delta':
+        values = np.frombuffer(payload, dtype=dtype)
+        # XOR 差分的逆变换是前缀异或
+        feature = np.bitwise_xor.accumulate(values) if len(values) else values.copy()
+    elif transform == 'uint8':
+        feature = np.multiply(np.frombuffer(payload, dtype=np.uint8), dtype.type(scale) / dtype.type(255.0),
+                              dtype=dtype)
+    elif transform == 'float16':
+        feature = np.frombuffer(payload, dtype='<f2').astype(dtype)
+    else:
+        feature = np.frombuffer(payload, dtype=dtype)
+    return feature.reshape(shape)
+
+
+def decode_features(blobs: Sequence[bytes], legacy_dtype) -> List[np.ndarray]:
+    """
+    Decode many stored features at once.
+
+    Gives the same arrays as calling decode_feature() on each blob, but only
+    the header parsing and decompression run per blob: payloads with the same
+    dtype and transform are joined and converted with single numpy calls,
+    then split back into per-blob views.
+
+    Args:
+        blobs: Encoded or legacy feature blobs
+        legacy_dtype: dtype of legacy blobs
+
+    Returns:
+        Feature arrays in the order of blobs
+    """
+    legacy_dtype = np.dtype(legacy_dtype)
+    # (dtype, transform) -> [(blob 下标, 形状, 元素个数, scale, 解压后的数据)]
+    groups: Dict[Tuple[np.dtype, str], List[Tuple[int, Tuple[int, ...], int, float, bytes]]] = {}
+    for i, data in enumerate(blobs):
+        header = _parse_header(data)
+        if header is None:
+            size = len(data) // legacy_dtype.itemsize
+            groups.setdefault((legacy_dtype, 'raw'), []).append((i, (size,), size, 0.0, data))
+            continue
+        dtype, transform, compression, shape, scale, offset = header
+        payload = _decompress(memoryview(data)[offset:], compression)
+        groups.setdefault((dtype, transform), []).append((i, shape, math.prod(shape), scale, payload))
+
+    decoded: List[Optional[np.ndarray]] = [None] * len(blobs)
+    for (dtype, transform), members in groups.items():
+        sizes = np.array([member[2] for member in members], dtype=np.int64)
+        joined = b''.join([member[4] for member in members])
+        if transform == 'delta':
+            values = np.bitwise_xor.accumulate(np.frombuffer(joined, dtype=dtype)) if joined \
+                else np.empty(0, dtype=dtype)
+            # 整体前缀异或后，每段再异或上一段末尾的累计值，即得到各段独立的前缀异或
+            ends = np.cumsum(sizes)
+            starts = ends - sizes
+            carry = np.zeros(len(members), dtype=dtype)
+            has_carry = (starts > 0) & (sizes > 0)
+            carry[has_carry] = values[starts[has_carry] - 1]
+            values = values ^ np.repeat(carry, sizes)
+        elif transform == 'uint8':
+            scales = np.array([member[3] for member in members], dtype=dtype) / dtype.type(255.0)
+            values = np.multiply(np.frombuffer(joined, dtype=np.uint8), np.repeat(scales, sizes), dtype=dtype)
+        elif transform == 'float16':
+            values = np.frombuffer(joined, dtype='<f2').astype(dtype)
+        else:
+            values = np.frombuffer(joined, dtype=dtype)
+
+        start = 0
+        for i, shape, size, _, _ in members:
+            decoded[i] = values[start:start + size].reshape(shape)
+            start += size
+    return decoded
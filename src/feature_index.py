@@ -0,0 +1,515 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+import sqlite3
+import logging
+from itertools import combinations
+from typing import List, Dict, Tuple, Optional, Sequence
+
+import numpy as np
+
+from similarity import (phash_similarity_many, histogram_similarity_many, histogram_similarity_frame_major,
+                        normalize_histograms, pack_frame_major, video_similarity_aligned,
+                        COLORHIST_BINS, PHASH_WEIGHT, COLORHIST_WEIGHT)
+
+from feature_snapshot import write_snapshot, load_snapshot
+
+logger = logging.getLogger('feature_index')
+
+# SQLite 默认最多 999 个绑定参数，按块查询
+_SQL_CHUNK_SIZE = 900
+
+# 不相似视频选择时每批比较的候选视频数
+_SELECT_CHUNK_SIZE = 512
+
+
+def _expand_ranges(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Concatenate the index ranges [starts[i], starts[i] + lengths[i])."""
+    offsets = np.cumsum(lengths) - lengths
+    return np.arange(int(lengths.sum()), dtype=np.int64) + np.repeat(starts - offsets, lengths)
+
+
+class FeatureIndex:
+    """
+    In-process index of every video's phash and colorhist features.
+
+    All features are loaded once into contiguous arrays (packed phash values
+    plus per-video offsets, frame-major colorhist rows) so one-vs-all
+    similarity queries run as a few vectorized kernel calls instead of 2N
+    database reads. The index reloads
+    only the videos whose analyzed_at changed when refresh() sees the
+    feature generation of the database change.
+
+    The arrays can be saved to a snapshot directory and memory-mapped back
+    (see feature_snapshot), so a new process starts with the whole index
+    without reading a single feature row.
+
+    For large libraries the index also supports multi-index hashing: every
+    64-bit frame hash is split into `bands` keys, and only videos that share
+    a (nearly) equal key with the query are fully scored.
+    """
+
+    def __init__(self, analyzer, bands: int = 4):
+        """
+        Initialize the FeatureIndex.
+
+        Args:
+            analyzer: VideoAnalyzer providing the database connection and feature decoding
+            bands: Number of keys each frame hash is split into for LSH lookups
+                (must divide 64)
+        """
+        if bands <= 0 or 64 % bands != 0:
+            raise ValueError(f"bands must divide 64, got {bands}")
+        self.analyzer = analyzer
+        self.db = analyzer.db
+        self.bands = bands
+        self.band_bits = 64 // bands
+
+        # 已索引视频的 analyzed_at，用于找出变化的视频
+        self._analyzed_at: Dict[int, str] = {}
+        # 索引对应的数据库特征代数，None 表示尚未加载
+        self.generation: Optional[int] = None
+
+        # 紧凑数组 (按视频 ID 排序)，由 _pack() 或快照设置
+        self.video_ids = np.empty(0, dtype=np.int64)
+        self.phash_values = np.empty(0, dtype=np.uint64)
+        self.phash_offsets = np.zeros(1, dtype=np.int64)
+        self.colorhist_rows = np.empty((0, COLORHIST_BINS), dtype=np.float32)
+        self.colorhist_offsets = np.zeros(1, dtype=np.int64)
+        self.colorhist_order = np.empty(0, dtype=np.int64)
+        self.colorhist_lengths = np.empty(0, dtype=np.int64)
+        self._colorhist_ranks = np.empty(0, dtype=np.int64)
+        self._positions: Dict[int, int] = {}
+
+        # 每段一个 (排序后的段值, 对应视频位置) 表，首次 LSH 查询时构建
+        self._band_tables: Optional[List[Tuple[np.ndarray, np.ndarray]]] = None
+
+    def __len__(self) -> int:
+        return len(self.video_ids)
+
+    def __contains__(self, video_id: int) -> bool:
+        return video_id in self._positions
+
+    def refresh(self) -> bool:
+        """
+        Bring the index up to date with the database.
+
+        A single-row read of the feature generation runs first; only when it
+        differs are the changed videos reloaded and removed videos dropped.
+        On the first refresh a snapshot of the current generation, if the
+        analyzer has a snapshot directory, is memory-mapped instead; an older
+        snapshot is mapped and then brought up to date incrementally.
+
+        Returns:
+            True if the index changed
+        """
+        cursor = self.db.connection().cursor()
+        generation = self.analyzer.get_feature_generation(cursor)
+        if generation == self.generation:
+            return False
+
+        start_time = time.time()
+        if self.generation is None and self.analyzer.snapshot_dir and self.load_snapshot(self.analyzer.snapshot_dir):
+            if self.generation == generation:
+                return True
+
+        # 只有特征已就绪 (features_ready = 1) 的视频有特征可加载，待提取的视频不参与
+        cursor.execute("SELECT id, analyzed_at FROM video_metadata WHERE features_ready = 1")
+        current = {vid: analyzed_at or '' for vid, analyzed_at in cursor.fetchall()}
+
+        removed = [vid for vid in self._analyzed_at if vid not in current]
+        changed = [vid for vid, analyzed_at in current.items() if self._analyzed_at.get(vid) != analyzed_at]
+
+        # 未变化的视频直接从现有的紧凑数组中取出
+        keep = np.array([pos for vid, pos in self._positions.items()
+                         if vid in current and self._analyzed_at[vid] == current[vid]], dtype=np.int64)
+        kept_ids = self.video_ids[keep]
+        kept_phash, kept_phash_offsets, kept_hist, kept_hist_offsets = self._gather(keep)
+
+        new_ids: List[int] = []
+        new_phash: List[np.ndarray] = []
+        new_hist: List[np.ndarray] = []
+        if changed:
+            # 首次加载时直接读取整张表，避免大量 IN 查询
+            if len(changed) == len(current):
+                loaded = self._load_features(cursor, None)
+            else:
+                loaded = self._load_features(cursor, changed)
+            for vid in changed:
+                features = loaded.get(vid, {})
+                if 'phash' in features and 'colorhist' in features:
+                    new_ids.append(vid)
+                    new_phash.append(features['phash'])
+                    new_hist.append(features['colorhist'].reshape(-1, COLORHIST_BINS))
+
+        # 新加载的直方图一次性归一化，与保留的视频拼接后重新打包
+        new_hist_rows = normalize_histograms(np.concatenate(new_hist)) if new_hist \
+            else np.empty((0, COLORHIST_BINS), dtype=np.float32)
+        phash_values = np.concatenate([kept_phash] + new_phash).astype(np.uint64, copy=False)
+        phash_offsets = np.concatenate([kept_phash_offsets, kept_phash_offsets[-1] +
+                                        np.cumsum([len(phash) for phash in new_phash], dtype=np.int64)])
+        hist_rows = np.concatenate([kept_hist, new_hist_rows])
+        hist_offsets = np.concatenate([kept_hist_offsets, kept_hist_offsets[-1] +
+                                       np.cumsum([len(hist) for hist in new_hist], dtype=np.int64)])
+
+        self._analyzed_at = {vid: current[vid] for vid in kept_ids.tolist() + new_ids}
+        self._pack(np.concatenate([kept_ids, np.array(new_ids, dtype=np.int64)]),
+                   phash_values, phash_offsets, hist_rows, hist_offsets)
+        self.generation = generation
+        logger.info(f"特征索引已更新: 新增或变更 {len(changed)} 个，删除 {len(removed)} 个，"
+                    f"共 {len(self)} 个视频，耗时 {time.time() - start_time:.2f}秒")
+        return True
+
+    def _load_features(self, cursor: sqlite3.Cursor,
+                       video_ids: Optional[List[int]]) -> Dict[int, Dict[str, np.ndarray]]:
+        """Read and decode the phash and colorhist features of the given videos (all if None)."""
+        query = '''
+        SELECT video_id, feature_type, feature_data
+        FROM video_features
+        WHERE feature_type IN ('phash', 'colorhist')
+        '''
+        if video_ids is None:
+            cursor.execute(query)
+            rows = cursor.fetchall()
+        else:
+            rows = []
+            for start in range(0, len(video_ids), _SQL_CHUNK_SIZE):
+                chunk = video_ids[start:start + _SQL_CHUNK_SIZE]
+                placeholders = ','.join('?' * len(chunk))
+                cursor.execute(query + f" AND video_id IN ({placeholders})", chunk)
+                rows.extend(cursor.fetchall())
+
+        by_type: Dict[str, Tuple[List[int], List[bytes]]] = {}
+        for video_id, feature_type, feature_data in rows:
+            ids, blobs = by_type.setdefault(feature_type, ([], []))
+            ids.append(video_id)
+            blobs.append(feature_data)
+
+        loaded: Dict[int, Dict[str, np.ndarray]] = {}
+        for feature_type, (ids, blobs) in by_type.items():
+            for video_id, feature in zip(ids, self.analyzer._decode_features(feature_type, blobs)):
+                loaded.setdefault(video_id, {})[feature_type] = feature
+        return loaded
+
+    def _pack(self, ids: np.ndarray, phash_values: np.ndarray, phash_offsets: np.ndarray,
+              colorhist_rows: np.ndarray, colorhist_offsets: np.ndarray):
+        """Rebuild the contiguous arrays, ordered by video ID, from video-major packed features."""
+        order = np.argsort(ids, kind='stable')
+        phash_lengths = np.diff(phash_offsets)[order]
+        colorhist_lengths = np.diff(colorhist_offsets)[order]
+        phash_values = phash_values[_expand_ranges(phash_offsets[:-1][order], phash_lengths)]
+        colorhist_rows = colorhist_rows[_expand_ranges(colorhist_offsets[:-1][order], colorhist_lengths)]
+        self.video_ids = ids[order]
+        self.phash_values = phash_values
+        self.phash_offsets = np.zeros(len(order) + 1, dtype=np.int64)
+        np.cumsum(phash_lengths, out=self.phash_offsets[1:])
+        colorhist_offsets = np.zeros(len(order) + 1, dtype=np.int64)
+        np.cumsum(colorhist_lengths, out=colorhist_offsets[1:])
+
+        # colorhist 按帧主序存放，查询时每个参考帧只读取一段连续内存
+        self.colorhist_rows, self.colorhist_offsets, self.colorhist_order = pack_frame_major(
+            colorhist_rows, colorhist_offsets)
+        self._set_derived()
+
+    def _set_derived(self):
+        """Recompute the lookup tables derived from the packed arrays."""
+        self._positions = {vid: pos for pos, vid in enumerate(self.video_ids.tolist())}
+        # 帧主序中排名第 i 的视频拥有第 k 帧当且仅当 i < 第 k 块的视频数，块大小不增
+        frame_counts = np.diff(self.colorhist_offsets)
+        sorted_lengths = np.searchsorted(-frame_counts, -np.arange(len(self.video_ids)), side='left')
+        self.colorhist_lengths = np.empty(len(self.video_ids), dtype=np.int64)
+        self.colorhist_lengths[self.colorhist_order] = sorted_lengths
+        # 视频位置 -> 在帧主序中的排名，第 k 帧位于 colorhist_offsets[k] + 排名
+        self._colorhist_ranks = np.empty(len(self.video_ids), dtype=np.int64)
+        self._colorhist_ranks[self.colorhist_order] = np.arange(len(self.video_ids))
+        self._band_tables = None
+
+    def save_snapshot(self, directory: str):
+        """Write the packed arrays as a snapshot of the current generation."""
+        if self.generation is None:
+            raise ValueError("The feature index has not been loaded")
+        write_snapshot(directory, self.generation, self.analyzer.db_path, {
+            'video_ids': self.video_ids,
+            'analyzed_at': np.array([self._analyzed_at[vid] for vid in self.video_ids.tolist()], dtype=str),
+            'phash_values': self.phash_values,
+            'phash_offsets': self.phash_offsets,
+            'colorhist_rows': self.colorhist_rows,
+            'colorhist_offsets': self.colorhist_offsets,
+            'colorhist_order': self.colorhist_order,
+        })
+
+    def load_snapshot(self, directory: str) -> bool:
+        """
+        Memory-map the packed arrays from a snapshot.
+
+        Returns:
+            True if a snapshot of this database was loaded
+        """
+        snapshot = load_snapshot(directory, self.analyzer.db_path)
+        if snapshot is None:
+            return False
+        generation, arrays = snapshot
+        start_time = time.time()
+        self.video_ids = arrays['video_ids']
+        self.phash_values = arrays['phash_values']
+        self.phash_offsets = arrays['phash_offsets']
+        self.colorhist_rows = arrays['colorhist_rows']
+        self.colorhist_offsets = arrays['colorhist_offsets']
+        self.colorhist_order = arrays['colorhist_order']
+        self._analyzed_at = dict(zip(self.video_ids.tolist(), arrays['analyzed_at'].tolist()))
+        self._set_derived()
+        self.generation = generation
+        logger.info(f"已映射特征快照: {len(self)} 个视频 (第 {generation} 代)，"
+                    f"耗时 {time.time() - start_time:.2f}秒")
+        return True
+
+    def position(self, video_id: int) -> int:
+        """Position of a video in self.video_ids and the packed arrays."""
+        if video_id not in self._positions:
+            raise ValueError(f"Video ID {video_id} is not in the feature index")
+        return self._positions[video_id]
+
+    def get_features(self, video_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the indexed features of a video.
+
+        Returns:
+            Tuple (phash, normalized colorhist rows)
+        """
+        phash, _, colorhist, _ = self._gather(np.array([self.position(video_id)], dtype=np.int64))
+        return phash, colorhist
+
+    def similarities(self, ref_phash: np.ndarray, ref_colorhist: np.ndarray) -> np.ndarray:
+        """
+        Combined similarity of the given features against every indexed video.
+
+        Returns:
+            float64 array aligned with self.video_ids
+        """
+        phash_sims = phash_similarity_many(ref_phash, self.phash_values, self.phash_offsets)
+        colorhist_sims = histogram_similarity_frame_major(ref_colorhist, self.colorhist_rows,
+                                                          self.colorhist_offsets, self.colorhist_order)
+        return PHASH_WEIGHT * phash_sims + COLORHIST_WEIGHT * colorhist_sims
+
+    def _build_band_tables(self):
+        """Build the sorted key table of every band from the packed hashes."""
+        start_time = time.time()
+        mask = np.uint64((1 << self.band_bits) - 1)
+        frame_videos = np.repeat(np.arange(len(self.video_ids)), np.diff(self.phash_offsets))
+        tables = []
+        for band in range(self.bands):
+            keys = (self.phash_values >> np.uint64(band * self.band_bits)) & mask
+            order = np.argsort(keys, kind='stable')
+            tables.append((keys[order], frame_videos[order]))
+        self._band_tables = tables
+        logger.debug(f"LSH 段表构建完成: {self.bands} 段 x {self.band_bits} 位，"
+                     f"{len(self.phash_values)} 帧，耗时 {time.time() - start_time:.2f}秒")
+
+    def _probe_masks(self, probe_radius: int) -> np.ndarray:
+        """XOR masks of every key within probe_radius bits of a band key."""
+        masks = [0]
+        for radius in range(1, probe_radius + 1):
+            for bits in combinations(range(self.band_bits), radius):
+                masks.append(sum(1 << bit for bit in bits))
+        return np.array(masks, dtype=np.uint64)
+
+    def candidates(self, ref_phash: np.ndarray, probe_radius: int = 1,
+                   min_band_hits: int = 1) -> np.ndarray:
+        """
+        Positions of the videos sharing enough band keys with the given hashes.
+
+        Two frames whose hashes differ in fewer than bands * (probe_radius + 1)
+        bits always share a probed key, so a larger probe_radius raises recall
+        at the cost of more candidates to score.
+
+        Args:
+            ref_phash: Hash sequence of the reference video
+            probe_radius: Also probe keys within this Hamming distance of each band key
+            min_band_hits: Minimum number of (frame, band) hits for a video to be a candidate
+
+        Returns:
+            Sorted positions into self.video_ids
+        """
+        if self._band_tables is None:
+            self._build_band_tables()
+
+        ref_phash = np.asarray(ref_phash, dtype=np.uint64)
+        mask = np.uint64((1 << self.band_bits) - 1)
+        masks = self._probe_masks(probe_radius)
+
+        hits = []
+        for band, (keys, videos) in enumerate(self._band_tables):
+            ref_keys = (ref_phash >> np.uint64(band * self.band_bits)) & mask
+            probes = np.unique((ref_keys[:, None] ^ masks[None, :]).ravel())
+            left = np.searchsorted(keys, probes, side='left')
+            right = np.searchsorted(keys, probes, side='right')
+
+            hits.append(videos[_expand_ranges(left, right - left)])
+
+        counts = np.bincount(np.concatenate(hits), minlength=len(self.video_ids))
+        return np.flatnonzero(counts >= min_band_hits)
+
+    def score_positions(self, ref_phash: np.ndarray, ref_colorhist: np.ndarray,
+                         positions: np.ndarray) -> np.ndarray:
+        """Combined similarity of the given features against a subset of the indexed videos."""
+        if len(positions) == 0:
+            return np.empty(0, dtype=np.float64)
+        phash_values, phash_offsets, colorhist_rows, colorhist_offsets = self._gather(positions)
+        phash_sims = phash_similarity_many(ref_phash, phash_values, phash_offsets)
+        colorhist_sims = histogram_similarity_many(ref_colorhist, colorhist_rows, colorhist_offsets,
+                                                   normalized=True)
+        return PHASH_WEIGHT * phash_sims + COLORHIST_WEIGHT * colorhist_sims
+
+    def find_similar(self, video_id: int, threshold: float, probe_radius: Optional[int] = None,
+                     min_band_hits: int = 1) -> List[Tuple[int, float]]:
+        """
+        Find indexed videos whose combined similarity to video_id is at least threshold.
+
+        Args:
+            video_id: ID of the reference video
+            threshold: Similarity threshold (0-1)
+            probe_radius: Score only the LSH candidates found with this probe
+                radius; None compares against every indexed video
+            min_band_hits: Minimum band hits of an LSH candidate
+
+        Returns:
+            List of tuples (video_id, similarity_score), highest first
+        """
+        ref_phash, ref_colorhist = self.get_features(video_id)
+        if probe_radius is None:
+            positions = np.arange(len(self.video_ids))
+            scores = self.similarities(ref_phash, ref_colorhist)
+        else:
+            positions = self.candidates(ref_phash, probe_radius, min_band_hits)
+            logger.debug(f"LSH 候选视频 {len(positions)} 个 (共 {len(self)} 个)")
+            scores = self.score_positions(ref_phash, ref_colorhist, positions)
+
+        keep = (scores >= threshold) & (self.video_ids[positions] != video_id)
+        positions, scores = positions[keep], scores[keep]
+        order = np.argsort(-scores, kind='stable')
+        return [(int(self.video_ids[positions[i]]), float(scores[i])) for i in order]
+
+    def find_similar_aligned(self, video_id: int, threshold: float, probe_radius: Optional[int] = None,
+                             min_band_hits: int = 1, min_overlap: float = 0.5) -> List[Tuple[int, float, int]]:
+        """
+        Like find_similar, but each video is scored at its best temporal
+        offset (see similarity.video_similarity_aligned), so trimmed copies
+        of the reference video are found too.
+
+        LSH candidates come from per-frame band keys regardless of frame
+        position, so they include shifted copies as well.
+
+        Returns:
+            List of tuples (video_id, similarity_score, offset), highest first;
+            frame j of the video lines up with frame j + offset of video_id
+        """
+        ref_phash, ref_colorhist = self.get_features(video_id)
+        if probe_radius is None:
+            positions = np.arange(len(self.video_ids))
+        else:
+            positions = self.candidates(ref_phash, probe_radius, min_band_hits)
+        positions = positions[self.video_ids[positions] != video_id]
+
+        phash_values, phash_offsets, colorhist_rows, colorhist_offsets = self._gather(positions)
+        results = []
+        for slot, pos in enumerate(positions.tolist()):
+            score, offset = video_similarity_aligned(
+                ref_phash, ref_colorhist,
+                phash_values[phash_offsets[slot]:phash_offsets[slot + 1]],
+                colorhist_rows[colorhist_offsets[slot]:colorhist_offsets[slot + 1]],
+                min_overlap=min_overlap)
+            if score >= threshold:
+                results.append((int(self.video_ids[pos]), score, offset))
+        results.sort(key=lambda result: -result[1])
+        return results
+
+    def _gather(self, positions: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Pack the features of a subset of the indexed videos.
+
+        Returns:
+            Tuple (phash_values, phash_offsets, colorhist_rows, colorhist_offsets)
+            in the layout taken by the *_similarity_many kernels
+        """
+        phash_lengths = np.diff(self.phash_offsets)[positions]
+        phash_offsets = np.zeros(len(positions) + 1, dtype=np.int64)
+        np.cumsum(phash_lengths, out=phash_offsets[1:])
+        phash_values = self.phash_values[_expand_ranges(self.phash_offsets[:-1][positions], phash_lengths)]
+
+        colorhist_lengths = self.colorhist_lengths[positions]
+        colorhist_offsets = np.zeros(len(positions) + 1, dtype=np.int64)
+        np.cumsum(colorhist_lengths, out=colorhist_offsets[1:])
+        frames = _expand_ranges(np.zeros(len(positions), dtype=np.int64), colorhist_lengths)
+        ranks = np.repeat(self._colorhist_ranks[positions], colorhist_lengths)
+        colorhist_rows = self.colorhist_rows[self.colorhist_offsets[frames] + ranks]
+        return phash_values, phash_offsets, colorhist_rows, colorhist_offsets
+
+    def select_dissimilar(self, video_ids: Sequence[int], count: int, threshold: float,
+                          picked: Sequence[int] = ()) -> List[int]:
+        """
+        Greedily pick videos in the given order, skipping every video whose
+        similarity to an already picked one is at least threshold.
+
+        Candidates are taken in chunks; each picked video is scored against a
+        whole chunk in one kernel call, so the cost grows with the number of
+        picks times the number of chunks rather than with every pair. Videos
+        without indexed features are never similar to anything.
+
+        Args:
+            video_ids: Candidate video IDs in the order they should be tried
+            count: Number of videos to pick
+            threshold: Similarity at which two videos count as similar
+            picked: Videos picked before (e.g. from earlier candidates);
+                candidates similar to them are skipped as well
+
+        Returns:
+            Newly picked video IDs, in pick order
+        """
+        selected: List[int] = []
+        selected_features: List[Tuple[np.ndarray, np.ndarray]] = []
+        picked_positions = [pos for pos in (self._positions.get(video_id) for video_id in picked)
+                            if pos is not None]
+        if picked_positions:
+            phash_values, phash_offsets, colorhist_rows, colorhist_offsets = self._gather(
+                np.array(picked_positions, dtype=np.int64))
+            for slot in range(len(picked_positions)):
+                selected_features.append((phash_values[phash_offsets[slot]:phash_offsets[slot + 1]],
+                                          colorhist_rows[colorhist_offsets[slot]:colorhist_offsets[slot + 1]]))
+
+        for start in range(0, len(video_ids), _SELECT_CHUNK_SIZE):
+            if len(selected) >= count:
+                break
+            chunk = video_ids[start:start + _SELECT_CHUNK_SIZE]
+            positions = [self._positions.get(video_id) for video_id in chunk]
+            phash_values, phash_offsets, colorhist_rows, colorhist_offsets = self._gather(
+                np.array([pos for pos in positions if pos is not None], dtype=np.int64))
+
+            def dissimilar_to(phash: np.ndarray, colorhist: np.ndarray) -> np.ndarray:
+                scores = (PHASH_WEIGHT * phash_similarity_many(phash, phash_values, phash_offsets) +
+                          COLORHIST_WEIGHT * histogram_similarity_many(
+                              colorhist, colorhist_rows, colorhist_offsets, normalized=True))
+                return scores < threshold
+
+            # 先排除与已选视频相似的候选，再按顺序逐个选择并排除与新选视频相似的候选
+            alive = np.ones(len(phash_offsets) - 1, dtype=bool)
+            for phash, colorhist in selected_features:
+                alive &= dissimilar_to(phash, colorhist)
+
+            slot = 0
+            for video_id, pos in zip(chunk, positions):
+                if len(selected) >= count:
+                    break
+                if pos is None:
+                    selected.append(video_id)
+                    continue
+                slot += 1
+                if not alive[slot - 1]:
+                    continue
+                phash = phash_values[phash_offsets[slot - 1]:phash_offsets[slot]]
+                colorhist = colorhist_rows[colorhist_offsets[slot - 1]:colorhist_offsets[slot]]
+                selected.append(video_id)
+                selected_features.append((phash, colorhist))
+                alive &= dissimilar_to(phash, colorhist)
+
+        return selected
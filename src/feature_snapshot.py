@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import shutil
+import logging
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger('feature_snapshot')
+
+SNAPSHOT_FORMAT = 1
+# 指向当前快照的清单文件，写完所有数组后原子替换
+MANIFEST_NAME = 'snapshot.json'
+
+
+def read_manifest(directory: str) -> Optional[Dict]:
+    """The manifest of the current snapshot in directory, or None if there is none."""
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('format') != SNAPSHOT_FORMAT:
+        return None
+    return manifest
+
+
+def write_snapshot(directory: str, generation: int, db_path: str, arrays: Dict[str, np.ndarray]):
+    """
+    Write a new snapshot generation and make it the current one.
+
+    The arrays go to a fresh subdirectory named after the generation; the
+    manifest is replaced only after they are complete, so readers always
+    see one consistent set. Older generations are removed afterwards;
+    processes that still have them memory-mapped keep their pages until
+    they close them (removal is skipped where the OS refuses it).
+
+    Args:
+        directory: Snapshot directory, created if needed
+        generation: Database feature generation the arrays were built from
+        db_path: Database the snapshot belongs to
+        arrays: Named arrays; each is saved as <name>.npy
+    """
+    os.makedirs(directory, exist_ok=True)
+    name = f"gen-{generation:012d}"
+    target = os.path.join(directory, name)
+    staging = target + f".tmp-{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    for array_name, array in arrays.items():
+        np.save(os.path.join(staging, f"{array_name}.npy"), np.ascontiguousarray(array), allow_pickle=False)
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(staging, target)
+
+    manifest = {
+        'format': SNAPSHOT_FORMAT,
+        'generation': generation,
+        'db_path': str(Path(db_path).absolute()),
+        'path': name,
+        'arrays': sorted(arrays),
+    }
+    manifest_tmp = os.path.join(directory, f"{MANIFEST_NAME}.tmp-{os.getpid()}")
+    with open(manifest_tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(manifest_tmp, os.path.join(directory, MANIFEST_NAME))
+
+    for entry in os.scandir(directory):
+        if entry.is_dir() and entry.name.startswith('gen-') and entry.name != name and '.tmp-' not in entry.name:
+            shutil.rmtree(entry.path, ignore_errors=True)
+    logger.info(f"特征快照已写入: {target} (第 {generation} 代)")
+
+
+def load_snapshot(directory: str, db_path: str) -> Optional[Tuple[int, Dict[str, np.ndarray]]]:
+    """
+    Memory-map the current snapshot in directory.
+
+    The arrays are opened with np.load(mmap_mode='r'): nothing is read until
+    it is used, and processes mapping the same snapshot share the pages
+    through the OS page cache.
+
+    Args:
+        directory: Snapshot directory
+        db_path: Database the caller reads; snapshots of another database are ignored
+
+    Returns:
+        Tuple (generation, arrays by name), or None when there is no usable snapshot
+    """
+    manifest = read_manifest(directory)
+    if manifest is None:
+        return None
+    if manifest.get('db_path') != str(Path(db_path).absolute()):
+        logger.warning(f"特征快照属于其他数据库，忽略: {directory}")
+        return None
+    try:
+        arrays = {name: np.load(os.path.join(directory, manifest['path'], f"{name}.npy"),
+                                mmap_mode='r', allow_pickle=False)
+                  for name in manifest['arrays']}
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"读取特征快照失败: {e}")
+        return None
+    return manifest['generation'], arrays
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+import subprocess
+from typing import TYPE_CHECKING, Iterator, Tuple
+
+import numpy as np
+
+# cv2 和 ffmpeg 在解码时才导入，只使用本模块常量(如命令行参数)时不加载 OpenCV
+if TYPE_CHECKING:
+    import cv2
+
+logger = logging.getLogger('frame_sampler')
+
+# Supported sampling modes
+# - sequential: decode and convert every frame, keep one per interval (original behaviour)
+# - grab: grab() every frame but only retrieve() the sampled ones
+# - seek: seek to each sample position and decode only that frame
+# - keyframe: let ffmpeg decode keyframes only (skip_frame=nokey)
+SAMPLING_MODES = ('sequential', 'grab', 'seek', 'keyframe')
+
+# Modes that yield exactly the same frames as sequential decoding
+EXACT_SAMPLING_MODES = ('sequential', 'grab')
+
+# Supported decode backends
+# - opencv: cv2.VideoCapture, full resolution BGR frames
+# - ffmpeg: ffmpeg rawvideo pipe with fps/scale filters applied inside the decoder
+#   (the fps filter does the sampling, so sequential/grab/seek behave the same)
+DECODE_BACKENDS = ('opencv', 'ffmpeg')
+
+
+class FrameSampler:
+    """Decode a video file once and yield the frames used for feature extraction."""
+
+    def __init__(self, sample_rate: int = 1, mode: str = 'grab', backend: str = 'opencv',
+                 frame_size: Tuple[int, int] = (64, 64)):
+        """
+        Initialize the FrameSampler.
+
+        Args:
+            sample_rate: Sample one frame every N seconds
+            mode: Sampling mode, one of SAMPLING_MODES
+            backend: Decode backend, one of DECODE_BACKENDS
+            frame_size: Output (width, height) of the ffmpeg backend
+        """
+        if mode not in SAMPLING_MODES:
+            raise ValueError(f"Unknown sampling mode: {mode}")
+        if backend not in DECODE_BACKENDS:
+            raise ValueError(f"Unknown decode backend: {backend}")
+        self.sample_rate = sample_rate
+        self.mode = mode
+        self.backend = backend
+        self.frame_size = frame_size
+
+    def iter_frames(self, file_path: str) -> Iterator[np.ndarray]:
+        """
+        Yield sampled BGR frames from a video file.
+
+        Args:
+            file_path: Path to the video file
+
+        Yields:
+            One BGR frame per sample interval (one per keyframe in keyframe mode)
+        """
+        # ffmpeg 后端和关键帧模式都通过 ffmpeg 管道解码
+        if self.backend == 'ffmpeg' or self.mode == 'keyframe':
+            yield from self._iter_ffmpeg_pipe(file_path)
+            return
+
+        import cv2
+        cap = cv2.VideoCapture(file_path)
+        if not cap.isOpened():
+            raise ValueError(f"Could not open video file: {file_path}")
+
+        try:
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            # fps 读取失败(0)时退化为逐帧采样，避免除零
+            frame_interval = max(1, int(fps * self.sample_rate))
+            logger.debug(f"帧采样: 模式={self.mode}, fps={fps}, 采样间隔={frame_interval} 帧")
+
+            if self.mode == 'seek':
+                yield from self._iter_seek(cap, frame_interval)
+            else:
+                yield from self._iter_sequential(cap, frame_interval, use_grab=self.mode == 'grab')
+        finally:
+            cap.release()
+
+    def _iter_sequential(self, cap: 'cv2.VideoCapture', frame_interval: int,
+                         use_grab: bool) -> Iterator[np.ndarray]:
+        """Walk every frame, converting only the sampled ones when use_grab is set."""
+        frame_count = 0
+        while True:
+            if use_grab:
+                # grab() 只解码不做颜色转换，未采样的帧不调用 retrieve()
+                if not cap.grab():
+                    break
+                if frame_count % frame_interval == 0:
+                    ret, frame = cap.retrieve()
+                    if not ret:
+                        break
+                    yield frame
+            else:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                if frame_count % frame_interval == 0:
+                    yield frame
+
+            frame_count += 1
+
+    def _iter_seek(self, cap: 'cv2.VideoCapture', frame_interval: int) -> Iterator[np.ndarray]:
+        """Seek to each sample position and decode a single frame there."""
+        import cv2
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if total_frames <= 0:
+            # 帧数未知的容器无法定位，退回 grab 方式
+            logger.debug("无法获取总帧数，seek 模式退回逐帧 grab")
+            yield from self._iter_sequential(cap, frame_interval, use_grab=True)
+            return
+
+        for position in range(0, total_frames, frame_interval):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, position)
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame
+
+    def _iter_ffmpeg_pipe(self, file_path: str) -> Iterator[np.ndarray]:
+        """
+        Stream frames from an ffmpeg rawvideo pipe.
+
+        The fps and scale filters run inside ffmpeg, so only the sampled,
+        already downscaled frames are copied into Python. Every frame is read
+        into the same preallocated buffer; copy a frame if you need to keep it.
+        """
+        import ffmpeg
+
+        stream_kwargs = {}
+        if self.mode == 'keyframe':
+            stream_kwargs['skip_frame'] = 'nokey'
+        stream = ffmpeg.input(file_path, **stream_kwargs)
+
+        if self.mode != 'keyframe':
+            stream = stream.filter('fps', fps=f'1/{self.sample_rate}')
+
+        if self.backend == 'ffmpeg':
+            width, height = self.frame_size
+            stream = stream.filter('scale', width, height)
+        else:
+            width, height = self._probe_frame_size(file_path)
+
+        args = (
+            stream
+            .output('pipe:', format='rawvideo', pix_fmt='bgr24', vsync='vfr')
+            .global_args('-nostdin', '-loglevel', 'error')
+            .compile()
+        )
+        logger.debug(f"ffmpeg 解码管道: {' '.join(args)}")
+
+        buffer = np.empty((height, width, 3), dtype=np.uint8)
+        view = memoryview(buffer).cast('B')
+        frame_count = 0
+
+        # stderr 丢弃，避免管道写满导致 ffmpeg 阻塞
+        process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        try:
+            while self._read_exact(process.stdout, view):
+                frame_count += 1
+                yield buffer
+            returncode = process.wait()
+        finally:
+            process.stdout.close()
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+
+        if returncode != 0:
+            if frame_count == 0:
+                raise ValueError(f"Could not open video file: {file_path}")
+            # 解码中途失败，已输出的帧不完整，不能当作完整特征保存
+            raise ValueError(f"ffmpeg exited with code {returncode} after {frame_count} frames: {file_path}")
+
+    @staticmethod
+    def _read_exact(pipe, view: memoryview) -> bool:
+        """Fill view from pipe; return False at end of stream."""
+        filled = 0
+        size = len(view)
+        while filled < size:
+            n = pipe.readinto(view[filled:])
+            if not n:
+                return False
+            filled += n
+        return True
+
+    @staticmethod
+    def _probe_frame_size(file_path: str) -> Tuple[int, int]:
+        """
+        Return the (width, height) of the first video stream as ffmpeg outputs
+        it, i.e. swapped when rotation metadata turns the picture by 90 degrees
+        (ffmpeg autorotates by default, like cv2.VideoCapture).
+        """
+        import ffmpeg
+
+        try:
+            probe = ffmpeg.probe(file_path)
+        except ffmpeg.Error as e:
+            raise ValueError(f"Could not open video file: {file_path}") from e
+        video_stream = next((stream for stream in probe['streams']
+                             if stream['codec_type'] == 'video'), None)
+        if video_stream is None:
+            raise ValueError(f"No video stream found in {file_path}")
+        width, height = int(video_stream['width']), int(video_stream['height'])
+
+        # 旋转角度在新版 ffprobe 的显示矩阵附加数据中，旧版在 rotate 标签中
+        rotation = video_stream.get('tags', {}).get('rotate', 0)
+        for side_data in video_stream.get('side_data_list', []):
+            if 'rotation' in side_data:
+                rotation = side_data['rotation']
+        if int(float(rotation)) % 180 != 0:
+            logger.debug(f"视频旋转 {rotation} 度，交换宽高: {file_path}")
+            width, height = height, width
+        return width, height
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+from itertools import islice
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from database import Database
+
+logger = logging.getLogger('library_sampler')
+
+# 加权方式 -> (每行权重的 SQL 表达式, 非别名视频权重上界的查询)；上界查询走部分索引，不扫描全表
+WEIGHTINGS = {
+    'uniform': None,
+    'duration': ('duration', "SELECT MAX(duration) FROM video_metadata WHERE alias_of IS NULL"),
+    'inverse_usage': ('1.0 / (1 + use_count)',
+                      "SELECT 1.0 / (1 + MIN(use_count)) FROM video_metadata WHERE alias_of IS NULL"),
+}
+
+# 每轮随机抽取的 ID 数从 _FIRST_BATCH 起倍增到 _MAX_BATCH (SQLite 默认最多 999 个绑定参数)
+_FIRST_BATCH = 64
+_MAX_BATCH = 900
+# 累计抽取至少 _MIN_DRAWS 次后，一轮的接受率低于 _MIN_ACCEPT_RATE，或已返回的行超过估计匹配行数的
+# _MAX_SEEN_FRACTION 时，改为读出剩余的匹配行
+_MIN_DRAWS = 512
+_MIN_ACCEPT_RATE = 0.02
+_MAX_SEEN_FRACTION = 0.05
+# 因接受率过低而读出剩余匹配行时，前几批按 ID 查找字段，之后一次读出其余行的字段
+_EAGER_FETCH_AFTER = 4 * _MAX_BATCH
+
+
+class LibrarySampler:
+    """
+    Random rows of video_metadata without ORDER BY RANDOM().
+
+    Rows are drawn by uniform random IDs between MIN(id) and MAX(id), both
+    read from the ends of the rowid B-tree and looked up in batches of
+    point queries. A drawn ID that does not exist (a deleted row) or does
+    not match the filter is rejected, so every matching row is equally
+    likely however the IDs are spread. With a weighting, a drawn row is
+    also accepted only with probability weight / upper bound. Rows already
+    returned are rejected as well, which makes the sequence successive
+    sampling without replacement: each next row is drawn from the rest
+    with probability proportional to its weight.
+
+    When most draws are rejected (a selective filter, a heavy-tailed
+    weight) or a twentieth of the matching rows (estimated from the share
+    of draws that matched) have been returned, the IDs and weights of the
+    remaining matching rows are read through the filter's index instead
+    and ordered by Efraimidis-Spirakis keys (u ** (1 / weight)), which
+    continues the same distribution. Its cost grows with the number of
+    matching rows, so neither path reads the whole table for a small
+    sample, and a caller walking most of the matching rows gets their
+    fields in one sequential read.
+    """
+
+    def __init__(self, db: Database, rng: Optional[np.random.Generator] = None):
+        """
+        Initialize the LibrarySampler.
+
+        Args:
+            db: Database holding the video_metadata table
+            rng: Random generator, a fresh unseeded one by default
+        """
+        self.db = db
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+    def sample(self, count: int, where: str, params: Sequence[Any], fields: Sequence[str],
+               weighting: str = 'uniform') -> List[Tuple]:
+        """
+        Up to count distinct random rows matching a filter, in draw order.
+
+        Args:
+            count: Number of rows to draw
+            where: SQL condition on video_metadata, e.g. from _candidate_filter()
+            params: Parameters of the condition
+            fields: Columns of each returned row
+            weighting: One of WEIGHTINGS
+
+        Returns:
+            List of tuples with the requested fields
+        """
+        return list(islice(self.iter_rows(where, params, fields, weighting), count))
+
+    def iter_rows(self, where: str, params: Sequence[Any], fields: Sequence[str],
+                  weighting: str = 'uniform') -> Iterator[Tuple]:
+        """
+        Distinct random rows matching a filter, drawn lazily until every
+        matching row has been returned.
+
+        Rows whose weight is zero or NULL are only returned after all others,
+        in uniform random order.
+
+        Args:
+            where: SQL condition on video_metadata
+            params: Parameters of the condition
+            fields: Columns of each returned row
+            weighting: One of WEIGHTINGS
+
+        Yields:
+            Tuples with the requested fields
+        """
+        if weighting not in WEIGHTINGS:
+            raise ValueError(f"Unknown weighting: {weighting}")
+        cursor = self.db.connection().cursor()
+        # MIN 和 MAX 分开查询才会各自只读 rowid B 树的一端
+        low, high = cursor.execute("SELECT (SELECT MIN(id) FROM video_metadata), "
+                                   "(SELECT MAX(id) FROM video_metadata)").fetchone()
+        if low is None:
+            return
+
+        weight_expr, bound = '1.0', 1.0
+        if WEIGHTINGS[weighting] is not None:
+            weight_expr, bound_query = WEIGHTINGS[weighting]
+            bound = cursor.execute(bound_query).fetchone()[0]
+            if bound is None:
+                return
+
+        # NOT INDEXED：抽到的 ID 总是按 rowid 查找，不让规划器改走筛选条件的索引(如 codec = ?)扫描全部匹配行
+        select = f"SELECT id, {weight_expr}, {', '.join(fields)} FROM video_metadata NOT INDEXED"
+        seen = set()
+        draws = matched = 0
+        walking = False  # 已返回的行占估计匹配行数的比例超过 _MAX_SEEN_FRACTION
+        batch = _FIRST_BATCH
+        # 权重上界为 0 时拒绝抽样永远不会接受，直接读出全部匹配行
+        while bound > 0:
+            ids = self.rng.integers(low, high + 1, size=batch).tolist()
+            thresholds = (self.rng.random(batch) * bound).tolist()
+            placeholders = ','.join('?' * batch)
+            cursor.execute(f"{select} WHERE id IN ({placeholders}) AND {where}", [*ids, *params])
+            rows = {row[0]: row for row in cursor.fetchall()}
+            matched += sum(1 for video_id in ids if video_id in rows)
+
+            accepted = []
+            for video_id, threshold in zip(ids, thresholds):
+                row = rows.get(video_id)
+                if row is None or video_id in seen or row[1] is None or threshold >= row[1]:
+                    continue
+                seen.add(video_id)
+                accepted.append(row[2:])
+            yield from accepted
+
+            draws += batch
+            walking = len(seen) > _MAX_SEEN_FRACTION * matched / draws * (high - low + 1)
+            if draws >= _MIN_DRAWS and (walking or len(accepted) < _MIN_ACCEPT_RATE * batch):
+                break
+            batch = min(batch * 2, _MAX_BATCH)
+
+        logger.debug(f"改为读出剩余的匹配行 (已抽取 {draws} 次，得到 {len(seen)} 行)")
+        yield from self._iter_remaining(cursor, where, params, fields,
+                                        weight_expr if WEIGHTINGS[weighting] is not None else None, seen,
+                                        fetch_fields=walking)
+
+    def _iter_remaining(self, cursor, where: str, params: Sequence[Any], fields: Sequence[str],
+                        weight_expr: Optional[str], seen: set, fetch_fields: bool) -> Iterator[Tuple]:
+        """
+        Every matching row not in seen, in weighted (uniform when weight_expr
+        is None) random order.
+
+        With fetch_fields the fields of all remaining rows are read in the
+        same query, for a caller that is walking most of the matching rows;
+        otherwise only IDs and weights are read (the filter's index usually
+        covers them) and the fields are looked up by ID as rows are taken.
+        """
+        columns = f"id, {weight_expr or '1.0'}" + (f", {', '.join(fields)}" if fetch_fields else '')
+        cursor.execute(f"SELECT {columns} FROM video_metadata WHERE {where}", params)
+        candidates = [row for row in cursor.fetchall() if row[0] not in seen]
+        if weight_expr is None:
+            order = self.rng.permutation(len(candidates))
+        else:
+            weights = np.array([row[1] or 0.0 for row in candidates], dtype=np.float64)
+            # Efraimidis-Spirakis：按 log(u) / weight 从大到小排列；权重为 0 的键为 -inf，由第二个随机键打乱
+            with np.errstate(divide='ignore'):
+                keys = np.where(weights > 0, np.log(self.rng.random(len(weights))) / np.maximum(weights, 1e-300),
+                                -np.inf)
+            order = np.lexsort((self.rng.random(len(weights)), -keys))
+        if fetch_fields:
+            yield from (candidates[position][2:] for position in order.tolist())
+            return
+
+        ids = [candidates[position][0] for position in order.tolist()]
+        select = f"SELECT id, {', '.join(fields)} FROM video_metadata"
+        for start in range(0, len(ids), _MAX_BATCH):
+            if start >= _EAGER_FETCH_AFTER:
+                # 调用方取走的行越来越多，一次顺序读出其余行，比逐批按 ID 查找快
+                cursor.execute(f"{select} WHERE {where}", params)
+                chunk = ids[start:]
+            else:
+                chunk = ids[start:start + _MAX_BATCH]
+                cursor.execute(f"{select} WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+            rows = {row[0]: row[1:] for row in cursor.fetchall()}
+            # 读出 ID 之后被删除的行直接跳过
+            yield from (rows[video_id] for video_id in chunk if video_id in rows)
+            if start >= _EAGER_FETCH_AFTER:
+                return
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import sqlite3
+import logging
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger('library_walker')
+
+# 修改时间距今不足该秒数的目录不写入缓存：同一时间戳内可能还有未观察到的变化
+MTIME_SETTLE_SECONDS = 2.0
+
+
+class DirectoryCache:
+    """
+    Per-directory listings persisted in the directory_state table.
+
+    A directory's own mtime changes whenever an entry is added, removed or
+    renamed in it, so while it is unchanged its cached video file names and
+    subdirectory names can be reused without listing it again. Files
+    rewritten in place do not change the directory mtime, so the files of
+    a reused listing are still stat'ed one by one.
+    """
+
+    def __init__(self):
+        """Initialize an empty DirectoryCache; call load() before walking."""
+        # 目录路径 -> (mtime_ns, 视频文件名列表, 子目录名列表)
+        self._entries: Dict[str, Tuple[int, List[str], List[str]]] = {}
+        self._changed: Set[str] = set()
+        self._seen: Set[str] = set()
+
+    @staticmethod
+    def _subtree(root: str) -> Tuple[str, str, str]:
+        """Query parameters matching root and every path below it."""
+        prefix = root if root.endswith(os.sep) else root + os.sep
+        return root, prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+    def load(self, cursor: sqlite3.Cursor, root: str):
+        """Read the cached listings of root and all directories below it."""
+        cursor.execute('''
+        SELECT path, mtime_ns, files, subdirs
+        FROM directory_state
+        WHERE path = ? OR (path >= ? AND path < ?)
+        ''', self._subtree(root))
+        for path, mtime_ns, files, subdirs in cursor.fetchall():
+            self._entries[path] = (mtime_ns, json.loads(files), json.loads(subdirs))
+        logger.debug(f"加载 {len(self._entries)} 个目录的缓存列表")
+
+    def lookup(self, path: str, mtime_ns: int) -> Optional[Tuple[List[str], List[str]]]:
+        """Cached (files, subdirs) of a directory if its mtime is unchanged."""
+        self._seen.add(path)
+        entry = self._entries.get(path)
+        if entry is None or entry[0] != mtime_ns:
+            return None
+        return entry[1], entry[2]
+
+    def update(self, path: str, mtime_ns: int, files: List[str], subdirs: List[str]):
+        """Record a fresh listing of a directory."""
+        self._seen.add(path)
+        if time.time() - mtime_ns / 1e9 < MTIME_SETTLE_SECONDS:
+            # 目录刚被修改，下次扫描仍需重新列出
+            if self._entries.pop(path, None) is not None:
+                self._changed.add(path)
+            return
+        self._entries[path] = (mtime_ns, files, subdirs)
+        self._changed.add(path)
+
+    def save(self, cursor: sqlite3.Cursor, root: str):
+        """
+        Write the changed listings and drop directories under root that
+        were not reached by the last walk.
+
+        The caller owns the transaction and commits.
+        """
+        cursor.execute("SELECT path FROM directory_state WHERE path = ? OR (path >= ? AND path < ?)",
+                       self._subtree(root))
+        stale = [(path,) for (path,) in cursor.fetchall()
+                 if path not in self._seen or path not in self._entries]
+        cursor.executemany("DELETE FROM directory_state WHERE path = ?", stale)
+        cursor.executemany('''
+        INSERT OR REPLACE INTO directory_state (path, mtime_ns, files, subdirs)
+        VALUES (?, ?, ?, ?)
+        ''', [(path, self._entries[path][0], json.dumps(self._entries[path][1]),
+               json.dumps(self._entries[path][2]))
+              for path in self._changed if path in self._entries])
+        logger.debug(f"目录缓存: 更新 {len(self._changed)} 个，删除 {len(stale)} 个")
+        self._changed.clear()
+
+
+def walk_video_files(root: str, extensions: Iterable[str], cache: Optional[DirectoryCache] = None,
+                     reuse: bool = True) -> Iterator[Tuple[str, os.stat_result]]:
+    """
+    Recursively find files with the given extensions using os.scandir.
+
+    File stats come from the DirEntry objects, so each file costs at most one
+    stat call and none on platforms where scandir returns them; files of a
+    reused listing cost one stat call each. Symlinked directories are not
+    followed.
+
+    Args:
+        root: Directory to walk
+        extensions: Lower-case suffixes including the dot, e.g. {'.mp4'}
+        cache: Directory listings to reuse and refresh
+        reuse: Reuse the cached listings of unchanged directories; False
+            lists every directory but still refreshes the cache
+
+    Yields:
+        Tuples (path, stat)
+    """
+    extensions = {ext.lower() for ext in extensions}
+    stack = [os.fspath(root)]
+    listed = reused = 0
+
+    while stack:
+        path = stack.pop()
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError as e:
+            logger.warning(f"无法访问目录 {path}: {e}")
+            continue
+
+        cached = cache.lookup(path, mtime_ns) if cache is not None and reuse else None
+        if cached is not None:
+            reused += 1
+            files, subdirs = cached
+            for name in files:
+                file_path = os.path.join(path, name)
+                # 原地覆盖的文件不改变目录的修改时间，仍需逐个 stat
+                try:
+                    yield file_path, os.stat(file_path)
+                except FileNotFoundError:
+                    # 读取目录修改时间之后被删除
+                    continue
+                except OSError as e:
+                    logger.warning(f"无法读取 {file_path}: {e}")
+            stack.extend(os.path.join(path, name) for name in reversed(subdirs))
+            continue
+
+        listed += 1
+        files = []
+        subdirs = []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.name)
+                        elif os.path.splitext(entry.name)[1].lower() in extensions and entry.is_file():
+                            files.append(entry.name)
+                            yield entry.path, entry.stat()
+                    except OSError as e:
+                        logger.warning(f"无法读取 {entry.path}: {e}")
+        except OSError as e:
+            logger.warning(f"无法列出目录 {path}: {e}")
+            continue
+
+        if cache is not None:
+            cache.update(path, mtime_ns, files, subdirs)
+        stack.extend(os.path.join(path, name) for name in reversed(subdirs))
+
+    logger.debug(f"遍历完成: 列出 {listed} 个目录，复用 {reused} 个目录的缓存列表")
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from library_walker import DirectoryCache, walk_video_files
+from video_analyzer import SUPPORTED_VIDEO_FORMATS
+
+logger = logging.getLogger('library_watcher')
+
+
+def _import_watchdog():
+    """Lazy import of watchdog; None when it is not installed."""
+    try:
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+        return Observer, FileSystemEventHandler
+    except ImportError:
+        return None
+
+
+class LibraryWatcher:
+    """
+    Keep the video library database in sync with a directory as files change.
+
+    Filesystem events come from watchdog (inotify on Linux) when it is
+    installed, otherwise from polling the directory tree. Events only mark
+    paths as dirty; a background worker handles a path once no event has
+    arrived for `debounce` seconds, looking at what is on disk at that
+    moment: existing files go through VideoAnalyzer._process_video_file,
+    new directories are walked, and paths that no longer exist have their
+    rows purged. A move is therefore a delete of the old path plus a
+    create of the new one.
+    """
+
+    def __init__(self, analyzer, directory_path: str, debounce: float = 2.0,
+                 poll_interval: float = 5.0, use_polling: bool = False):
+        """
+        Initialize the LibraryWatcher.
+
+        Args:
+            analyzer: VideoAnalyzer that processes the files
+            directory_path: Library root to watch
+            debounce: Seconds without events before a path is processed
+            poll_interval: Seconds between directory polls when polling
+            use_polling: Poll even if watchdog is available
+        """
+        self.analyzer = analyzer
+        self.directory = str(Path(directory_path).absolute())
+        self.extensions = set(SUPPORTED_VIDEO_FORMATS)
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.use_polling = use_polling or _import_watchdog() is None
+
+        # 待处理的路径 -> 最近一次事件的时间
+        self._pending: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._observer = None
+
+        # 轮询模式的目录列表缓存和文件状态快照
+        self._poll_cache = DirectoryCache()
+        self._snapshot: Optional[Dict[str, Tuple[int, int]]] = None
+
+    def touch(self, path: str, is_directory: bool = False):
+        """Mark a path as changed; it is processed once it settles."""
+        if not is_directory and os.path.splitext(path)[1].lower() not in self.extensions:
+            return
+        with self._lock:
+            self._pending[path] = time.time()
+
+    def _on_event(self, event_type: str, src_path: str, dest_path: Optional[str], is_directory: bool):
+        """Translate a watchdog event into touched paths."""
+        if is_directory and event_type == 'modified':
+            # 目录内容变化会产生各自的文件事件
+            return
+        if event_type in ('opened', 'closed_no_write'):
+            return
+        self.touch(src_path, is_directory)
+        if dest_path:
+            self.touch(dest_path, is_directory)
+
+    def poll_once(self):
+        """
+        Walk the library and touch every file added, changed or removed since
+        the previous poll. The first poll only records the baseline.
+        """
+        previous = self._snapshot or {}
+        snapshot = {}
+        # 复用的目录列表中的文件同样带有 stat 结果，原地覆盖的文件也能发现
+        for path, file_stats in walk_video_files(self.directory, self.extensions, self._poll_cache):
+            snapshot[path] = (file_stats.st_size, file_stats.st_mtime_ns)
+
+        if self._snapshot is not None:
+            for path, state in snapshot.items():
+                if previous.get(path) != state:
+                    self.touch(path)
+            for path in previous.keys() - snapshot.keys():
+                self.touch(path)
+        self._snapshot = snapshot
+
+    def process_ready(self) -> int:
+        """
+        Handle every pending path whose last event is older than debounce.
+
+        Returns:
+            Number of paths handled
+        """
+        now = time.time()
+        with self._lock:
+            ready = [path for path, stamp in self._pending.items() if now - stamp >= self.debounce]
+            for path in ready:
+                del self._pending[path]
+
+        # 先处理仍存在的路径，移动后的文件可以按内容指纹接管原记录，而不是先被删除
+        ready.sort(key=lambda path: not os.path.exists(path))
+        for path in ready:
+            try:
+                self._handle(path)
+            except Exception as e:
+                logger.error(f"处理文件变化失败 {path}: {e}")
+        return len(ready)
+
+    def _handle(self, path: str):
+        """Bring the database in line with what is on disk at path."""
+        if os.path.isdir(path):
+            logger.info(f"检测到新目录: {path}")
+            for file_path, _ in walk_video_files(path, self.extensions):
+                self.touch(file_path)
+            return
+
+        if os.path.isfile(path):
+            # 文件仍在写入(如上传中)时推迟处理
+            if time.time() - os.stat(path).st_mtime < self.debounce:
+                self.touch(path)
+                return
+            logger.info(f"检测到文件变化，开始处理: {path}")
+            self.analyzer._process_video_file(Path(path))
+            return
+
+        # 路径已不存在：删除该文件，或该目录下所有文件的记录
+        cursor = self.analyzer.db.connection().cursor()
+        cursor.execute("SELECT id FROM video_metadata WHERE file_path = ?", (path,))
+        video_ids = [video_id for (video_id,) in cursor.fetchall()]
+        video_ids += [row[0] for row in self.analyzer._load_known_files(cursor, Path(path)).values()]
+        if video_ids:
+            logger.info(f"检测到删除: {path}")
+            self.analyzer._purge_videos(video_ids)
+
+    def start(self):
+        """Start watching in background threads."""
+        self._stop.clear()
+        if self.use_polling:
+            logger.info(f"以轮询方式监视视频库: {self.directory}，间隔 {self.poll_interval}秒")
+            self.poll_once()
+            self._threads.append(threading.Thread(target=self._poll_loop, name='library-poll', daemon=True))
+        else:
+            Observer, FileSystemEventHandler = _import_watchdog()
+            watcher = self
+
+            class _Handler(FileSystemEventHandler):
+                def on_any_event(self, event):
+                    watcher._on_event(event.event_type, event.src_path,
+                                      getattr(event, 'dest_path', None), event.is_directory)
+
+            self._observer = Observer()
+            self._observer.schedule(_Handler(), self.directory, recursive=True)
+            self._observer.start()
+            logger.info(f"使用文件系统事件监视视频库: {self.directory}")
+
+        self._threads.append(threading.Thread(target=self._worker_loop, name='library-worker', daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """Stop watching and wait for the background threads."""
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def run(self):
+        """Watch until interrupted with Ctrl+C."""
+        self.start()
+        try:
+            while not self._stop.wait(1.0):
+                pass
+        except KeyboardInterrupt:
+            logger.info("停止监视视频库")
+        finally:
+            self.stop()
+
+    def _poll_loop(self):
+        """Background loop polling the directory tree."""
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.poll_once()
+            except Exception as e:
+                logger.error(f"轮询视频库失败: {e}")
+
+    def _worker_loop(self):
+        """Background loop processing settled paths."""
+        while not self._stop.wait(min(0.5, max(self.debounce, 0.05))):
+            if self.process_ready():
+                try:
+                    self.analyzer.update_feature_snapshot()
+                except Exception as e:
+                    logger.error(f"更新特征快照失败: {e}")
+        self.analyzer.db.close()
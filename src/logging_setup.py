@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+from typing import Optional
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+DEFAULT_LOG_FILE = 'video_analyzer.log'
+
+
+def configure_logging(level: int = logging.INFO, log_file: Optional[str] = DEFAULT_LOG_FILE):
+    """
+    Send log records to the console and, optionally, a UTF-8 log file.
+
+    Library modules only create named loggers and never configure logging on
+    import; the command line entry points call this. Like
+    logging.basicConfig(), it does nothing when the root logger already has
+    handlers, so an application embedding the modules keeps its own setup.
+
+    Args:
+        level: Root logger level
+        log_file: File the records are appended to; None logs to the console only
+    """
+    root = logging.getLogger()
+    if root.handlers:
+        return
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+    logging.basicConfig(level=level, format=LOG_FORMAT, handlers=handlers)
+
+
+# 设置更详细的日志级别用于调试
+def set_debug_logging():
+    """启用调试级别的日志记录"""
+    # 尚未配置日志时先输出到控制台和日志文件
+    configure_logging()
+    logger = logging.getLogger('video_analyzer')
+    logger.setLevel(logging.DEBUG)
+    # 确保所有处理器也设置为DEBUG级别
+    for handler in logger.handlers:
+        handler.setLevel(logging.DEBUG)
+    # 同时设置根日志记录器
+    logging.getLogger().setLevel(logging.DEBUG)
+    # 添加一条调试消息以验证调试模式已启用
+    logger.debug("调试日志级别已设置 - 这条消息只有在调试模式下才会显示")
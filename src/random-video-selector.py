@@ -9,6 +9,8 @@ import argparse
 from pathlib import Path
 from datetime import datetime
 
+from library_walker import walk_video_files
+
 class VideoSelector:
     def __init__(self, source_dir, target_dir, target_duration, 
                  allowed_formats=None, max_error_ratio=0.05):
@@ -65,28 +67,26 @@ class VideoSelector:
         if self.allowed_formats:
             video_extensions = {f'.{ext.lower()}' for ext in self.allowed_formats}
 
-        for root, _, files in os.walk(self.source_dir):
-            for file in files:
-                ext = Path(file).suffix.lower()
-                if ext in video_extensions:
-                    video_path = Path(root) / file
-                    rel_path = str(video_path.relative_to(self.source_dir))
-                    file_mtime = os.path.getmtime(video_path)
-
-                    # 检查缓存是否有效
-                    if rel_path in cached_data.get('files', {}) and \
-                       cached_data['files'][rel_path].get('mtime', 0) == file_mtime:
-                        # 使用缓存数据
-                        self.video_cache['files'][rel_path] = cached_data['files'][rel_path]
-                    else:
-                        # 获取新时长并缓存
-                        duration = self.get_video_duration(video_path)
-                        if duration > 0:
-                            self.video_cache['files'][rel_path] = {
-                                'path': str(video_path),
-                                'duration': duration,
-                                'mtime': file_mtime
-                            }
+        # os.scandir 遍历，直接复用目录项的 stat 结果
+        for path, file_stats in walk_video_files(self.source_dir, video_extensions):
+            video_path = Path(path)
+            rel_path = str(video_path.relative_to(self.source_dir))
+            file_mtime = file_stats.st_mtime
+
+            # 检查缓存是否有效
+            if rel_path in cached_data.get('files', {}) and \
+               cached_data['files'][rel_path].get('mtime', 0) == file_mtime:
+                # 使用缓存数据
+                self.video_cache['files'][rel_path] = cached_data['files'][rel_path]
+            else:
+                # 获取新时长并缓存
+                duration = self.get_video_duration(video_path)
+                if duration > 0:
+                    self.video_cache['files'][rel_path] = {
+                        'path': str(video_path),
+                        'duration': duration,
+                        'mtime': file_mtime
+                    }
 
         # 保存更新后的缓存
         self.save_cache()
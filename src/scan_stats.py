@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger('scan_stats')
+
+# 每个文件计时的阶段，按扫描中的先后顺序；特征计算按提取器记为 compute.<特征类型>
+STAGES = ('fingerprint', 'probe', 'metadata_write', 'open', 'decode', 'compute', 'serialize', 'db_write')
+PERCENTILES = (50, 90, 99)
+
+
+def _stage_order(stage: str):
+    base = stage.split('.', 1)[0]
+    return (STAGES.index(base) if base in STAGES else len(STAGES), stage)
+
+
+class ScanStats:
+    """
+    Per-file timings and counters of video library scans.
+
+    Each analysed file records the seconds it spent in every stage (see
+    STAGES; feature computation is recorded per extractor as
+    'compute.<feature_type>') and adds to counters such as frames and bytes.
+    Timings measured in scan worker processes travel back with the analysis
+    result and are recorded by the main process through add_file().
+    """
+
+    def __init__(self):
+        """Initialize empty statistics."""
+        self.timings: Dict[str, List[float]] = {}
+        self.counters: Dict[str, int] = {}
+
+    def record(self, stage: str, seconds: float):
+        """Record the time one file spent in a stage."""
+        self.timings.setdefault(stage, []).append(seconds)
+
+    def count(self, counter: str, value: int = 1):
+        """Add value to a counter."""
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def add_file(self, timings: Optional[Dict[str, float]], counters: Optional[Dict[str, int]] = None):
+        """Record the stage timings and counters of one analysed file."""
+        for stage, seconds in (timings or {}).items():
+            self.record(stage, seconds)
+        for counter, value in (counters or {}).items():
+            self.count(counter, value)
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Aggregate the recorded values.
+
+        Returns:
+            Dictionary with 'stages' mapping each stage to its count, total,
+            mean, p50, p90, p99 and max seconds, and 'counters'
+        """
+        stages = {}
+        for stage in sorted(self.timings, key=_stage_order):
+            values = np.array(self.timings[stage], dtype=np.float64)
+            entry = {'count': int(len(values)), 'total': float(values.sum()), 'mean': float(values.mean())}
+            for q, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+                entry[f'p{q}'] = float(value)
+            entry['max'] = float(values.max())
+            stages[stage] = entry
+        return {'stages': stages, 'counters': dict(sorted(self.counters.items()))}
+
+    def format_table(self) -> str:
+        """The summary as a fixed-width text table, one row per stage (milliseconds)."""
+        summary = self.summary()
+        columns = ['count', 'total', 'mean'] + [f'p{q}' for q in PERCENTILES] + ['max']
+        width = max([len('stage')] + [len(stage) for stage in summary['stages']])
+        lines = [f"{'stage':<{width}} " + ' '.join(f"{column:>10}" for column in columns)]
+        for stage, entry in summary['stages'].items():
+            cells = [f"{entry['count']:>10d}"] + [f"{entry[column] * 1000:>10.1f}" for column in columns[1:]]
+            lines.append(f"{stage:<{width}} " + ' '.join(cells))
+        if summary['counters']:
+            lines.append(', '.join(f"{counter}={value}" for counter, value in summary['counters'].items()))
+        return '\n'.join(lines)
+
+    def write_json(self, path: str):
+        """Write the summary to a JSON file."""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, indent=2)
+        logger.info(f"扫描统计已写入: {path}")
@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Vectorized similarity kernels for video features.
+
+Per-video features are sequences of per-frame values. The one-vs-many forms
+take the candidates either as a list of arrays or packed into one contiguous
+array plus an offsets array (candidate i is values[offsets[i]:offsets[i + 1]]).
+"""
+
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+# Number of set bits in each byte value, used when np.bitwise_count is missing (numpy < 2.0)
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+_HAS_BITWISE_COUNT = hasattr(np, 'bitwise_count')
+
+# Bins per frame of the colorhist feature (8 hue x 8 saturation)
+COLORHIST_BINS = 64
+
+# Weights of the two terms in the combined video similarity
+PHASH_WEIGHT = 0.7
+COLORHIST_WEIGHT = 0.3
+
+
+def _popcount_table(values: np.ndarray) -> np.ndarray:
+    """Count set bits of uint64 values with a byte lookup table."""
+    values = np.ascontiguousarray(values, dtype=np.uint64)
+    as_bytes = values.view(np.uint8).reshape(values.shape + (8,))
+    return _POPCOUNT_TABLE[as_bytes].sum(axis=-1, dtype=np.uint8)
+
+
+def popcount64(values: np.ndarray) -> np.ndarray:
+    """
+    Count the set bits of every element of a uint64 array.
+
+    Uses the hardware popcount behind np.bitwise_count when available and a
+    byte lookup table otherwise.
+    """
+    if _HAS_BITWISE_COUNT:
+        return np.bitwise_count(values)
+    return _popcount_table(values)
+
+
+def pack_sequences(sequences: Sequence[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pack per-video feature arrays into one contiguous array with offsets.
+
+    Returns:
+        Tuple (values, offsets) where offsets has len(sequences) + 1 entries
+    """
+    lengths = np.array([len(seq) for seq in sequences], dtype=np.int64)
+    offsets = np.zeros(len(sequences) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    if len(sequences) == 0:
+        return np.empty(0, dtype=np.uint64), offsets
+    return np.concatenate(sequences), offsets
+
+
+def _aligned_pairs(ref_len: int, offsets: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Frame pairs compared by the truncating (frame i vs frame i) similarity.
+
+    Returns:
+        Tuple (segment, value_pos, ref_pos, compared) where segment[k] is the
+        candidate of pair k, value_pos/ref_pos index the two frames and
+        compared[i] is the number of frames compared for candidate i
+    """
+    lengths = np.diff(offsets)
+    compared = np.minimum(lengths, ref_len)
+    total = int(compared.sum())
+    segment = np.repeat(np.arange(len(compared)), compared)
+    segment_start = np.repeat(np.cumsum(compared) - compared, compared)
+    ref_pos = np.arange(total, dtype=np.int64) - segment_start
+    value_pos = offsets[:-1][segment] + ref_pos
+    return segment, value_pos, ref_pos, compared
+
+
+def phash_similarity(phash1: np.ndarray, phash2: np.ndarray) -> float:
+    """
+    Calculate similarity between two sets of perceptual hashes.
+
+    Frame i is compared with frame i over the shorter of the two sequences;
+    the result is the mean of 1 - hamming_distance / 64.
+    """
+    min_len = min(len(phash1), len(phash2))
+    if min_len == 0:
+        return 0.0
+
+    phash1 = np.asarray(phash1[:min_len], dtype=np.uint64)
+    phash2 = np.asarray(phash2[:min_len], dtype=np.uint64)
+    distances = popcount64(np.bitwise_xor(phash1, phash2))
+    return float(1.0 - distances.mean() / 64.0)
+
+
+def phash_similarity_many(ref: np.ndarray,
+                          candidates: Union[List[np.ndarray], np.ndarray],
+                          offsets: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Compare one perceptual hash sequence against many candidates in one call.
+
+    Args:
+        ref: Hash sequence of the reference video
+        candidates: List of hash sequences, or packed hash values when
+            offsets is given
+        offsets: Candidate boundaries in the packed values
+
+    Returns:
+        float64 array with one similarity per candidate, as phash_similarity
+    """
+    if offsets is None:
+        candidates, offsets = pack_sequences(candidates)
+    values = np.asarray(candidates, dtype=np.uint64)
+    ref = np.asarray(ref, dtype=np.uint64)
+
+    segment, value_pos, ref_pos, compared = _aligned_pairs(len(ref), offsets)
+    distances = popcount64(np.bitwise_xor(values[value_pos], ref[ref_pos]))
+    totals = np.bincount(segment, weights=distances, minlength=len(compared))
+
+    similarities = np.zeros(len(compared), dtype=np.float64)
+    valid = compared > 0
+    similarities[valid] = 1.0 - totals[valid] / compared[valid] / 64.0
+    return similarities
+
+
+def _as_histogram_rows(hist: np.ndarray) -> np.ndarray:
+    """View color histogram features (flat or 2D) as one row of COLORHIST_BINS per frame."""
+    return np.asarray(hist, dtype=np.float32).reshape(-1, COLORHIST_BINS)
+
+
+def normalize_histograms(hist: np.ndarray) -> np.ndarray:
+    """
+    Scale every frame's histogram to sum to 1.
+
+    Stored colorhist features are L2-normalized by cv2.normalize, so their
+    raw intersection is not bounded by 1. On L1-normalized rows the
+    intersection is the overlap of the two distributions, in [0, 1].
+    """
+    rows = _as_histogram_rows(hist)
+    sums = rows.sum(axis=1, keepdims=True)
+    return np.divide(rows, sums, out=np.zeros_like(rows), where=sums > 0)
+
+
+def histogram_similarity(hist1: np.ndarray, hist2: np.ndarray) -> float:
+    """
+    Calculate similarity between two sets of color histograms.
+
+    Frame i is compared with frame i over the shorter of the two sequences;
+    the result is the mean intersection of the normalized histograms (0-1).
+    """
+    min_len = min(len(_as_histogram_rows(hist1)), len(_as_histogram_rows(hist2)))
+    if min_len == 0:
+        return 0.0
+
+    hist1 = normalize_histograms(_as_histogram_rows(hist1)[:min_len])
+    hist2 = normalize_histograms(_as_histogram_rows(hist2)[:min_len])
+    intersections = np.minimum(hist1, hist2).sum(axis=-1, dtype=np.float64)
+    return float(intersections.mean())
+
+
+def histogram_similarity_many(ref: np.ndarray,
+                              candidates: Union[List[np.ndarray], np.ndarray],
+                              offsets: Optional[np.ndarray] = None,
+                              normalized: bool = False) -> np.ndarray:
+    """
+    Compare one color histogram sequence against many candidates in one call.
+
+    Args:
+        ref: Histogram sequence of the reference video
+        candidates: List of histogram sequences, or packed histogram rows
+            (one row per frame) when offsets is given
+        offsets: Candidate boundaries, in frames, in the packed rows
+        normalized: The packed rows are already normalize_histograms() output
+
+    Returns:
+        float64 array with one similarity per candidate, as histogram_similarity
+    """
+    if offsets is None:
+        candidates, offsets = pack_sequences([_as_histogram_rows(c) for c in candidates])
+    rows = _as_histogram_rows(candidates)
+    if not normalized:
+        rows = normalize_histograms(rows)
+    ref = normalize_histograms(ref)
+
+    starts = offsets[:-1]
+    lengths = np.diff(offsets)
+    totals = np.zeros(len(lengths), dtype=np.float64)
+    ones = np.ones(COLORHIST_BINS, dtype=np.float32)
+
+    if len(ref) > len(lengths):
+        # 候选视频少于参考帧数时，一次收集所有对齐的帧对，避免逐帧循环
+        segment, row_pos, ref_pos, _ = _aligned_pairs(len(ref), offsets)
+        intersections = np.minimum(rows[row_pos], ref[ref_pos]) @ ones
+        totals = np.bincount(segment, weights=intersections, minlength=len(lengths))
+    else:
+        # 按参考视频的帧逐一计算：第 k 帧与所有长度大于 k 的候选视频的第 k 帧比较
+        for k in range(len(ref)):
+            active = np.flatnonzero(lengths > k)
+            if len(active) == 0:
+                break
+            frames = rows[starts[active] + k]
+            np.minimum(frames, ref[k], out=frames)
+            totals[active] += frames @ ones
+
+    compared = np.minimum(lengths, len(ref))
+    similarities = np.zeros(len(compared), dtype=np.float64)
+    valid = compared > 0
+    similarities[valid] = totals[valid] / compared[valid]
+    return similarities
+
+
+def pack_frame_major(rows: np.ndarray, offsets: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Reorder packed per-video rows so frame k of every video is contiguous.
+
+    Videos are sorted by length, longest first, so the videos that have a
+    frame k are always a prefix of that order and block k of the result is
+    a plain slice.
+
+    Args:
+        rows: Packed rows (one row per frame)
+        offsets: Video boundaries in rows
+
+    Returns:
+        Tuple (major_rows, major_offsets, order): block k is
+        major_rows[major_offsets[k]:major_offsets[k + 1]] and holds frame k
+        of videos order[0], order[1], ...
+    """
+    lengths = np.diff(offsets)
+    order = np.argsort(-lengths, kind='stable')
+    sorted_lengths = lengths[order]
+    max_len = int(sorted_lengths[0]) if len(sorted_lengths) else 0
+
+    # counts[k]: 拥有第 k 帧的视频数
+    counts = np.searchsorted(-sorted_lengths, -np.arange(max_len), side='left')
+    major_offsets = np.zeros(max_len + 1, dtype=np.int64)
+    np.cumsum(counts, out=major_offsets[1:])
+
+    # 排序后第 i 个视频的第 k 帧位于 major_offsets[k] + i
+    rank = np.repeat(np.arange(len(order)), sorted_lengths)
+    frame = np.arange(int(sorted_lengths.sum())) - np.repeat(np.cumsum(sorted_lengths) - sorted_lengths,
+                                                            sorted_lengths)
+    source = offsets[:-1][order][rank] + frame
+    major_rows = np.empty_like(rows)
+    major_rows[major_offsets[frame] + rank] = rows[source]
+    return major_rows, major_offsets, order
+
+
+def histogram_similarity_frame_major(ref: np.ndarray, major_rows: np.ndarray,
+                                     major_offsets: np.ndarray, order: np.ndarray) -> np.ndarray:
+    """
+    histogram_similarity_many over candidates laid out by pack_frame_major().
+
+    The rows must already be normalize_histograms() output. Each reference
+    frame reads one contiguous block, avoiding the per-frame gather of the
+    packed layout.
+
+    Returns:
+        float64 array with one similarity per candidate, in the original
+        (pre-order) candidate order
+    """
+    ref = normalize_histograms(ref)
+    totals = np.zeros(len(order), dtype=np.float64)
+    ones = np.ones(COLORHIST_BINS, dtype=np.float32)
+    compare_len = min(len(ref), len(major_offsets) - 1)
+    buffer = np.empty((int(major_offsets[1] - major_offsets[0]) if compare_len else 0, COLORHIST_BINS),
+                      dtype=np.float32)
+
+    for k in range(compare_len):
+        count = int(major_offsets[k + 1] - major_offsets[k])
+        frames = buffer[:count]
+        np.minimum(major_rows[major_offsets[k]:major_offsets[k + 1]], ref[k], out=frames)
+        totals[:count] += frames @ ones
+
+    # 按排序位置计算比较帧数，再映射回原始顺序
+    counts = np.diff(major_offsets)[:compare_len]
+    compared = compare_len - np.cumsum(np.bincount(counts, minlength=len(order) + 1))[:len(order)]
+
+    similarities = np.zeros(len(order), dtype=np.float64)
+    valid = compared > 0
+    similarities[order[valid]] = totals[valid] / compared[valid]
+    return similarities
+
+
+def _cross_correlate(signal1: np.ndarray, signal2: np.ndarray) -> np.ndarray:
+    """
+    Cross-correlation of two multi-channel signals, summed over channels.
+
+    Args:
+        signal1: Array (n1, channels)
+        signal2: Array (n2, channels)
+
+    Returns:
+        float64 array of n1 + n2 - 1 values; entry k + n2 - 1 is
+        sum_j sum_c signal1[j + k, c] * signal2[j, c] for offsets k from
+        -(n2 - 1) to n1 - 1
+    """
+    n1, n2 = len(signal1), len(signal2)
+    size = 1 << (n1 + n2 - 2).bit_length()
+    spectrum = np.fft.rfft(signal1, size, axis=0) * np.conj(np.fft.rfft(signal2, size, axis=0))
+    # 各通道的频谱先求和，只需一次逆变换
+    correlation = np.fft.irfft(spectrum.sum(axis=1), size)
+    return np.concatenate([correlation[size - n2 + 1:], correlation[:n1]])
+
+
+def _offset_overlaps(n1: int, n2: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Every offset of a sequence of n2 frames against one of n1 frames.
+
+    Returns:
+        Tuple (offsets, overlaps): at offset k frame j of the second sequence
+        is compared with frame j + k of the first, over overlaps[k] frames
+    """
+    offsets = np.arange(-(n2 - 1), n1, dtype=np.int64)
+    overlaps = np.minimum(n1 - offsets, n2) - np.maximum(0, -offsets)
+    return offsets, overlaps
+
+
+def _overlapping(seq1: np.ndarray, seq2: np.ndarray, offset: int) -> Tuple[np.ndarray, np.ndarray]:
+    """The frames of two sequences that are compared at the given offset."""
+    start2 = max(0, -offset)
+    end2 = min(len(seq2), len(seq1) - offset)
+    return seq1[start2 + offset:end2 + offset], seq2[start2:end2]
+
+
+def _min_overlap_frames(n1: int, n2: int, min_overlap: float) -> int:
+    """Fewest overlapping frames an offset needs to be considered."""
+    return max(1, int(np.ceil(min_overlap * min(n1, n2))))
+
+
+def phash_similarity_by_offset(phash1: np.ndarray, phash2: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    phash_similarity of two hash sequences at every temporal offset.
+
+    With bits mapped to +1/-1, the number of equal bits of two hashes is
+    (64 + dot product) / 2, so the bit matches of all offsets follow from one
+    FFT cross-correlation of the 64 bit channels in O(n log n).
+
+    Returns:
+        Tuple (offsets, similarities, overlaps); at offset k frame j of
+        phash2 is compared with frame j + k of phash1
+    """
+    phash1 = np.ascontiguousarray(phash1, dtype=np.uint64)
+    phash2 = np.ascontiguousarray(phash2, dtype=np.uint64)
+    offsets, overlaps = _offset_overlaps(len(phash1), len(phash2))
+    if len(phash1) == 0 or len(phash2) == 0:
+        return offsets, np.zeros(len(offsets)), overlaps
+
+    def signs(phash: np.ndarray) -> np.ndarray:
+        bits = np.unpackbits(phash.view(np.uint8).reshape(-1, 8), axis=1)
+        return bits.astype(np.float64) * 2.0 - 1.0
+
+    dots = np.rint(_cross_correlate(signs(phash1), signs(phash2)))
+    similarities = 0.5 + dots / (128.0 * overlaps)
+    return offsets, similarities, overlaps
+
+
+def video_similarity_aligned(phash1: np.ndarray, hist1: np.ndarray,
+                             phash2: np.ndarray, hist2: np.ndarray,
+                             min_overlap: float = 0.5, refine: int = 5) -> Tuple[float, int]:
+    """
+    Combined phash/colorhist similarity at the best temporal offset.
+
+    phash_similarity and histogram_similarity compare frame i with frame i,
+    so a clip trimmed from the start of another scores as unrelated. Here
+    every offset is considered: the phash term of all offsets comes from an
+    exact FFT cross-correlation. Histogram intersection is not a product of
+    the two frames, so its FFT stand-in is the Bhattacharyya coefficient
+    (the dot product of the square-rooted normalized histograms); the
+    `refine` best offsets by that estimate, plus offset 0, are then scored
+    with the exact intersection. The result is therefore never below the
+    frame i vs frame i score.
+
+    Args:
+        phash1, hist1: Features of the first video
+        phash2, hist2: Features of the second video
+        min_overlap: Only offsets where at least this fraction of the shorter
+            video overlaps the other are considered
+        refine: Number of candidate offsets scored exactly
+
+    Returns:
+        Tuple (similarity, offset): frame j of the second video lines up
+        with frame j + offset of the first one
+    """
+    rows1 = normalize_histograms(hist1)
+    rows2 = normalize_histograms(hist2)
+    n1 = min(len(phash1), len(rows1))
+    n2 = min(len(phash2), len(rows2))
+    if n1 == 0 or n2 == 0:
+        return 0.0, 0
+    phash1, rows1 = np.asarray(phash1)[:n1], rows1[:n1]
+    phash2, rows2 = np.asarray(phash2)[:n2], rows2[:n2]
+
+    offsets, phash_sims, overlaps = phash_similarity_by_offset(phash1, phash2)
+    estimates = _cross_correlate(np.sqrt(rows1, dtype=np.float64), np.sqrt(rows2, dtype=np.float64)) / overlaps
+    scores = PHASH_WEIGHT * phash_sims + COLORHIST_WEIGHT * estimates
+
+    eligible = np.flatnonzero(overlaps >= _min_overlap_frames(n1, n2, min_overlap))
+    best = eligible[np.argsort(-scores[eligible], kind='stable')[:refine]]
+    zero = n2 - 1  # offset 0 的下标
+    candidates = set(best.tolist()) | {zero}
+
+    best_score, best_offset = -1.0, 0
+    for index in sorted(candidates, key=lambda i: abs(int(offsets[i]))):
+        offset = int(offsets[index])
+        frames1, frames2 = _overlapping(rows1, rows2, offset)
+        hist_sim = float(np.minimum(frames1, frames2).sum(axis=-1, dtype=np.float64).mean())
+        score = PHASH_WEIGHT * float(phash_sims[index]) + COLORHIST_WEIGHT * hist_sim
+        if score > best_score:
+            best_score, best_offset = score, offset
+    return best_score, best_offset
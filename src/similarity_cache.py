@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+import sqlite3
+import logging
+from typing import List, Dict, Tuple, Optional
+
+import numpy as np
+
+logger = logging.getLogger('similarity_cache')
+
+
+class SimilarityCache:
+    """
+    Persistent store of pairwise video similarity scores.
+
+    Every video gets one row in the video_similarity table holding the IDs
+    and combined scores of all videos whose similarity to it is at least
+    `floor`, sorted by score and tagged with the feature version they were
+    computed with. computed_at records the library state the row covers;
+    later lookups only score the videos analysed since then and merge them
+    in. Re-analysing a video drops its own row (see invalidate()); the rows
+    of other videos pick up its new scores because it is now newer than
+    their computed_at.
+    """
+
+    def __init__(self, analyzer, floor: float = 0.5):
+        """
+        Initialize the SimilarityCache.
+
+        Args:
+            analyzer: VideoAnalyzer providing the feature version and the feature index
+            floor: Pair scores below this value are not stored
+        """
+        self.analyzer = analyzer
+        self.floor = floor
+
+        # 新计算的行先缓存在内存中，由 flush() 在一个事务中批量写入，
+        # 避免计算期间长时间持有写锁
+        self._pending: Dict[int, Tuple[Optional[str], np.ndarray, np.ndarray]] = {}
+
+    def covers(self, threshold: float) -> bool:
+        """Whether queries with this threshold can be answered from the cache."""
+        return threshold >= self.floor
+
+    @staticmethod
+    def invalidate(cursor: sqlite3.Cursor, video_id: int):
+        """
+        Drop the cached row of a video whose features changed or that was removed.
+
+        The caller owns the transaction and commits.
+        """
+        cursor.execute("DELETE FROM video_similarity WHERE video_id = ?", (video_id,))
+
+    def get_similar(self, cursor: sqlite3.Cursor, video_id: int, threshold: float,
+                    library_state: Optional[str] = None) -> List[Tuple[int, float]]:
+        """
+        Videos whose similarity to video_id is at least threshold.
+
+        Raw features are only read when the video's row is missing, was
+        computed with another feature version or is older than the library.
+        New rows are kept in memory until flush(), so a run of lookups
+        stores them in one transaction.
+
+        Args:
+            cursor: Database cursor
+            video_id: ID of the reference video
+            threshold: Similarity threshold, not below self.floor
+            library_state: MAX(analyzed_at) of video_metadata, if the caller already read it
+
+        Returns:
+            List of tuples (video_id, similarity_score), highest first
+        """
+        if not self.covers(threshold):
+            raise ValueError(f"Threshold {threshold} is below the cache floor {self.floor}")
+
+        if library_state is None:
+            cursor.execute("SELECT MAX(analyzed_at) FROM video_metadata")
+            library_state = cursor.fetchone()[0]
+
+        row = self._load_row(cursor, video_id)
+        if row is None:
+            neighbour_ids, scores = self._compute_row(cursor, video_id, None)
+            self._pending[video_id] = (library_state, neighbour_ids, scores)
+        else:
+            computed_at, neighbour_ids, scores = row
+            if library_state is not None and (computed_at is None or library_state > computed_at):
+                neighbour_ids, scores = self._compute_row(cursor, video_id, computed_at,
+                                                          neighbour_ids, scores)
+                self._pending[video_id] = (library_state, neighbour_ids, scores)
+
+        # 分数按降序存放，阈值以上的部分是一个前缀
+        count = int(np.searchsorted(-scores, -threshold, side='right'))
+        return [(int(vid), float(score)) for vid, score in zip(neighbour_ids[:count], scores[:count])]
+
+    def _load_row(self, cursor: sqlite3.Cursor,
+                  video_id: int) -> Optional[Tuple[Optional[str], np.ndarray, np.ndarray]]:
+        """Read the row of a video; None if missing or computed with another feature version."""
+        if video_id in self._pending:
+            return self._pending[video_id]
+
+        cursor.execute('''
+        SELECT feature_version, computed_at, neighbour_ids, scores
+        FROM video_similarity
+        WHERE video_id = ?
+        ''', (video_id,))
+        row = cursor.fetchone()
+        if row is None or row[0] != self.analyzer.current_feature_version:
+            return None
+        _, computed_at, ids_data, scores_data = row
+        return (computed_at, np.frombuffer(ids_data, dtype=np.int64),
+                np.frombuffer(scores_data, dtype=np.float64))
+
+    def flush(self, cursor: sqlite3.Cursor):
+        """
+        Write the rows computed since the last flush.
+
+        The caller owns the transaction and commits.
+        """
+        if not self._pending:
+            return
+        version = self.analyzer.current_feature_version
+        cursor.executemany('''
+        INSERT OR REPLACE INTO video_similarity
+        (video_id, feature_version, computed_at, neighbour_ids, scores)
+        VALUES (?, ?, ?, ?, ?)
+        ''', [(video_id, version, computed_at,
+               neighbour_ids.astype(np.int64).tobytes(), scores.astype(np.float64).tobytes())
+              for video_id, (computed_at, neighbour_ids, scores) in self._pending.items()])
+        logger.debug(f"写入 {len(self._pending)} 个相似度缓存行")
+        self._pending.clear()
+
+    def _compute_row(self, cursor: sqlite3.Cursor, video_id: int, since: Optional[str],
+                     neighbour_ids: Optional[np.ndarray] = None,
+                     scores: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score video_id against the library, keeping the scores at or above the floor.
+
+        Args:
+            cursor: Database cursor
+            video_id: ID of the reference video
+            since: Only score videos analysed after this time and merge them into
+                neighbour_ids/scores; None scores the whole library
+            neighbour_ids: Cached neighbours of the video
+            scores: Cached scores of the video
+
+        Returns:
+            Tuple (neighbour_ids, scores) sorted by score, highest first
+        """
+        start_time = time.time()
+        index = self.analyzer.get_feature_index()
+        if video_id not in index:
+            logger.debug(f"视频 ID {video_id} 没有特征，相似度缓存行为空")
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+        ref_phash, ref_colorhist = index.get_features(video_id)
+        if since is None:
+            positions = np.arange(len(index))
+            new_scores = index.similarities(ref_phash, ref_colorhist)
+            neighbour_ids = np.empty(0, dtype=np.int64)
+            scores = np.empty(0, dtype=np.float64)
+        else:
+            cursor.execute("SELECT id FROM video_metadata WHERE analyzed_at > ?", (since,))
+            newer = [vid for (vid,) in cursor.fetchall()]
+            positions = np.array([index.position(vid) for vid in newer if vid in index], dtype=np.int64)
+            new_scores = index.score_positions(ref_phash, ref_colorhist, positions)
+            # 重新分析过的视频替换旧分数
+            keep_old = ~np.isin(neighbour_ids, np.array(newer, dtype=np.int64))
+            neighbour_ids, scores = neighbour_ids[keep_old], scores[keep_old]
+
+        keep = (new_scores >= self.floor) & (index.video_ids[positions] != video_id)
+        neighbour_ids = np.concatenate([neighbour_ids, index.video_ids[positions[keep]]])
+        scores = np.concatenate([scores, new_scores[keep]])
+        order = np.argsort(-scores, kind='stable')
+
+        logger.debug(f"计算视频 ID {video_id} 的相似度缓存行: 比较 {len(positions)} 个视频，"
+                     f"共 {len(order)} 个相似视频，耗时 {time.time() - start_time:.3f}秒")
+        return neighbour_ids[order], scores[order]
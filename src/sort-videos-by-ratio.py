@@ -1,13 +1,18 @@
 import os
 import argparse
 import shutil
-from moviepy.editor import VideoFileClip
+import sqlite3
+from pathlib import Path
+
+from library_walker import walk_video_files
 
 def get_video_info(video_path):
     """
     获取视频的信息，包括宽高比
     """
     try:
+        # 只有数据库中没有记录的视频才需要 MoviePy 打开
+        from moviepy.editor import VideoFileClip
         clip = VideoFileClip(video_path)
         width, height = clip.size
         ratio = width / height
@@ -68,7 +73,38 @@ def get_custom_ratio_folder(ratio, custom_ranges):
             return folder_name
     return f"其他比例_{ratio:.2f}"
 
-def sort_videos_by_ratio(input_folder, output_folder, custom_ranges=None, copy_mode=False, extensions=None):
+def load_library_ratios(db_path, input_folder):
+    """
+    从视频库数据库中一次查询出输入文件夹下已分析视频的宽高比(已考虑旋转)，
+    返回 {绝对路径: 宽高比}
+
+    直接用 sqlite3 只读查询，不导入 video_analyzer，打包后的脚本只需 library_walker.py
+    """
+    if not os.path.exists(db_path):
+        print(f"数据库不存在，逐个打开视频获取宽高比: {db_path}")
+        return {}
+    # file_path 上有唯一索引，前缀匹配改写为范围查询
+    prefix = str(Path(input_folder).absolute())
+    if not prefix.endswith(os.sep):
+        prefix += os.sep
+    conn = sqlite3.connect(f"{Path(db_path).absolute().as_uri()}?mode=ro", uri=True)
+    try:
+        rows = conn.execute(
+            "SELECT file_path, aspect_ratio FROM video_metadata "
+            "WHERE alias_of IS NULL AND aspect_ratio IS NOT NULL AND file_path >= ? AND file_path < ?",
+            (prefix, prefix[:-1] + chr(ord(os.sep) + 1))).fetchall()
+    except sqlite3.Error as e:
+        # 旧版本的数据库没有宽高比列
+        print(f"无法从数据库读取宽高比，逐个打开视频获取: {e}")
+        return {}
+    finally:
+        conn.close()
+    ratios = dict(rows)
+    print(f"从数据库读取了 {len(ratios)} 个视频的宽高比")
+    return ratios
+
+def sort_videos_by_ratio(input_folder, output_folder, custom_ranges=None, copy_mode=False, extensions=None,
+                         db_path=None):
     """
     根据视频比例将视频分类到不同文件夹
     
@@ -78,9 +114,11 @@ def sort_videos_by_ratio(input_folder, output_folder, custom_ranges=None, copy_m
     - custom_ranges: 自定义比例范围，格式为 {文件夹名: (最小比例, 最大比例)}
     - copy_mode: 如果为True，复制文件而不是移动
     - extensions: 视频文件扩展名列表
+    - db_path: 视频库数据库路径，已分析视频的宽高比直接从数据库读取
     """
     if extensions is None:
         extensions = ['.mp4', '.avi', '.mov', '.flv', '.mkv', '.wmv']
+    library_ratios = load_library_ratios(db_path, input_folder) if db_path else {}
     
     # 确保输出文件夹存在
     if not os.path.exists(output_folder):
@@ -92,45 +130,47 @@ def sort_videos_by_ratio(input_folder, output_folder, custom_ranges=None, copy_m
     ratio_counts = {}
     
     # 处理视频文件
-    for root, _, files in os.walk(input_folder):
-        for file in files:
-            if any(file.lower().endswith(ext) for ext in extensions):
-                total_videos += 1
-                file_path = os.path.join(root, file)
-                
-                # 获取视频信息
-                video_info = get_video_info(file_path)
-                if video_info:
-                    ratio = video_info['ratio']
-                    
-                    # 确定目标文件夹
-                    if custom_ranges:
-                        ratio_folder = get_custom_ratio_folder(ratio, custom_ranges)
-                    else:
-                        ratio_folder = get_ratio_folder_name(ratio)
-                    
-                    # 更新统计信息
-                    ratio_counts[ratio_folder] = ratio_counts.get(ratio_folder, 0) + 1
-                    
-                    # 创建目标文件夹
-                    target_folder = os.path.join(output_folder, ratio_folder)
-                    if not os.path.exists(target_folder):
-                        os.makedirs(target_folder)
-                    
-                    # 目标文件路径
-                    target_path = os.path.join(target_folder, file)
-                    
-                    # 复制或移动文件
-                    try:
-                        if copy_mode:
-                            shutil.copy2(file_path, target_path)
-                            print(f"已复制: {file} -> {ratio_folder}/")
-                        else:
-                            shutil.move(file_path, target_path)
-                            print(f"已移动: {file} -> {ratio_folder}/")
-                        processed_videos += 1
-                    except Exception as e:
-                        print(f"处理文件出错: {file}, 错误: {e}")
+    # 先收集文件列表 (os.scandir 遍历)，移动文件时不影响遍历
+    video_files = [path for path, _ in walk_video_files(input_folder, extensions)]
+    for file_path in video_files:
+        file = os.path.basename(file_path)
+        total_videos += 1
+        
+        # 获取视频信息
+        ratio = library_ratios.get(str(Path(file_path).absolute()))
+        if ratio is None:
+            video_info = get_video_info(file_path)
+            ratio = video_info['ratio'] if video_info else None
+        if ratio is not None:
+            
+            # 确定目标文件夹
+            if custom_ranges:
+                ratio_folder = get_custom_ratio_folder(ratio, custom_ranges)
+            else:
+                ratio_folder = get_ratio_folder_name(ratio)
+            
+            # 更新统计信息
+            ratio_counts[ratio_folder] = ratio_counts.get(ratio_folder, 0) + 1
+            
+            # 创建目标文件夹
+            target_folder = os.path.join(output_folder, ratio_folder)
+            if not os.path.exists(target_folder):
+                os.makedirs(target_folder)
+            
+            # 目标文件路径
+            target_path = os.path.join(target_folder, file)
+            
+            # 复制或移动文件
+            try:
+                if copy_mode:
+                    shutil.copy2(file_path, target_path)
+                    print(f"已复制: {file} -> {ratio_folder}/")
+                else:
+                    shutil.move(file_path, target_path)
+                    print(f"已移动: {file} -> {ratio_folder}/")
+                processed_videos += 1
+            except Exception as e:
+                print(f"处理文件出错: {file}, 错误: {e}")
     
     # 打印统计信息
     print(f"\n处理完成! 共处理 {processed_videos}/{total_videos} 个视频文件")
@@ -144,6 +184,7 @@ def main():
     parser.add_argument('--output', '-o', required=True, help='输出根文件夹路径')
     parser.add_argument('--copy', '-c', action='store_true', help='复制文件而不是移动')
     parser.add_argument('--custom', '-r', action='store_true', help='使用自定义比例范围')
+    parser.add_argument('--db-path', '-d', default=None, help='视频库数据库路径，已分析视频的宽高比从数据库读取')
     
     args = parser.parse_args()
     
@@ -165,7 +206,7 @@ def main():
     print(f"模式: {'复制' if args.copy else '移动'}")
     print(f"比例范围: {'自定义' if args.custom else '默认'}")
     
-    sort_videos_by_ratio(args.input, args.output, custom_ranges, args.copy)
+    sort_videos_by_ratio(args.input, args.output, custom_ranges, args.copy, db_path=args.db_path)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -2,13 +2,28 @@
 # -*- coding: utf-8 -*-
 
 import os
+import shutil
 import tempfile
 import unittest
 from pathlib import Path
 
+import cv2
+import numpy as np
+
 from video_analyzer import VideoAnalyzer
 from video_composer import VideoComposer
 
+def make_test_video(path, seconds=3, fps=10, size=(160, 120), seed=0):
+    """Write a small synthetic MJPG video for tests that need real frames."""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+    base = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    for i in range(seconds * fps):
+        writer.write(np.roll(base, shift=i * 3, axis=1))
+    writer.release()
+    return path
+
 class TestVideoAudioSync(unittest.TestCase):
     """Test cases for the video audio sync modules."""
     
@@ -33,6 +48,8 @@ class TestVideoAudioSync(unittest.TestCase):
     
     def tearDown(self):
         """Clean up after tests."""
+        self.analyzer.db.close()
+        self.composer.analyzer.db.close()
         # Remove temporary database
         if os.path.exists(self.db_path):
             os.unlink(self.db_path)
@@ -189,5 +206,1245 @@ class TestVideoAudioSync(unittest.TestCase):
             print(f"Error in test_draft_export: {e}")
             self.skipTest(f"Draft export test failed: {e}")
 
+class TestFeatureExtraction(unittest.TestCase):
+    """Test cases for frame sampling and feature extraction."""
+
+    def setUp(self):
+        """Create a temporary directory with a database and a synthetic video."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.temp_dir.name, 'test.db')
+        self.video_path = make_test_video(os.path.join(self.temp_dir.name, 'clip.avi'))
+        self.analyzer = VideoAnalyzer(db_path=self.db_path)
+
+    def tearDown(self):
+        """Clean up after tests."""
+        self.temp_dir.cleanup()
+
+    def test_shared_sampler_matches_per_extractor_decode(self):
+        """Features from the single-decode path equal the per-extractor results."""
+        features = self.analyzer._extract_video_features(self.video_path)
+        self.assertEqual(set(features), {'phash', 'colorhist'})
+
+        phash = self.analyzer._extract_phash_features(self.video_path)
+        colorhist = self.analyzer._extract_color_histogram_features(self.video_path)
+        self.assertEqual(len(phash), 3)
+        np.testing.assert_array_equal(self.analyzer._decode_feature('phash', features['phash']), phash)
+        np.testing.assert_allclose(self.analyzer._decode_feature('colorhist', features['colorhist']),
+                                   colorhist, atol=colorhist.max() / 255)
+
+    def test_registered_extractor_receives_sampled_frames(self):
+        """Extractors registered later are fed the same sampled frames."""
+        self.analyzer.register_feature_extractor(
+            'brightness', lambda frame: float(frame.mean()), np.float32)
+        features = self.analyzer._extract_video_features(self.video_path)
+        brightness = self.analyzer._decode_feature('brightness', features['brightness'])
+        self.assertEqual(len(brightness), 3)
+
+    def test_batch_phash_matches_per_frame_hash(self):
+        """The batched pHash is bit-identical to the per-frame v1.0 hash."""
+        rng = np.random.default_rng(1)
+        frames = [rng.integers(0, 256, size=(72, 96, 3), dtype=np.uint8) for _ in range(50)]
+        frames += [cv2.GaussianBlur(frame, (9, 9), 4) for frame in frames[:25]]
+        frames.append(np.full((72, 96, 3), 128, dtype=np.uint8))
+
+        expected = np.array([self.analyzer._compute_frame_phash(f) for f in frames], dtype=np.uint64)
+        batched = self.analyzer._compute_phash_batch(
+            [self.analyzer._prepare_phash_frame(f) for f in frames])
+        self.assertEqual(batched.dtype, np.uint64)
+        self.assertTrue(np.array_equal(batched, expected))
+        self.assertEqual(len(self.analyzer._compute_phash_batch([])), 0)
+
+    def test_sampling_modes(self):
+        """Exact modes reproduce sequential decoding; seek samples the same positions."""
+        from frame_sampler import FrameSampler
+
+        sequential = list(FrameSampler(mode='sequential').iter_frames(self.video_path))
+        grabbed = list(FrameSampler(mode='grab').iter_frames(self.video_path))
+        seeked = list(FrameSampler(mode='seek').iter_frames(self.video_path))
+        self.assertEqual(len(sequential), 3)
+        self.assertEqual(len(grabbed), 3)
+        self.assertEqual(len(seeked), 3)
+        for a, b in zip(sequential, grabbed):
+            self.assertTrue(np.array_equal(a, b))
+
+    @unittest.skipUnless(shutil.which('ffmpeg') and shutil.which('ffprobe'), "ffmpeg not available")
+    def test_ffmpeg_pipe_backend(self):
+        """The ffmpeg backend yields downscaled frames at the sample rate."""
+        from frame_sampler import FrameSampler
+
+        sampler = FrameSampler(backend='ffmpeg', frame_size=(48, 32))
+        shapes = [frame.shape for frame in sampler.iter_frames(self.video_path)]
+        self.assertEqual(shapes, [(32, 48, 3)] * 3)
+
+        keyframes = list(FrameSampler(mode='keyframe').iter_frames(self.video_path))
+        self.assertGreater(len(keyframes), 0)
+        self.assertEqual(keyframes[0].shape, (120, 160, 3))
+
+        analyzer = VideoAnalyzer(db_path=self.db_path, decode_backend='ffmpeg')
+        self.assertEqual(analyzer.current_feature_version, 'v1.1-ffmpeg')
+        features = analyzer._extract_video_features(self.video_path)
+        self.assertEqual(len(analyzer._decode_feature('phash', features['phash'])), 3)
+
+    @unittest.skipUnless(shutil.which('ffmpeg') and shutil.which('ffprobe'), "ffmpeg not available")
+    def test_keyframe_mode_follows_rotation(self):
+        """Keyframes of a video rotated by metadata have the autorotated shape OpenCV decodes."""
+        import subprocess
+        from frame_sampler import FrameSampler
+
+        rotated_path = os.path.join(self.temp_dir.name, 'rotated.mp4')
+        result = subprocess.run(['ffmpeg', '-nostdin', '-loglevel', 'error', '-display_rotation', '90',
+                                 '-i', self.video_path, '-c', 'copy', rotated_path])
+        if result.returncode != 0:
+            self.skipTest("ffmpeg does not support -display_rotation")
+
+        expected = next(FrameSampler(mode='grab').iter_frames(rotated_path))
+        keyframe = next(FrameSampler(mode='keyframe').iter_frames(rotated_path))
+        self.assertEqual(expected.shape, (160, 120, 3))
+        self.assertEqual(keyframe.shape, expected.shape)
+        # 步长错误的帧与 OpenCV 解码的帧逐像素相差很大
+        self.assertLess(np.abs(keyframe.astype(np.int16) - expected).mean(), 4)
+
+    @unittest.skipUnless(shutil.which('ffmpeg'), "ffmpeg not available")
+    def test_ffmpeg_pipe_backend_rejects_bad_file(self):
+        """Undecodable files raise ValueError like the OpenCV backend."""
+        from frame_sampler import FrameSampler
+
+        bad_path = os.path.join(self.temp_dir.name, 'bad.mp4')
+        with open(bad_path, 'wb') as f:
+            f.write(b'not a video')
+        with self.assertRaises(ValueError):
+            list(FrameSampler(backend='ffmpeg').iter_frames(bad_path))
+
+    def test_sampling_mode_recorded_in_feature_versions(self):
+        """Non-exact sampling modes get their own feature version and parameters."""
+        import json
+        import sqlite3
+
+        analyzer = VideoAnalyzer(db_path=self.db_path, sampling_mode='seek')
+        self.assertEqual(analyzer.current_feature_version, 'v1.1-seek')
+        # 特征版本在写入第一个分析结果时记录
+        analyzer._process_video_file(Path(self.video_path))
+        self.analyzer._process_video_file(Path(self.video_path))
+
+        conn = sqlite3.connect(self.db_path)
+        rows = dict(conn.execute("SELECT version, parameters FROM feature_versions").fetchall())
+        conn.close()
+        self.assertEqual(json.loads(rows['v1.1'])['sampling_mode'], 'grab')
+        self.assertEqual(json.loads(rows['v1.1-seek'])['sampling_mode'], 'seek')
+        self.assertEqual(json.loads(rows['v1.1'])['transforms'], {'phash': 'delta', 'colorhist': 'uint8'})
+
+class TestFeatureCodec(unittest.TestCase):
+    """Test cases for the self-describing feature codec."""
+
+    def setUp(self):
+        """Create a run of similar frame hashes and color histograms."""
+        rng = np.random.default_rng(4)
+        base = rng.integers(0, 2**63, dtype=np.uint64)
+        flips = rng.integers(0, 64, size=(30, 3)).astype(np.uint64)
+        self.phash = base ^ (np.uint64(1) << flips[:, 0]) ^ (np.uint64(1) << flips[:, 1])
+        hist = rng.random((30, 64), dtype=np.float32)
+        self.hist = hist / np.linalg.norm(hist, axis=1, keepdims=True)
+
+    def test_round_trip(self):
+        """Every transform and compression decodes to the original shape and values."""
+        from feature_codec import encode_feature, decode_feature
+
+        for compression in ('none', 'zlib'):
+            for transform in ('raw', 'delta'):
+                decoded = decode_feature(encode_feature(self.phash, transform, compression), np.float32)
+                self.assertEqual(decoded.dtype, np.uint64)
+                np.testing.assert_array_equal(decoded, self.phash)
+            for transform, atol in (('raw', 0), ('float16', 1e-3), ('uint8', self.hist.max() / 255)):
+                decoded = decode_feature(encode_feature(self.hist, transform, compression), np.uint64)
+                self.assertEqual(decoded.dtype, np.float32)
+                self.assertEqual(decoded.shape, (30, 64))
+                np.testing.assert_allclose(decoded, self.hist, atol=atol)
+
+        empty = decode_feature(encode_feature(np.empty(0, dtype=np.uint64), 'delta'), np.uint64)
+        self.assertEqual(empty.shape, (0,))
+
+    def test_batch_decode_matches_single_decode(self):
+        """decode_features gives the same arrays as decoding mixed blobs one by one."""
+        from feature_codec import encode_feature, decode_feature, decode_features
+
+        blobs = [encode_feature(self.phash[:n], 'delta') for n in (7, 0, 1, 22)]
+        blobs += [self.phash[:5].tobytes(), encode_feature(self.phash, 'raw', 'none')]
+        for expected, decoded in zip([decode_feature(blob, np.uint64) for blob in blobs],
+                                     decode_features(blobs, np.uint64)):
+            self.assertEqual(decoded.shape, expected.shape)
+            np.testing.assert_array_equal(decoded, expected)
+
+        blobs = [encode_feature(self.hist[:n] * n, 'uint8') for n in (3, 30, 1)]
+        blobs += [self.hist.tobytes(), encode_feature(self.hist, 'float16')]
+        for expected, decoded in zip([decode_feature(blob, np.float32) for blob in blobs],
+                                     decode_features(blobs, np.float32)):
+            self.assertEqual(decoded.shape, expected.shape)
+            np.testing.assert_array_equal(decoded, expected)
+
+    def test_legacy_blobs_still_read(self):
+        """Headerless v1.0 blobs are read as raw values of the registered dtype."""
+        from feature_codec import is_encoded
+
+        analyzer = VideoAnalyzer(db_path=':memory:', init_database=False)
+        self.assertFalse(is_encoded(self.phash.tobytes()))
+        np.testing.assert_array_equal(analyzer._decode_feature('phash', self.phash.tobytes()), self.phash)
+        np.testing.assert_array_equal(analyzer._decode_feature('colorhist', self.hist.tobytes()),
+                                      self.hist.reshape(-1))
+
+    def test_encoded_blobs_are_smaller(self):
+        """Delta-coded hashes and quantized histograms take less space than raw bytes."""
+        from feature_codec import encode_feature
+
+        self.assertLess(len(encode_feature(self.phash, 'delta')), len(self.phash.tobytes()) * 0.75)
+        self.assertLess(len(encode_feature(self.hist, 'uint8')), len(self.hist.tobytes()) * 0.3)
+
+class TestSimilarityKernels(unittest.TestCase):
+    """Test cases for the vectorized similarity kernels."""
+
+    def setUp(self):
+        """Create random per-frame features for a few videos."""
+        rng = np.random.default_rng(2)
+        self.phashes = [rng.integers(0, 2**63, size=n, dtype=np.uint64) | np.uint64(1 << 63)
+                        for n in (5, 0, 12, 8, 1)]
+
+    def _reference_phash_similarity(self, phash1, phash2):
+        """The original per-pair Python implementation."""
+        min_len = min(len(phash1), len(phash2))
+        if min_len == 0:
+            return 0.0
+        distances = [bin(int(a) ^ int(b)).count('1') for a, b in zip(phash1[:min_len], phash2[:min_len])]
+        return float(np.mean([1.0 - d / 64.0 for d in distances]))
+
+    def test_popcount_table_matches_bitwise_count(self):
+        """The lookup table fallback counts bits like bin().count('1')."""
+        from similarity import _popcount_table, popcount64
+
+        values = np.concatenate(self.phashes)
+        expected = [bin(int(v)).count('1') for v in values]
+        self.assertEqual(_popcount_table(values).tolist(), expected)
+        self.assertEqual(popcount64(values).tolist(), expected)
+
+    def test_phash_similarity(self):
+        """Pairwise and one-vs-many forms match the original implementation."""
+        from similarity import phash_similarity, phash_similarity_many, pack_sequences
+
+        ref = self.phashes[2]
+        expected = [self._reference_phash_similarity(ref, other) for other in self.phashes]
+        pairwise = [phash_similarity(ref, other) for other in self.phashes]
+        many = phash_similarity_many(ref, self.phashes)
+        values, offsets = pack_sequences(self.phashes)
+        packed = phash_similarity_many(ref, values, offsets)
+
+        np.testing.assert_allclose(pairwise, expected)
+        np.testing.assert_allclose(many, expected)
+        np.testing.assert_allclose(packed, expected)
+        self.assertEqual(many[1], 0.0)
+
+    def test_histogram_similarity(self):
+        """Vectorized histogram intersection matches cv2.compareHist on normalized frames."""
+        from similarity import histogram_similarity, histogram_similarity_many
+
+        rng = np.random.default_rng(3)
+        hists = [rng.random((n, 64), dtype=np.float32) for n in (4, 7, 0, 2)]
+
+        def reference(hist1, hist2):
+            min_len = min(len(hist1), len(hist2))
+            if min_len == 0:
+                return 0.0
+            return float(np.mean([cv2.compareHist((a / a.sum()).reshape(8, 8), (b / b.sum()).reshape(8, 8),
+                                                  cv2.HISTCMP_INTERSECT)
+                                  for a, b in zip(hist1[:min_len], hist2[:min_len])]))
+
+        ref = hists[1]
+        expected = [reference(ref, other) for other in hists]
+        # Features read back from the database are flat float32 arrays
+        pairwise = [histogram_similarity(ref.ravel(), other.ravel()) for other in hists]
+        many = histogram_similarity_many(ref, [h.ravel() for h in hists])
+
+        np.testing.assert_allclose(pairwise, expected, rtol=1e-6)
+        np.testing.assert_allclose(many, expected, rtol=1e-6)
+        self.assertAlmostEqual(histogram_similarity(ref, ref), 1.0, places=6)
+
+    def test_frame_major_histogram_similarity(self):
+        """The frame-major layout gives the same scores as the packed layout."""
+        from similarity import (histogram_similarity_many, histogram_similarity_frame_major,
+                                normalize_histograms, pack_sequences, pack_frame_major)
+
+        rng = np.random.default_rng(4)
+        hists = [rng.random((n, 64), dtype=np.float32) for n in (3, 9, 0, 6, 9, 1)]
+        rows, offsets = pack_sequences([normalize_histograms(h) for h in hists])
+        major_rows, major_offsets, order = pack_frame_major(rows, offsets)
+
+        for ref in (hists[1], hists[0], hists[5]):
+            expected = histogram_similarity_many(ref, hists)
+            actual = histogram_similarity_frame_major(ref, major_rows, major_offsets, order)
+            np.testing.assert_allclose(actual, expected, rtol=1e-6)
+
+    def test_phash_similarity_by_offset_matches_direct(self):
+        """The FFT cross-correlation gives phash_similarity of every offset's overlapping frames."""
+        from similarity import phash_similarity, phash_similarity_by_offset
+
+        for phash1, phash2 in ((self.phashes[2], self.phashes[3]), (self.phashes[4], self.phashes[0]),
+                               (self.phashes[3], self.phashes[3])):
+            offsets, similarities, overlaps = phash_similarity_by_offset(phash1, phash2)
+            self.assertEqual(len(offsets), len(phash1) + len(phash2) - 1)
+            for offset, similarity, overlap in zip(offsets.tolist(), similarities, overlaps):
+                start = max(0, -offset)
+                end = min(len(phash2), len(phash1) - offset)
+                self.assertEqual(overlap, end - start)
+                self.assertAlmostEqual(similarity, phash_similarity(phash1[start + offset:end + offset],
+                                                                    phash2[start:end]), places=12)
+
+    def test_aligned_similarity_finds_trimmed_copy(self):
+        """A trimmed copy scores as a duplicate at its offset while frame i vs frame i does not."""
+        from similarity import video_similarity_aligned, phash_similarity, histogram_similarity
+
+        rng = np.random.default_rng(5)
+        phash = rng.integers(0, 2**63, size=40, dtype=np.uint64)
+        hist = rng.random((40, 64), dtype=np.float32)
+        trimmed_phash, trimmed_hist = phash[7:31] ^ np.uint64(1), hist[7:31]
+
+        truncated = 0.7 * phash_similarity(phash, trimmed_phash) + 0.3 * histogram_similarity(hist, trimmed_hist)
+        score, offset = video_similarity_aligned(phash, hist, trimmed_phash, trimmed_hist)
+        self.assertLess(truncated, 0.7)
+        self.assertEqual(offset, 7)
+        self.assertGreater(score, 0.98)
+        self.assertEqual(video_similarity_aligned(trimmed_phash, trimmed_hist, phash, hist)[1], -7)
+
+        # 未平移的序列在偏移 0 处取得与逐帧比较相同的分数
+        other_phash = rng.integers(0, 2**63, size=25, dtype=np.uint64)
+        other_hist = rng.random((25, 64), dtype=np.float32)
+        score, _ = video_similarity_aligned(phash, hist, other_phash, other_hist)
+        self.assertGreaterEqual(score + 1e-9, 0.7 * phash_similarity(phash, other_phash) +
+                                0.3 * histogram_similarity(hist, other_hist))
+        self.assertEqual(video_similarity_aligned(phash, hist, phash[:0], hist[:0]), (0.0, 0))
+
+class TestFeatureIndexQueries(unittest.TestCase):
+    """Test cases for feature index queries on a synthetic library."""
+
+    def setUp(self):
+        """Store random features for a library with planted near-duplicates."""
+        import sqlite3
+        from datetime import datetime
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.temp_dir.name, 'test.db')
+        self.analyzer = VideoAnalyzer(db_path=self.db_path)
+
+        rng = np.random.default_rng(5)
+        conn = sqlite3.connect(self.db_path)
+        now = datetime.now()
+        for video_id in range(1, 401):
+            if video_id % 10 == 0:
+                # 前一个视频的近似副本：每帧翻转 2 位
+                bits = rng.integers(0, 64, size=(len(phash), 2)).astype(np.uint64)
+                phash = phash ^ (np.uint64(1) << bits[:, 0]) ^ (np.uint64(1) << bits[:, 1])
+                hist = hist + rng.random(hist.shape, dtype=np.float32) * 0.05
+            else:
+                n = int(rng.integers(3, 12))
+                phash = rng.integers(0, 2**63, size=n, dtype=np.uint64)
+                hist = rng.random((n, 64), dtype=np.float32)
+            conn.execute("INSERT INTO video_metadata (id, file_path, analyzed_at) VALUES (?, ?, ?)",
+                         (video_id, f"clip_{video_id}.mp4", now))
+            conn.executemany("INSERT INTO video_features VALUES (?, ?, ?)",
+                             [(video_id, 'phash', phash.tobytes()), (video_id, 'colorhist', hist.tobytes())])
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        """Clean up after tests."""
+        self.temp_dir.cleanup()
+
+    def test_aligned_search_finds_trimmed_copy(self):
+        """Aligned mode finds a copy with its first frames cut off, with and without LSH."""
+        import sqlite3
+        from datetime import datetime
+
+        rng = np.random.default_rng(6)
+        phash = rng.integers(0, 2**63, size=12, dtype=np.uint64)
+        hist = rng.random((12, 64), dtype=np.float32)
+        conn = sqlite3.connect(self.db_path)
+        for video_id, frames in ((500, slice(None)), (501, slice(4, None))):
+            conn.execute("INSERT INTO video_metadata (id, file_path, analyzed_at) VALUES (?, ?, ?)",
+                         (video_id, f"clip_{video_id}.mp4", datetime.now()))
+            conn.executemany("INSERT INTO video_features VALUES (?, ?, ?)",
+                             [(video_id, 'phash', phash[frames].tobytes()),
+                              (video_id, 'colorhist', hist[frames].tobytes())])
+        conn.commit()
+        conn.close()
+
+        self.assertNotIn(501, [vid for vid, _ in self.analyzer.find_similar_videos(500, threshold=0.9)])
+        score, offset = self.analyzer.compare_videos(500, 501)
+        self.assertEqual(offset, 4 * self.analyzer.sample_rate)
+        self.assertAlmostEqual(score, 1.0, places=5)
+
+        for lsh_min_videos in (10**9, 0):
+            self.analyzer.lsh_min_videos = lsh_min_videos
+            similar = self.analyzer.find_similar_videos(500, threshold=0.9, aligned=True)
+            self.assertEqual([(vid, offset) for vid, _, offset in similar], [(501, 4 * self.analyzer.sample_rate)])
+
+    def test_lsh_matches_exhaustive_search(self):
+        """LSH lookups find the same near-duplicates as exhaustive comparison."""
+        self.analyzer.lsh_min_videos = 0
+        self.analyzer.use_similarity_cache = False
+        index = self.analyzer.get_feature_index()
+
+        for video_id in range(9, 400, 10):
+            exact = self.analyzer.find_similar_videos(video_id, threshold=0.8, exhaustive=True)
+            approx = self.analyzer.find_similar_videos(video_id, threshold=0.8)
+            self.assertEqual([vid for vid, _ in approx], [vid for vid, _ in exact])
+            self.assertIn(video_id + 1, [vid for vid, _ in exact])
+            for (_, approx_score), (_, exact_score) in zip(approx, exact):
+                self.assertAlmostEqual(approx_score, exact_score, places=5)
+
+        # 更大的探测半径只会增加候选视频
+        ref_phash, _ = index.get_features(9)
+        narrow = set(index.candidates(ref_phash, probe_radius=0, min_band_hits=2))
+        wide = set(index.candidates(ref_phash, probe_radius=1, min_band_hits=1))
+        self.assertLessEqual(narrow, wide)
+        self.assertLess(len(narrow), len(index))
+
+    def test_feature_snapshot_round_trip(self):
+        """A memory-mapped snapshot answers like a fresh index and follows database changes."""
+        import sqlite3
+        from datetime import datetime
+        from feature_snapshot import read_manifest
+
+        snapshot_dir = os.path.join(self.temp_dir.name, 'snapshot')
+        writer = VideoAnalyzer(db_path=self.db_path, snapshot_dir=snapshot_dir)
+        self.assertTrue(writer.update_feature_snapshot())
+        self.assertFalse(writer.update_feature_snapshot())
+
+        def assert_same_index(index):
+            fresh = VideoAnalyzer(db_path=self.db_path).get_feature_index()
+            np.testing.assert_array_equal(index.video_ids, fresh.video_ids)
+            for video_id in (9, 10, 200):
+                self.assertEqual(index.find_similar(video_id, 0.6), fresh.find_similar(video_id, 0.6))
+                np.testing.assert_array_equal(index.get_features(video_id)[1], fresh.get_features(video_id)[1])
+            self.assertEqual(index.select_dissimilar(list(range(1, 401)), 50, 0.8),
+                             fresh.select_dissimilar(list(range(1, 401)), 50, 0.8))
+
+        reader = VideoAnalyzer(db_path=self.db_path, snapshot_dir=snapshot_dir)
+        index = reader.get_feature_index()
+        self.assertIsInstance(index.colorhist_rows, np.memmap)
+        assert_same_index(index)
+
+        # 删除一个视频并修改另一个视频后，读取方增量更新，写入方生成新一代快照
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("DELETE FROM video_features WHERE video_id = 123")
+        conn.execute("DELETE FROM video_metadata WHERE id = 123")
+        phash = conn.execute("SELECT feature_data FROM video_features "
+                             "WHERE video_id = 55 AND feature_type = 'phash'").fetchone()[0]
+        conn.execute("UPDATE video_features SET feature_data = ? WHERE video_id = 10 AND feature_type = 'phash'",
+                     (phash,))
+        conn.execute("UPDATE video_metadata SET analyzed_at = ? WHERE id = 10", (datetime.now(),))
+        conn.commit()
+        conn.close()
+
+        old_generation = read_manifest(snapshot_dir)['generation']
+        self.assertTrue(index.refresh())
+        self.assertNotIn(123, index)
+        self.assertIn(10, [vid for vid, _ in index.find_similar(55, 0.6)])
+        self.assertTrue(writer.update_feature_snapshot())
+        manifest = read_manifest(snapshot_dir)
+        self.assertGreater(manifest['generation'], old_generation)
+        self.assertEqual(sorted(os.listdir(snapshot_dir)), sorted(['snapshot.json', manifest['path']]))
+
+        reloaded = VideoAnalyzer(db_path=self.db_path, snapshot_dir=snapshot_dir).get_feature_index()
+        self.assertEqual(reloaded.generation, manifest['generation'])
+        self.assertNotIn(123, reloaded)
+        assert_same_index(reloaded)
+
+    def test_similarity_cache_matches_feature_index(self):
+        """Cached similarity rows give the exhaustive results and follow re-analysis."""
+        import sqlite3
+        from datetime import datetime
+        from similarity_cache import SimilarityCache
+
+        def assert_matches_exhaustive(analyzer, video_id):
+            reference = VideoAnalyzer(db_path=self.db_path)
+            reference.use_similarity_cache = False
+            expected = reference.find_similar_videos(video_id, threshold=0.6, exhaustive=True)
+            actual = analyzer.find_similar_videos(video_id, threshold=0.6)
+            self.assertEqual([vid for vid, _ in actual], [vid for vid, _ in expected])
+            np.testing.assert_allclose([score for _, score in actual], [score for _, score in expected])
+
+        query_ids = [9, 10, 55, 200]
+        for video_id in query_ids:
+            assert_matches_exhaustive(self.analyzer, video_id)
+
+        # 缓存完整时不再加载原始特征
+        cached = VideoAnalyzer(db_path=self.db_path)
+        for video_id in query_ids:
+            assert_matches_exhaustive(cached, video_id)
+        self.assertIsNone(cached.feature_index)
+
+        # 视频 10 重新分析为视频 55 的副本
+        conn = sqlite3.connect(self.db_path)
+        feature = conn.execute("SELECT feature_data FROM video_features WHERE video_id = 55 AND feature_type = 'phash'")
+        phash = feature.fetchone()[0]
+        SimilarityCache.invalidate(conn.cursor(), 10)
+        conn.execute("UPDATE video_features SET feature_data = ? WHERE video_id = 10 AND feature_type = 'phash'",
+                     (phash,))
+        conn.execute("UPDATE video_metadata SET analyzed_at = ? WHERE id = 10", (datetime.now(),))
+        conn.commit()
+        conn.close()
+
+        for video_id in query_ids:
+            assert_matches_exhaustive(cached, video_id)
+        self.assertIn(10, [vid for vid, _ in cached.find_similar_videos(55, threshold=0.6)])
+
+    def test_select_dissimilar_matches_greedy_scan(self):
+        """Dissimilar selection picks the same videos as the original greedy loop."""
+        from similarity import phash_similarity, histogram_similarity
+
+        index = self.analyzer.get_feature_index()
+        order = [int(vid) for vid in np.random.default_rng(6).permutation(index.video_ids)]
+        features = {vid: (self.analyzer.get_video_feature(vid, 'phash'),
+                          self.analyzer.get_video_feature(vid, 'colorhist')) for vid in order}
+
+        def score(vid1, vid2):
+            (phash1, hist1), (phash2, hist2) = features[vid1], features[vid2]
+            return 0.7 * phash_similarity(phash1, phash2) + 0.3 * histogram_similarity(hist1, hist2)
+
+        for threshold in (0.8, 0.55):
+            expected = [order[0]]
+            for candidate in order[1:]:
+                if len(expected) >= 40:
+                    break
+                if all(score(selected, candidate) < threshold for selected in expected):
+                    expected.append(candidate)
+            self.assertEqual(index.select_dissimilar(order, 40, threshold), expected)
+
+        videos = self.analyzer.get_random_dissimilar_videos(count=5, similarity_threshold=0.8)
+        self.assertEqual(len(videos), 5)
+        self.assertEqual(len({video['id'] for video in videos}), 5)
+
+class TestDatabase(unittest.TestCase):
+    """Test cases for the managed database connections."""
+
+    def setUp(self):
+        """Create an analyzer on a temporary database."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.temp_dir.name, 'test.db')
+        self.analyzer = VideoAnalyzer(db_path=self.db_path)
+
+    def tearDown(self):
+        """Clean up after tests."""
+        self.analyzer.db.close()
+        self.temp_dir.cleanup()
+
+    def test_connection_per_thread(self):
+        """Each thread reuses one WAL connection."""
+        import threading
+
+        db = self.analyzer.db
+        conn = db.connection()
+        self.assertIs(db.connection(), conn)
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], 'wal')
+
+        other = []
+        thread = threading.Thread(target=lambda: other.append(db.connection()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], conn)
+
+    def test_reader_not_blocked_by_pending_write(self):
+        """Readers see the last committed state while a write transaction is open."""
+        from database import Database
+
+        with self.analyzer.db.transaction() as cursor:
+            cursor.execute("INSERT INTO video_metadata (file_path, duration) VALUES ('a.mp4', 5.0)")
+            # 另一个连接(如合成器进程)在写事务进行中仍可读取
+            reader = Database(self.db_path, busy_timeout=0.1)
+            count = reader.connection().execute("SELECT COUNT(*) FROM video_metadata").fetchone()[0]
+            reader.close()
+        self.assertEqual(count, 0)
+        self.assertEqual(len(self.analyzer.get_random_videos(5)), 1)
+
+    def test_old_schema_is_migrated(self):
+        """Databases created before the fingerprint columns get them added."""
+        import sqlite3
+
+        db_path = os.path.join(self.temp_dir.name, 'old.db')
+        conn = sqlite3.connect(db_path)
+        conn.execute('''
+        CREATE TABLE video_metadata (
+            id INTEGER PRIMARY KEY, file_path TEXT UNIQUE, duration REAL, resolution TEXT,
+            file_size INTEGER, last_modified TIMESTAMP, feature_version TEXT, analyzed_at TIMESTAMP
+        )
+        ''')
+        conn.execute("INSERT INTO video_metadata (file_path, duration, resolution) VALUES ('a.mp4', 5.0, '1080x1920')")
+        conn.commit()
+        conn.close()
+
+        from video_analyzer import FEATURES_FAILED
+
+        analyzer = VideoAnalyzer(db_path=db_path)
+        columns = {row[1] for row in analyzer.db.connection().execute("PRAGMA table_info(video_metadata)")}
+        self.assertTrue({'fingerprint', 'alias_of', 'fps', 'codec', 'bitrate', 'features_ready', 'width',
+                         'height', 'aspect_ratio', 'has_audio', 'keyframe_interval'} <= columns)
+        self.assertEqual(len(analyzer.get_random_videos(5)), 1)
+        metadata = analyzer.get_video_metadata(1)
+        # 旧库中没有特征的视频记为特征提取失败，不会被当作待提取
+        self.assertEqual(metadata['features_ready'], FEATURES_FAILED)
+        # 宽高从分辨率字符串中解析
+        self.assertEqual((metadata['width'], metadata['height']), (1080, 1920))
+        self.assertAlmostEqual(metadata['aspect_ratio'], 0.5625)
+        analyzer.db.close()
+
+    def test_query_candidates(self):
+        """Metadata filters are answered in SQL through the typed column indexes."""
+        rows = [
+            ('landscape.mp4', 12.0, 1920, 1080, 'h264'),
+            ('portrait.mp4', 8.0, 1080, 1920, 'h264'),
+            ('square.mov', 20.0, 720, 720, 'mjpeg'),
+            ('small.mp4', 3.0, 320, 240, 'h264'),
+        ]
+        with self.analyzer.db.transaction() as cursor:
+            cursor.executemany('''
+            INSERT INTO video_metadata (file_path, duration, resolution, width, height, aspect_ratio, codec)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', [(os.path.join(self.temp_dir.name, 'videos', name), duration, f"{width}x{height}", width,
+                   height, width / height, codec) for name, duration, width, height, codec in rows])
+            cursor.execute("INSERT INTO video_metadata (file_path, duration, height, codec, alias_of) "
+                           "VALUES ('copy.mp4', 12.0, 1080, 'h264', 1)")
+
+        def names(**filters):
+            videos = self.analyzer.query_candidates(fields=('file_path',), **filters)
+            return sorted(os.path.basename(video['file_path']) for video in videos)
+
+        self.assertEqual(names(), ['landscape.mp4', 'portrait.mp4', 'small.mp4', 'square.mov'])
+        self.assertEqual(names(aspect_range=(0.0, 1.0)), ['portrait.mp4', 'square.mov'])
+        self.assertEqual(names(min_duration=5.0, max_duration=15.0), ['landscape.mp4', 'portrait.mp4'])
+        self.assertEqual(names(min_height=720, codec='h264'), ['landscape.mp4', 'portrait.mp4'])
+        self.assertEqual(len(names(codec='h264', limit=2)), 2)
+        self.assertEqual(names(directory=os.path.join(self.temp_dir.name, 'videos'), max_duration=10.0),
+                         ['portrait.mp4', 'small.mp4'])
+        self.assertEqual(self.analyzer.query_candidates(aspect_range=(1.7, 1.8))[0]['width'], 1920)
+        with self.assertRaises(ValueError):
+            self.analyzer.query_candidates(fields=('id', 'secret'))
+
+        # 选片使用同样的筛选条件
+        videos = self.analyzer.get_random_dissimilar_videos(10, aspect_range=(0.0, 1.0))
+        self.assertEqual(sorted(os.path.basename(video['file_path']) for video in videos),
+                         ['portrait.mp4', 'square.mov'])
+
+        plan = ' '.join(row[-1] for row in self.analyzer.db.connection().execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM video_metadata WHERE alias_of IS NULL AND aspect_ratio BETWEEN 0 AND 1"))
+        self.assertIn('idx_video_metadata_aspect_ratio', plan)
+
+    def test_transaction_rolls_back_on_error(self):
+        """A failing transaction leaves no partial writes."""
+        with self.assertRaises(RuntimeError):
+            with self.analyzer.db.transaction() as cursor:
+                cursor.execute("INSERT INTO video_metadata (file_path, duration) VALUES ('a.mp4', 5.0)")
+                raise RuntimeError("boom")
+        self.assertEqual(self.analyzer.get_random_videos(5), [])
+
+    def test_schema_initialized_once(self):
+        """Opening a database already at the current schema version writes nothing."""
+        from video_analyzer import SCHEMA_VERSION
+
+        conn = self.analyzer.db.connection()
+        self.assertEqual(conn.execute("PRAGMA user_version").fetchone()[0], SCHEMA_VERSION)
+        analyzer = VideoAnalyzer(db_path=self.db_path)
+        self.assertEqual(analyzer.db.connection().total_changes, 0)
+        analyzer.db.close()
+
+    def test_imports_have_no_side_effects(self):
+        """Importing the modules configures no logging and loads neither OpenCV nor ffmpeg."""
+        import sys
+        import subprocess
+
+        code = ("import sys, logging, video_audio_sync, video_composer, video_analyzer; "
+                "print(sorted({'cv2', 'ffmpeg', 'moviepy'} & set(sys.modules)), len(logging.getLogger().handlers))")
+        with tempfile.TemporaryDirectory() as cwd:
+            output = subprocess.run([sys.executable, '-c', code], cwd=cwd, capture_output=True, text=True,
+                                    env=dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__))),
+                                    check=True).stdout
+            self.assertEqual(output.split(), ['[]', '0'])
+            self.assertEqual(os.listdir(cwd), [])
+
+def _chi_square_limit(degrees: int, z: float = 3.09) -> float:
+    """Upper p=0.001 quantile of the chi-square distribution (Wilson-Hilferty approximation)."""
+    return degrees * (1 - 2 / (9 * degrees) + z * (2 / (9 * degrees)) ** 0.5) ** 3
+
+
+class TestLibrarySampler(unittest.TestCase):
+    """Test cases for the indexed random sampling of video_metadata rows."""
+
+    def setUp(self):
+        """Create an analyzer on a temporary database with a seeded sampler."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.analyzer = VideoAnalyzer(db_path=os.path.join(self.temp_dir.name, 'test.db'))
+        self.analyzer.sampler.rng = np.random.default_rng(7)
+
+    def tearDown(self):
+        """Clean up after tests."""
+        self.analyzer.db.close()
+        self.temp_dir.cleanup()
+
+    def _insert(self, rows):
+        """Insert (duration, codec) rows, returning their IDs."""
+        with self.analyzer.db.transaction() as cursor:
+            cursor.executemany("INSERT INTO video_metadata (file_path, duration, codec) VALUES (?, ?, ?)",
+                               [(f"clip_{i:05d}.mp4", duration, codec) for i, (duration, codec) in enumerate(rows)])
+            cursor.execute("SELECT id FROM video_metadata ORDER BY id")
+            return [row[0] for row in cursor.fetchall()]
+
+    def _assert_counts_fit(self, counts, expected):
+        """Chi-square goodness of fit of observed counts to expected counts."""
+        chi_square = sum((counts.get(key, 0) - value) ** 2 / value for key, value in expected.items())
+        self.assertEqual(set(counts) - set(expected), set())
+        self.assertLess(chi_square, _chi_square_limit(len(expected) - 1))
+
+    def test_uniform_sampling(self):
+        """Every matching row is equally likely despite deleted IDs, aliases and filtered rows."""
+        ids = self._insert([(1.0 + i % 10, 'h264') for i in range(300)])
+        with self.analyzer.db.transaction() as cursor:
+            # 删除的行在 ID 范围中留下空洞，包括最大的 ID
+            cursor.executemany("DELETE FROM video_metadata WHERE id = ?", [(i,) for i in ids[::7] + ids[-3:]])
+            cursor.executemany("UPDATE video_metadata SET alias_of = 1 WHERE id = ?", [(i,) for i in ids[5::11]])
+            cursor.execute("SELECT id FROM video_metadata WHERE alias_of IS NULL AND duration >= 3.0")
+            eligible = [row[0] for row in cursor.fetchall()]
+
+        counts = {}
+        for _ in range(1000):
+            videos = self.analyzer.get_random_videos(5, min_duration=3.0)
+            self.assertEqual(len({video['id'] for video in videos}), 5)
+            for video in videos:
+                counts[video['id']] = counts.get(video['id'], 0) + 1
+        self._assert_counts_fit(counts, {video_id: 5000 / len(eligible) for video_id in eligible})
+
+    def test_selective_filter_reads_remaining_rows(self):
+        """A filter matching few rows still returns each of them, uniformly and without repeats."""
+        from video_analyzer import _candidate_filter
+
+        self._insert([(5.0, 'vp9' if i % 250 == 0 else 'h264') for i in range(2000)])
+        where, params = _candidate_filter(codec='vp9')
+        self.assertEqual(len(set(self.analyzer.sampler.sample(20, where, params, ('id',)))), 8)
+
+        counts = {}
+        for _ in range(400):
+            (video_id,), = self.analyzer.sampler.sample(1, where, params, ('id',))
+            counts[video_id] = counts.get(video_id, 0) + 1
+        self._assert_counts_fit(counts, {video_id: 50.0 for video_id in range(1, 2001, 250)})
+
+    def test_weighted_sampling(self):
+        """Weighted draws follow the duration, or the inverse of the use count."""
+        from video_analyzer import _candidate_filter
+
+        ids = self._insert([(float(duration), 'h264') for duration in range(1, 7)])
+        where, params = _candidate_filter()
+
+        def first_draws(weighting, draws=3000):
+            counts = {}
+            for _ in range(draws):
+                (video_id,), = self.analyzer.sampler.sample(1, where, params, ('id',), weighting)
+                counts[video_id] = counts.get(video_id, 0) + 1
+            return counts
+
+        self._assert_counts_fit(first_draws('duration'),
+                                {video_id: 3000 * duration / 21 for video_id, duration in zip(ids, range(1, 7))})
+
+        self.analyzer.record_usage(ids[:3] + ids[:1])
+        weights = [1 / 3, 1 / 2, 1 / 2, 1, 1, 1]
+        self._assert_counts_fit(first_draws('inverse_usage'),
+                                {video_id: 3000 * weight / sum(weights) for video_id, weight in zip(ids, weights)})
+
+        # 不放回：加权抽样也会依次返回全部匹配行
+        self.assertEqual(sorted(row[0] for row in self.analyzer.sampler.sample(10, where, params, ('id',),
+                                                                               'duration')), ids)
+        with self.assertRaises(ValueError):
+            self.analyzer.sampler.sample(1, where, params, ('id',), 'popularity')
+
+
+class TestLibraryRescan(unittest.TestCase):
+    """Test cases for diffing a library directory against the database."""
+
+    def setUp(self):
+        """Store rows for unchanged, modified and deleted files."""
+        from datetime import datetime
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.temp_dir.name, 'test.db')
+        self.video_dir = os.path.join(self.temp_dir.name, 'videos')
+        os.makedirs(self.video_dir)
+        self.analyzer = VideoAnalyzer(db_path=self.db_path)
+
+        paths = {}
+        for name in ('same.mp4', 'modified.mp4', 'new.mp4'):
+            paths[name] = os.path.join(self.video_dir, name)
+            with open(paths[name], 'wb') as f:
+                f.write(b'not a video')
+        paths['deleted.mp4'] = os.path.join(self.video_dir, 'deleted.mp4')
+        paths['elsewhere.mp4'] = os.path.join(self.temp_dir.name, 'elsewhere.mp4')
+
+        version = self.analyzer.current_feature_version
+        mtime = datetime.fromtimestamp(os.stat(paths['same.mp4']).st_mtime).isoformat()
+        with self.analyzer.db.transaction() as cursor:
+            for name, file_size in (('same.mp4', 11), ('modified.mp4', 5),
+                                    ('deleted.mp4', 11), ('elsewhere.mp4', 11)):
+                cursor.execute('''
+                INSERT INTO video_metadata (file_path, duration, file_size, last_modified,
+                                            feature_version, analyzed_at)
+                VALUES (?, 5.0, ?, ?, ?, ?)
+                ''', (paths[name], file_size, mtime, version, mtime))
+                cursor.execute("INSERT INTO video_features VALUES (?, 'phash', ?)",
+                               (cursor.lastrowid, b'\0' * 8))
+                cursor.execute("INSERT INTO video_similarity (video_id, feature_version) VALUES (?, ?)",
+                               (cursor.lastrowid, version))
+        self.ids = dict(self.analyzer.db.connection().execute(
+            "SELECT file_path, id FROM video_metadata").fetchall())
+        self.paths = paths
+
+    def tearDown(self):
+        """Clean up after tests."""
+        self.analyzer.db.close()
+        self.temp_dir.cleanup()
+
+    def test_plan_library(self):
+        """Only new and modified files are planned; missing files are reported."""
+        files = self.analyzer._find_video_files(Path(self.video_dir))
+        plans, up_to_date, failed, missing = self.analyzer._plan_library(Path(self.video_dir), files)
+        self.assertEqual(sorted(plan['name'] for plan in plans), ['modified.mp4', 'new.mp4'])
+        self.assertEqual(up_to_date, 1)
+        self.assertEqual(failed, 0)
+        self.assertEqual(missing, [self.ids[self.paths['deleted.mp4']]])
+
+    def _listed_directories(self):
+        """Record the directories listed with os.scandir from now on."""
+        from unittest import mock
+
+        listed = []
+        scandir = os.scandir
+
+        def counting(path='.'):
+            if isinstance(path, str) and path.startswith(self.video_dir):
+                listed.append(os.path.relpath(path, self.video_dir))
+            return scandir(path)
+
+        patcher = mock.patch('os.scandir', counting)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return listed
+
+    def test_walker_reuses_unchanged_directory_listings(self):
+        """Directories whose mtime did not change are not listed again; their files are still stat'ed."""
+        import time
+
+        os.makedirs(os.path.join(self.video_dir, 'sub'))
+        with open(os.path.join(self.video_dir, 'sub', 'nested.mov'), 'wb') as f:
+            f.write(b'not a video')
+        with open(os.path.join(self.video_dir, 'notes.txt'), 'w') as f:
+            f.write('not a video')
+        past = time.time() - 60
+        for path in (self.video_dir, os.path.join(self.video_dir, 'sub')):
+            os.utime(path, (past, past))
+        listed = self._listed_directories()
+
+        first = dict(self.analyzer._find_video_files(Path(self.video_dir)))
+        self.assertEqual(sorted(os.path.relpath(path, self.video_dir) for path in first),
+                         ['modified.mp4', 'new.mp4', 'same.mp4', os.path.join('sub', 'nested.mov')])
+        self.assertEqual(sorted(listed), ['.', 'sub'])
+
+        del listed[:]
+        second = dict(self.analyzer._find_video_files(Path(self.video_dir)))
+        self.assertEqual(listed, [])
+        self.assertEqual({path: file_stats.st_size for path, file_stats in second.items()},
+                         {path: file_stats.st_size for path, file_stats in first.items()})
+
+        # 原地覆盖的文件不改变目录的修改时间，仍按新的大小重新分析
+        with open(self.paths['same.mp4'], 'wb') as f:
+            f.write(b'rewritten in place')
+        os.utime(self.video_dir, (past, past))
+        files = self.analyzer._find_video_files(Path(self.video_dir))
+        self.assertEqual(listed, [])
+        plans = self.analyzer._plan_library(Path(self.video_dir), files)[0]
+        self.assertIn('same.mp4', [plan['name'] for plan in plans])
+
+        # 子目录新增文件后只重新列出该子目录
+        with open(os.path.join(self.video_dir, 'sub', 'added.mkv'), 'wb') as f:
+            f.write(b'not a video')
+        third = dict(self.analyzer._find_video_files(Path(self.video_dir)))
+        self.assertEqual(len(third), 5)
+        self.assertEqual(listed, ['sub'])
+
+        # 删除的子目录从目录缓存中移除
+        shutil.rmtree(os.path.join(self.video_dir, 'sub'))
+        os.utime(self.video_dir, (past + 1, past + 1))
+        self.assertEqual(len(self.analyzer._find_video_files(Path(self.video_dir))), 3)
+        cached = [path for (path,) in self.analyzer.db.connection().execute(
+            "SELECT path FROM directory_state").fetchall()]
+        self.assertEqual(cached, [str(Path(self.video_dir).absolute())])
+
+    def test_rescan_purges_deleted_files(self):
+        """A rescan removes every row of deleted files under the directory only."""
+        self.analyzer.scan_video_library(self.video_dir, rescan=True)
+        conn = self.analyzer.db.connection()
+        deleted_id = self.ids[self.paths['deleted.mp4']]
+        for table, column in (('video_metadata', 'id'), ('video_features', 'video_id'),
+                              ('video_similarity', 'video_id')):
+            self.assertEqual(conn.execute(f"SELECT COUNT(*) FROM {table} WHERE {column} = ?",
+                                          (deleted_id,)).fetchone()[0], 0)
+        self.assertIn(self.paths['elsewhere.mp4'],
+                      {video['file_path'] for video in self.analyzer.get_random_videos(10)})
+
+class TestLibraryWatcher(unittest.TestCase):
+    """Test cases for keeping the database in sync with a watched directory."""
+
+    def setUp(self):
+        """Create a watched directory with one analysed file."""
+        import time
+        from library_watcher import LibraryWatcher
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.video_dir = os.path.join(self.temp_dir.name, 'videos')
+        os.makedirs(self.video_dir)
+        self.analyzer = VideoAnalyzer(db_path=os.path.join(self.temp_dir.name, 'test.db'))
+        self.processed = []
+        self.analyzer._process_video_file = lambda file_path: self.processed.append(str(file_path))
+
+        self.existing = self._write('existing.mp4')
+        with self.analyzer.db.transaction() as cursor:
+            cursor.execute("INSERT INTO video_metadata (file_path, duration) VALUES (?, 5.0)", (self.existing,))
+        self.watcher = LibraryWatcher(self.analyzer, self.video_dir, debounce=0.0, use_polling=True)
+        self.past = time.time() - 60
+
+    def tearDown(self):
+        """Clean up after tests."""
+        self.analyzer.db.close()
+        self.temp_dir.cleanup()
+
+    def _write(self, name, age=60):
+        """Create a file whose mtime is `age` seconds in the past."""
+        import time
+
+        path = os.path.join(self.video_dir, name)
+        with open(path, 'wb') as f:
+            f.write(b'not a video')
+        os.utime(path, (time.time() - age, time.time() - age))
+        return path
+
+    def _stored_paths(self):
+        return {video['file_path'] for video in self.analyzer.get_random_videos(10)}
+
+    def test_polling_detects_added_changed_and_deleted_files(self):
+        """Each poll queues the files that differ from the previous poll."""
+        self.watcher.poll_once()
+        self.assertEqual(self.watcher.process_ready(), 0)
+
+        added = self._write('added.mov')
+        os.remove(self.existing)
+        self.watcher.poll_once()
+        self.assertEqual(self.watcher.process_ready(), 2)
+        self.assertEqual(self.processed, [added])
+        self.assertEqual(self._stored_paths(), set())
+
+        self._write('added.mov', age=30)
+        self.watcher.poll_once()
+        self.watcher.process_ready()
+        self.assertEqual(self.processed, [added, added])
+
+    def test_debounce_and_moves(self):
+        """A moved file is purged at its old path and processed at the new one once it settles."""
+        moved = os.path.join(self.video_dir, 'moved.mp4')
+        os.rename(self.existing, moved)
+        self.watcher.debounce = 60
+        self.watcher._on_event('moved', self.existing, moved, False)
+        self.watcher._on_event('modified', self.video_dir, None, True)
+        self.watcher._on_event('created', os.path.join(self.video_dir, 'notes.txt'), None, False)
+        self.assertEqual(self.watcher.process_ready(), 0)
+
+        self.watcher.debounce = 0.0
+        self.assertEqual(self.watcher.process_ready(), 2)
+        self.assertEqual(self.processed, [moved])
+        self.assertEqual(self._stored_paths(), set())
+
+    def test_new_directory_queues_its_files(self):
+        """Files inside a directory that appeared in one event are all processed."""
+        os.makedirs(os.path.join(self.video_dir, 'batch'))
+        clips = sorted(self._write(os.path.join('batch', f'clip_{i}.mkv')) for i in range(3))
+        self.watcher._on_event('created', os.path.join(self.video_dir, 'batch'), None, True)
+        self.watcher.process_ready()
+        self.watcher.process_ready()
+        self.assertEqual(sorted(self.processed), clips)
+
+    @unittest.skipUnless(shutil.which('ffprobe'), "ffprobe not available")
+    def test_modified_file_is_reindexed(self):
+        """A video rewritten in place gets new features through the real _process_video_file."""
+        import time
+
+        del self.analyzer._process_video_file
+        path = make_test_video(os.path.join(self.video_dir, 'clip.avi'), seed=0)
+        os.utime(path, (self.past, self.past))
+        self.analyzer._process_video_file(Path(path))
+
+        def stored_phash():
+            conn = self.analyzer.db.connection()
+            return conn.execute('''
+            SELECT f.feature_data FROM video_metadata m JOIN video_features f ON f.video_id = m.id
+            WHERE m.file_path = ? AND f.feature_type = 'phash'
+            ''', (str(Path(path).absolute()),)).fetchone()[0]
+
+        before = stored_phash()
+        # 目录修改时间早于 MTIME_SETTLE_SECONDS，轮询复用缓存的目录列表
+        os.utime(self.video_dir, (self.past, self.past))
+        self.watcher.poll_once()
+        self.watcher.poll_once()
+        self.assertEqual(self.watcher.process_ready(), 0)
+
+        make_test_video(path, seed=9)
+        # 修改时间早于去抖时间，无需等待；目录修改时间保持不变
+        os.utime(path, (time.time() - 30, time.time() - 30))
+        os.utime(self.video_dir, (self.past, self.past))
+        self.watcher.poll_once()
+        self.assertEqual(self.watcher.process_ready(), 1)
+        self.assertNotEqual(stored_phash(), before)
+
+@unittest.skipUnless(shutil.which('ffprobe'), "ffprobe not available")
+class TestLibraryScan(unittest.TestCase):
+    """Test cases for scanning a video library."""
+
+    def setUp(self):
+        """Create a temporary library with a few synthetic videos."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.temp_dir.name, 'test.db')
+        self.video_dir = os.path.join(self.temp_dir.name, 'videos')
+        os.makedirs(os.path.join(self.video_dir, 'sub'))
+        for i in range(4):
+            subdir = 'sub' if i % 2 else ''
+            make_test_video(os.path.join(self.video_dir, subdir, f'clip_{i}.avi'), seed=i)
+        self.analyzer = VideoAnalyzer(db_path=self.db_path)
+
+    def tearDown(self):
+        """Clean up after tests."""
+        self.temp_dir.cleanup()
+
+    def _feature_rows(self, db_path):
+        import sqlite3
+        conn = sqlite3.connect(db_path)
+        rows = conn.execute('''
+        SELECT m.file_path, f.feature_type, f.feature_data
+        FROM video_metadata m JOIN video_features f ON f.video_id = m.id
+        ''').fetchall()
+        conn.close()
+        return {(path, feature_type): data for path, feature_type, data in rows}
+
+    def test_parallel_scan_matches_serial_scan(self):
+        """A parallel scan stores the same features as a serial one."""
+        count = self.analyzer.scan_video_library(self.video_dir, workers=2)
+        self.assertEqual(count, 4)
+
+        serial_db = os.path.join(self.temp_dir.name, 'serial.db')
+        self.assertEqual(VideoAnalyzer(db_path=serial_db).scan_video_library(self.video_dir), 4)
+        self.assertEqual(self._feature_rows(self.db_path), self._feature_rows(serial_db))
+
+    def test_find_similar_videos(self):
+        """A byte-identical copy is found with similarity 1.0; other clips are scored lower."""
+        shutil.copy(os.path.join(self.video_dir, 'clip_0.avi'), os.path.join(self.video_dir, 'copy.avi'))
+        self.analyzer.scan_video_library(self.video_dir)
+
+        import sqlite3
+        conn = sqlite3.connect(self.db_path)
+        ids = {os.path.basename(path): vid for vid, path in
+               conn.execute("SELECT id, file_path FROM video_metadata").fetchall()}
+        conn.close()
+
+        similar = self.analyzer.find_similar_videos(ids['clip_0.avi'], threshold=0.0)
+        self.assertEqual(len(similar), 4)
+        self.assertEqual(similar[0][0], ids['copy.avi'])
+        self.assertAlmostEqual(similar[0][1], 1.0)
+        self.assertLess(similar[1][1], 1.0)
+
+    def test_feature_index_matches_pairwise_similarity(self):
+        """The feature index scores match the pairwise kernels and follow library changes."""
+        self.analyzer.scan_video_library(self.video_dir)
+        index = self.analyzer.get_feature_index()
+        self.assertEqual(len(index), 4)
+
+        ref_id = int(index.video_ids[0])
+        ref_phash = self.analyzer.get_video_feature(ref_id, 'phash')
+        ref_hist = self.analyzer.get_video_feature(ref_id, 'colorhist')
+        expected = {}
+        for vid in index.video_ids[1:]:
+            vid = int(vid)
+            expected[vid] = (
+                0.7 * self.analyzer._calculate_phash_similarity(
+                    ref_phash, self.analyzer.get_video_feature(vid, 'phash')) +
+                0.3 * self.analyzer._calculate_histogram_similarity(
+                    ref_hist, self.analyzer.get_video_feature(vid, 'colorhist')))
+        for vid, score in self.analyzer.find_similar_videos(ref_id, threshold=0.0):
+            self.assertAlmostEqual(score, expected[vid], places=5)
+
+        # 删除一个视频后索引应同步移除
+        import sqlite3
+        removed_id = int(index.video_ids[-1])
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("DELETE FROM video_features WHERE video_id = ?", (removed_id,))
+        conn.execute("DELETE FROM video_metadata WHERE id = ?", (removed_id,))
+        conn.commit()
+        conn.close()
+        self.assertIs(self.analyzer.get_feature_index(), index)
+        self.assertNotIn(removed_id, index)
+        self.assertEqual(len(index), 3)
+
+    def test_parallel_scan_survives_bad_file(self):
+        """A file that cannot be analysed does not stop the scan."""
+        with open(os.path.join(self.video_dir, 'broken.mp4'), 'wb') as f:
+            f.write(b'not a video')
+        count = self.analyzer.scan_video_library(self.video_dir, workers=2)
+        self.assertEqual(count, 4)
+
+    def _count_analyses(self):
+        """Record the files the analyzer decodes from now on."""
+        analysed = []
+        analyze = self.analyzer._analyze_video_file
+
+        def counting(file_path, *args, **kwargs):
+            analysed.append(file_path)
+            return analyze(file_path, *args, **kwargs)
+
+        self.analyzer._analyze_video_file = counting
+        return analysed
+
+    def test_moved_files_keep_their_rows(self):
+        """Renaming a folder re-points its rows instead of decoding the files again."""
+        self.analyzer.scan_video_library(self.video_dir)
+        before = self._feature_rows(self.db_path)
+        ids = {video['file_path']: video['id'] for video in self.analyzer.get_random_videos(10)}
+        analysed = self._count_analyses()
+
+        os.rename(os.path.join(self.video_dir, 'sub'), os.path.join(self.video_dir, 'renamed'))
+        self.assertEqual(self.analyzer.scan_video_library(self.video_dir, rescan=True), 4)
+        self.assertEqual(analysed, [])
+
+        after = self._feature_rows(self.db_path)
+        self.assertEqual(sorted(after.values()), sorted(before.values()))
+        moved = {video['file_path']: video['id'] for video in self.analyzer.get_random_videos(10)}
+        self.assertEqual(sorted(moved.values()), sorted(ids.values()))
+        self.assertEqual(ids[str(Path(self.video_dir, 'sub', 'clip_1.avi').absolute())],
+                         moved[str(Path(self.video_dir, 'renamed', 'clip_1.avi').absolute())])
+
+    def test_duplicate_file_is_alias(self):
+        """A byte-identical copy is recorded as an alias and takes over when the original goes."""
+        self.analyzer.scan_video_library(self.video_dir)
+        original = str(Path(self.video_dir, 'clip_0.avi').absolute())
+        copy = str(Path(self.video_dir, 'copy.avi').absolute())
+        shutil.copyfile(original, copy)
+        analysed = self._count_analyses()
+
+        self.assertEqual(self.analyzer.scan_video_library(self.video_dir), 5)
+        self.assertEqual(analysed, [])
+        conn = self.analyzer.db.connection()
+        original_id = conn.execute("SELECT id FROM video_metadata WHERE file_path = ?", (original,)).fetchone()[0]
+        self.assertEqual(conn.execute("SELECT alias_of FROM video_metadata WHERE file_path = ?",
+                                      (copy,)).fetchone()[0], original_id)
+        self.assertEqual(len(self.analyzer.get_random_videos(10)), 4)
+
+        os.remove(original)
+        self.assertEqual(self.analyzer.scan_video_library(self.video_dir, rescan=True), 4)
+        self.assertEqual(analysed, [])
+        self.assertEqual(self.analyzer.get_video_metadata(original_id)['file_path'], copy)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM video_metadata").fetchone()[0], 4)
+
+    def test_rescan_reanalyses_modified_file(self):
+        """A file whose modification time changed is analysed again."""
+        self.analyzer.scan_video_library(self.video_dir)
+        path = os.path.join(self.video_dir, 'clip_0.avi')
+        before = self._feature_rows(self.db_path)
+        stat = os.stat(path)
+        os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+        make_test_video(path, seed=9)
+        os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+
+        self.assertEqual(self.analyzer.scan_video_library(self.video_dir, rescan=True), 4)
+        after = self._feature_rows(self.db_path)
+        key = (str(Path(path).absolute()), 'phash')
+        self.assertNotEqual(before[key], after[key])
+
+    def test_process_video_file_reanalyses_modified_file(self):
+        """A single file modified in place is analysed again, not trusted from its row."""
+        self.analyzer.scan_video_library(self.video_dir)
+        path = os.path.join(self.video_dir, 'clip_0.avi')
+        before = self._feature_rows(self.db_path)
+        stat = os.stat(path)
+        make_test_video(path, seed=9)
+        os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+        analysed = self._count_analyses()
+
+        self.analyzer._process_video_file(Path(path))
+        self.assertEqual(len(analysed), 1)
+        after = self._feature_rows(self.db_path)
+        key = (str(Path(path).absolute()), 'phash')
+        self.assertNotEqual(before[key], after[key])
+
+        # 未修改的文件仍然跳过
+        self.analyzer._process_video_file(Path(path))
+        self.assertEqual(len(analysed), 1)
+
+    def test_two_phase_scan(self):
+        """A metadata-only scan makes every file selectable before its features are extracted."""
+        from video_analyzer import FEATURES_PENDING, FEATURES_READY
+
+        self.assertEqual(self.analyzer.scan_video_library(self.video_dir, features=False), 4)
+        self.assertEqual(self._feature_rows(self.db_path), {})
+        videos = self.analyzer.get_random_videos(10)
+        metadata = self.analyzer.get_video_metadata(videos[0]['id'])
+        self.assertEqual(metadata['features_ready'], FEATURES_PENDING)
+        self.assertAlmostEqual(metadata['fps'], 10.0)
+        self.assertEqual(metadata['codec'], 'mjpeg')
+        self.assertGreater(metadata['bitrate'], 0)
+        self.assertEqual((metadata['width'], metadata['height']), (160, 120))
+        self.assertAlmostEqual(metadata['aspect_ratio'], 160 / 120)
+        self.assertFalse(metadata['has_audio'])
+        # MJPEG 的每一帧都是关键帧
+        self.assertAlmostEqual(metadata['keyframe_interval'], 0.1, places=3)
+        self.assertEqual(self.analyzer.stats()['counters']['probed_files'], 4)
+
+        # 没有特征时按元数据去重：四个视频分辨率和时长相同，只选出一个
+        self.assertEqual(len(self.analyzer.get_feature_index()), 0)
+        self.assertEqual(len(self.analyzer.get_random_dissimilar_videos(10, similarity_threshold=0.99)), 1)
+
+        backfill = self.analyzer.start_feature_backfill(self.video_dir)
+        backfill.join()
+        self.assertEqual(len(self._feature_rows(self.db_path)), 8)
+        self.assertEqual({self.analyzer.get_video_metadata(video['id'])['features_ready'] for video in videos},
+                         {FEATURES_READY})
+        self.assertEqual(len(self.analyzer.get_feature_index()), 4)
+        self.assertEqual(len(self.analyzer.get_random_dissimilar_videos(10, similarity_threshold=0.99)), 4)
+
+        # 特征相同的完整扫描结果
+        serial_db = os.path.join(self.temp_dir.name, 'serial.db')
+        self.assertEqual(VideoAnalyzer(db_path=serial_db).scan_video_library(self.video_dir), 4)
+        self.assertEqual(self._feature_rows(self.db_path), self._feature_rows(serial_db))
+        self.assertEqual(self.analyzer.extract_pending_features(), 0)
+
+    def test_scan_stats(self):
+        """A parallel scan reports per-stage timings and counters of every analysed file."""
+        self.analyzer.scan_video_library(self.video_dir, workers=2)
+        stats = self.analyzer.stats()
+        for stage in ('fingerprint', 'probe', 'open', 'decode', 'compute.phash',
+                      'compute.colorhist', 'serialize', 'db_write'):
+            self.assertEqual(stats['stages'][stage]['count'], 4)
+            entry = stats['stages'][stage]
+            self.assertTrue(0 <= entry['p50'] <= entry['p90'] <= entry['p99'] <= entry['max'])
+        self.assertEqual(stats['counters']['files'], 4)
+        self.assertEqual(stats['counters']['frames'], 12)
+        self.assertEqual(stats['counters']['input_bytes'],
+                         sum(os.path.getsize(path) for path in Path(self.video_dir).rglob('*.avi')))
+
+        stats_path = os.path.join(self.temp_dir.name, 'stats.json')
+        self.analyzer.scan_stats.write_json(stats_path)
+        import json
+        with open(stats_path, encoding='utf-8') as f:
+            self.assertEqual(json.load(f), stats)
+        self.assertIn('compute.phash', self.analyzer.scan_stats.format_table())
+
+        # 没有需要分析的文件时，新的扫描从空统计开始
+        self.analyzer.scan_video_library(self.video_dir)
+        self.assertEqual(self.analyzer.stats()['stages'], {})
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
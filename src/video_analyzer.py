@@ -1,75 +1,249 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import os
 import time
+import json
 import sqlite3
 import hashlib
 import logging
+import threading
+from collections import deque
+from itertools import islice
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict, Tuple, Optional, Any
+from typing import List, Dict, Tuple, Optional, Any, Callable, Iterator, Sequence
 
-import cv2
 import numpy as np
-import ffmpeg
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('video_analyzer.log', encoding='utf-8')
-    ]
-)
-logger = logging.getLogger('video_analyzer')
+# cv2 和 ffmpeg 在用到的函数中才导入，导入本模块和只读取数据库时不加载 OpenCV
+
+from frame_sampler import FrameSampler, SAMPLING_MODES, EXACT_SAMPLING_MODES, DECODE_BACKENDS
+from similarity import (phash_similarity, phash_similarity_many,
+                        histogram_similarity, histogram_similarity_many, video_similarity_aligned,
+                        PHASH_WEIGHT, COLORHIST_WEIGHT)
+from database import Database
+from feature_codec import TRANSFORMS, encode_feature, decode_feature, decode_features
+from feature_index import FeatureIndex
+from feature_snapshot import read_manifest
+from library_sampler import LibrarySampler
+from library_walker import DirectoryCache, walk_video_files
+from logging_setup import configure_logging, set_debug_logging
+from scan_stats import ScanStats
+from similarity_cache import SimilarityCache
 
-# 设置更详细的日志级别用于调试
-def set_debug_logging():
-    """启用调试级别的日志记录"""
-    logger.setLevel(logging.DEBUG)
-    # 确保所有处理器也设置为DEBUG级别
-    for handler in logger.handlers:
-        handler.setLevel(logging.DEBUG)
-    # 同时设置根日志记录器
-    logging.getLogger().setLevel(logging.DEBUG)
-    # 添加一条调试消息以验证调试模式已启用
-    logger.debug("调试日志级别已设置 - 这条消息只有在调试模式下才会显示")
+logger = logging.getLogger('video_analyzer')
 
 # Define supported video formats
 SUPPORTED_VIDEO_FORMATS = ['.mp4', '.mov', '.avi', '.mkv', '.wmv', '.flv']
 
+# 数据库结构版本，记录在 PRAGMA user_version 中；结构变化时加一
+SCHEMA_VERSION = 4
+
+# video_metadata.features_ready 的取值：扫描第一阶段只写入元数据 (待提取)，第二阶段写入特征
+FEATURES_PENDING = 0
+FEATURES_READY = 1
+FEATURES_FAILED = 2  # 特征提取失败，只有元数据
+
+# 扫描第一阶段由 ffprobe 得到并写入 video_metadata 的列
+PROBED_COLUMNS = ('duration', 'resolution', 'width', 'height', 'aspect_ratio', 'fps', 'codec', 'bitrate',
+                  'has_audio', 'keyframe_interval')
+# get_video_metadata() 和 query_candidates() 返回的字段
+METADATA_FIELDS = ('id', 'file_path') + PROBED_COLUMNS + ('file_size', 'last_modified', 'features_ready')
+
+# 内容指纹读取文件开头、中间和结尾各一块的大小
+FINGERPRINT_CHUNK_SIZE = 2 * 1024 * 1024
+
+
+def content_fingerprint(file_path: str, file_size: int, chunk_size: int = FINGERPRINT_CHUNK_SIZE) -> str:
+    """
+    Cheap content identity of a file: its size plus a hash of its first,
+    middle and last chunk_size bytes (the whole file when it is smaller than
+    three chunks).
+
+    Returns:
+        String "<size>:<blake2b hex digest>"
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        if file_size <= 3 * chunk_size:
+            digest.update(f.read())
+        else:
+            for offset in (0, (file_size - chunk_size) // 2, file_size - chunk_size):
+                f.seek(offset)
+                digest.update(f.read(chunk_size))
+    return f"{file_size}:{digest.hexdigest()}"
+
+def _path_range(directory: Path) -> Tuple[str, str]:
+    """Bounds (inclusive, exclusive) of the file paths under a directory."""
+    prefix = str(directory.absolute())
+    if not prefix.endswith(os.sep):
+        prefix += os.sep
+    # file_path 上有唯一索引，前缀匹配改写为范围查询
+    return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+def _parse_ratio(value: Optional[str], separator: str = '/') -> Optional[float]:
+    """Value of an ffprobe ratio such as frame rate "30000/1001" or aspect "4:3"; None if unknown."""
+    try:
+        numerator, _, denominator = (value or '').partition(separator)
+        ratio = float(numerator) / float(denominator or 1)
+    except (ValueError, ZeroDivisionError):
+        return None
+    return ratio if ratio > 0 else None
+
+def _stream_rotation(video_stream: Dict[str, Any]) -> int:
+    """Display rotation of a video stream in degrees (0, 90, 180 or 270)."""
+    rotation = video_stream.get('tags', {}).get('rotate')
+    for side_data in video_stream.get('side_data_list', []):
+        if 'rotation' in side_data:
+            rotation = side_data['rotation']
+    try:
+        return int(float(rotation or 0)) % 360
+    except ValueError:
+        return 0
+
+def _keyframe_interval(packets: List[Dict[str, Any]], stream_index: int) -> Optional[float]:
+    """Mean seconds between the keyframe packets of a stream; None with fewer than two keyframes."""
+    times = []
+    for packet in packets:
+        if packet.get('stream_index') == stream_index and packet.get('flags', '').startswith('K'):
+            try:
+                times.append(float(packet['pts_time']))
+            except (KeyError, ValueError):
+                continue
+    if len(times) < 2:
+        return None
+    times.sort()
+    return (times[-1] - times[0]) / (len(times) - 1)
+
+def _candidate_filter(min_duration: float = 0.0, max_duration: float = float('inf'),
+                      aspect_range: Optional[Tuple[float, float]] = None, min_height: Optional[int] = None,
+                      codec: Optional[str] = None, directory: Optional[str] = None) -> Tuple[str, List[Any]]:
+    """WHERE clause and parameters selecting the non-alias videos that match the filters."""
+    conditions = ['alias_of IS NULL']
+    params: List[Any] = []
+    if min_duration > 0:
+        conditions.append('duration >= ?')
+        params.append(min_duration)
+    if max_duration != float('inf'):
+        conditions.append('duration <= ?')
+        params.append(max_duration)
+    if aspect_range is not None:
+        conditions.append('aspect_ratio BETWEEN ? AND ?')
+        params.extend(aspect_range)
+    if min_height is not None:
+        conditions.append('height >= ?')
+        params.append(min_height)
+    if codec is not None:
+        conditions.append('codec = ?')
+        params.append(codec)
+    if directory is not None:
+        conditions.append('file_path >= ? AND file_path < ?')
+        params.extend(_path_range(Path(directory)))
+    return ' AND '.join(conditions), params
+
 class VideoAnalyzer:
     """Video analysis module for scanning and extracting features from video files."""
     
-    def __init__(self, db_path: str = 'video_library.db'):
+    def __init__(self, db_path: str = 'video_library.db', sampling_mode: str = 'grab',
+                 decode_backend: str = 'opencv', init_database: bool = True,
+                 snapshot_dir: Optional[str] = None):
         """
         Initialize the VideoAnalyzer with a database path.
 
         Args:
             db_path: Path to the SQLite database file
+            sampling_mode: Frame sampling mode, one of frame_sampler.SAMPLING_MODES
+            decode_backend: Frame decode backend, one of frame_sampler.DECODE_BACKENDS
+            init_database: Create or upgrade the tables on startup, once per
+                database file (see SCHEMA_VERSION); scan worker processes never
+                touch the database and pass False
+            snapshot_dir: Directory of the memory-mapped feature snapshot; the
+                feature index is loaded from it and it is updated after scans
         """
         logger.info(f"初始化 VideoAnalyzer，数据库路径: {db_path}")
+        if sampling_mode not in SAMPLING_MODES:
+            raise ValueError(f"Unknown sampling mode: {sampling_mode}")
+        if decode_backend not in DECODE_BACKENDS:
+            raise ValueError(f"Unknown decode backend: {decode_backend}")
         self.db_path = db_path
-        self.current_feature_version = "v1.0"  # Update this when feature extraction algorithm changes
+        self.db = Database(db_path)  # One long-lived WAL connection per thread
+        # Update this when feature extraction or the stored representation changes
+        # (v1.1: colorhist stored quantized to uint8)
+        self.current_feature_version = "v1.1"
+        self.sample_rate = 1  # Sample one frame every N seconds
+        self.sampling_mode = sampling_mode
+        self.decode_backend = decode_backend
+        self.decode_frame_size = (64, 64)  # Frame size produced by the ffmpeg backend
+        self.write_batch_size = 50  # Commit scan results every N files
+        self.probe_workers = 8  # ffprobe threads of the metadata phase of a scan
+        self.keyframe_probe_seconds = 20  # Keyframe interval is measured over the first N seconds of packets
+        self.feature_index: Optional[FeatureIndex] = None  # Loaded on first similarity query
+        self.snapshot_dir = snapshot_dir
+        self.lsh_bands = 4  # Split each frame hash into N keys for LSH lookups
+        self.lsh_probe_radius = 1  # Recall/speed knob: also probe keys within N bits of each band key
+        self.lsh_min_band_hits = 2  # Minimum (frame, band) hits for a video to be scored
+        self.lsh_min_videos = 5000  # Below this library size exhaustive comparison is used
+        self.similarity_cache = SimilarityCache(self, floor=0.5)  # Pair scores >= floor are persisted
+        self.sampler = LibrarySampler(self.db)  # Random candidate rows without ORDER BY RANDOM()
+        self.use_similarity_cache = True
+        self.feature_compression = 'zlib'  # Feature blob compression, one of feature_codec.COMPRESSIONS
+        self.scan_stats = ScanStats()  # Per-file stage timings of the current scan, see stats()
+        self._feature_version_registered = False  # feature_versions row written with the first result
+
+        # 非精确采样模式和 ffmpeg 缩放解码得到的帧与逐帧解码不同，使用独立的特征版本，避免与默认版本的数据混用
+        if sampling_mode not in EXACT_SAMPLING_MODES:
+            self.current_feature_version += f"-{sampling_mode}"
+        if decode_backend != 'opencv':
+            self.current_feature_version += f"-{decode_backend}"
+        self.feature_parameters = {
+            'sample_rate': self.sample_rate,
+            'sampling_mode': self.sampling_mode,
+            'decode_backend': self.decode_backend
+        }
+        if decode_backend == 'ffmpeg':
+            self.feature_parameters['frame_size'] = list(self.decode_frame_size)
+
+        # 特征提取器注册表: 特征类型 -> (逐帧计算函数, 数据类型, 整段视频的汇总函数)
+        self.feature_extractors: Dict[str, Tuple[Callable[[np.ndarray], Any], Any,
+                                                 Optional[Callable[[List[Any]], np.ndarray]]]] = {}
+        # 特征类型 -> 存储时的编码变换 (feature_codec.TRANSFORMS)
+        self.feature_transforms: Dict[str, str] = {}
+        self.register_feature_extractor('phash', self._prepare_phash_frame, np.uint64,
+                                        finalize=self._compute_phash_batch, transform='delta')
+        self.register_feature_extractor('colorhist', self._compute_frame_color_histogram, np.float32,
+                                        transform='uint8')
+        # 存储变换(如量化)会改变读出的特征值，与采样参数一起记录
+        self.feature_parameters['transforms'] = self.feature_transforms
 
         # 记录配置信息
-        logger.info(f"特征版本: {self.current_feature_version}")
+        logger.info(f"特征版本: {self.current_feature_version}, 采样模式: {self.sampling_mode}, "
+                    f"解码后端: {self.decode_backend}")
         logger.info(f"支持的视频格式: {', '.join(SUPPORTED_VIDEO_FORMATS)}")
 
         # 初始化数据库
-        start_time = time.time()
-        self._init_database()
-        init_time = time.time() - start_time
-        logger.info(f"数据库初始化完成，耗时: {init_time:.2f}秒")
+        if init_database:
+            start_time = time.time()
+            self._init_database()
+            init_time = time.time() - start_time
+            logger.info(f"数据库初始化完成，耗时: {init_time:.2f}秒")
         
     def _init_database(self):
-        """Initialize the SQLite database with required tables."""
+        """
+        Initialize the SQLite database with required tables.
+
+        The schema version is kept in PRAGMA user_version: a database already
+        at SCHEMA_VERSION is only checked with that one pragma, so opening an
+        existing library costs no table creation or write transaction.
+        """
         logger.debug(f"连接数据库: {self.db_path}")
 
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.db.connection()
             cursor = conn.cursor()
+            user_version = cursor.execute("PRAGMA user_version").fetchone()[0]
+            if user_version >= SCHEMA_VERSION:
+                logger.debug(f"数据库结构已是最新 (版本 {user_version})")
+                return
 
             # Create video_metadata table
             logger.debug("创建 video_metadata 表")
@@ -82,10 +256,68 @@ class VideoAnalyzer:
                 file_size INTEGER,
                 last_modified TIMESTAMP,
                 feature_version TEXT,
-                analyzed_at TIMESTAMP
+                analyzed_at TIMESTAMP,
+                fingerprint TEXT,
+                alias_of INTEGER,
+                fps REAL,
+                codec TEXT,
+                bitrate INTEGER,
+                features_ready INTEGER NOT NULL DEFAULT 1,
+                width INTEGER,
+                height INTEGER,
+                aspect_ratio REAL,
+                has_audio INTEGER,
+                keyframe_interval REAL,
+                use_count INTEGER NOT NULL DEFAULT 0
             )
             ''')
 
+            # 旧数据库补充内容指纹、别名、ffprobe 元数据和特征状态列；
+            # 直接写入元数据和特征的行(如旧版本写入的行)默认视为特征已就绪
+            cursor.execute("PRAGMA table_info(video_metadata)")
+            columns = {row[1] for row in cursor.fetchall()}
+            for column, column_type in (('fingerprint', 'TEXT'), ('alias_of', 'INTEGER'),
+                                        ('fps', 'REAL'), ('codec', 'TEXT'), ('bitrate', 'INTEGER'),
+                                        ('features_ready', 'INTEGER NOT NULL DEFAULT 1'),
+                                        ('width', 'INTEGER'), ('height', 'INTEGER'), ('aspect_ratio', 'REAL'),
+                                        ('has_audio', 'INTEGER'), ('keyframe_interval', 'REAL'),
+                                        ('use_count', 'INTEGER NOT NULL DEFAULT 0')):
+                if column not in columns:
+                    logger.info(f"为 video_metadata 表添加 {column} 列")
+                    cursor.execute(f"ALTER TABLE video_metadata ADD COLUMN {column} {column_type}")
+            if 'width' not in columns:
+                # 旧记录的宽高和宽高比从 "宽x高" 字符串中解析；有无音轨和关键帧间隔在重新探测前未知
+                cursor.execute('''
+                UPDATE video_metadata
+                SET width = CAST(substr(resolution, 1, instr(resolution, 'x') - 1) AS INTEGER),
+                    height = CAST(substr(resolution, instr(resolution, 'x') + 1) AS INTEGER)
+                WHERE instr(resolution, 'x') > 0
+                ''')
+                cursor.execute("UPDATE video_metadata SET aspect_ratio = CAST(width AS REAL) / height "
+                               "WHERE height > 0")
+
+            # 扫描第二阶段查找特征待提取的视频
+            cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_video_metadata_features_ready
+            ON video_metadata (features_ready)
+            ''')
+
+            # query_candidates() 的筛选条件：时长、宽高比、高度、编码和帧率，以及加权抽样的权重上界
+            # (LibrarySampler)。选片总是排除别名，部分索引只包含非别名记录，筛选时不必再逐行回表检查 alias_of
+            for name, index_columns in (('duration', 'duration'), ('aspect_ratio', 'aspect_ratio, duration'),
+                                        ('height', 'height'), ('codec', 'codec, duration'), ('fps', 'fps'),
+                                        ('use_count', 'use_count')):
+                cursor.execute(f'''
+                CREATE INDEX IF NOT EXISTS idx_video_metadata_{name}
+                ON video_metadata ({index_columns}) WHERE alias_of IS NULL
+                ''')
+
+            # 按内容指纹查找移动或重复的文件
+            cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_video_metadata_fingerprint
+            ON video_metadata (fingerprint)
+            ''')
+
             # Create video_features table
             logger.debug("创建 video_features 表")
             cursor.execute('''
@@ -98,6 +330,53 @@ class VideoAnalyzer:
             )
             ''')
 
+            # 特征索引通过 MAX(analyzed_at) 检测库变化
+            cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_video_metadata_analyzed_at
+            ON video_metadata (analyzed_at)
+            ''')
+
+            # 特征代数：video_features 的每次写入或删除都由触发器加一，特征索引和快照据此判断是否过期
+            logger.debug("创建 feature_generation 表")
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS feature_generation (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                generation INTEGER NOT NULL
+            )
+            ''')
+            cursor.execute("INSERT OR IGNORE INTO feature_generation (id, generation) VALUES (0, 0)")
+            for event in ('INSERT', 'UPDATE', 'DELETE'):
+                cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS video_features_{event.lower()}_generation
+                AFTER {event} ON video_features
+                BEGIN
+                    UPDATE feature_generation SET generation = generation + 1 WHERE id = 0;
+                END
+                ''')
+
+            # 相似度缓存：每个视频一行，保存不低于下限的相似视频 ID 和分数(按分数降序)
+            logger.debug("创建 video_similarity 表")
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS video_similarity (
+                video_id INTEGER PRIMARY KEY,
+                feature_version TEXT,
+                computed_at TIMESTAMP,
+                neighbour_ids BLOB,
+                scores BLOB
+            )
+            ''')
+
+            # 目录列表缓存：目录修改时间未变时复用其中的视频文件名和子目录名
+            logger.debug("创建 directory_state 表")
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS directory_state (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER,
+                files TEXT,
+                subdirs TEXT
+            )
+            ''')
+
             # Create feature_versions table
             logger.debug("创建 feature_versions 表")
             cursor.execute('''
@@ -109,38 +388,57 @@ class VideoAnalyzer:
             )
             ''')
 
-            # Insert current feature version if not exists
-            logger.debug(f"插入特征版本记录: {self.current_feature_version}")
-            cursor.execute('''
-            INSERT OR IGNORE INTO feature_versions (version, algorithm, parameters, created_at)
-            VALUES (?, ?, ?, ?)
-            ''', (self.current_feature_version, "phash+colorhist", "default", datetime.now()))
-
-            # 检查现有数据统计
-            cursor.execute("SELECT COUNT(*) FROM video_metadata")
-            video_count = cursor.fetchone()[0]
-            logger.info(f"数据库中现有视频记录数: {video_count}")
+            if 'features_ready' not in columns:
+                # 旧版本中特征提取失败的视频只有元数据
+                cursor.execute('''
+                UPDATE video_metadata SET features_ready = ?
+                WHERE NOT EXISTS (SELECT 1 FROM video_features WHERE video_id = COALESCE(alias_of, id))
+                ''', (FEATURES_FAILED,))
 
+            cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
             conn.commit()
-            conn.close()
-            logger.debug("数据库连接已关闭")
+            logger.info(f"数据库结构已更新到版本 {SCHEMA_VERSION}")
 
         except sqlite3.Error as e:
             logger.error(f"数据库初始化失败: {e}")
             raise
         
-    def scan_video_library(self, directory_path: str) -> int:
+    def scan_video_library(self, directory_path: str, workers: int = 1, rescan: bool = False,
+                           features: bool = True) -> int:
         """
         Scan a directory for video files and extract features.
 
+        The stored state of every file under the directory is loaded in one
+        query and diffed against the filesystem; only new files, files whose
+        size or modification time changed and files analysed with another
+        feature version are processed. Directories whose mtime did not change
+        since the last scan are not listed again; their files are still
+        stat'ed, so files rewritten in place are picked up.
+
+        The scan runs in two phases. Phase 1 probes the files with ffprobe in
+        a thread pool and stores their metadata (duration, resolution, fps,
+        codec, bitrate) with features_ready = FEATURES_PENDING; such rows can
+        already be selected for composition. Phase 2 decodes the pending
+        files and stores their features (see extract_pending_features()).
+
         Args:
             directory_path: Path to the directory containing video files
+            workers: Number of worker processes for decoding and feature
+                extraction; 1 processes files in the current process
+            rescan: List every directory, and purge the rows and features
+                of files under the directory that no longer exist
+            features: Run phase 2 before returning; False returns after
+                phase 1 and leaves the features to extract_pending_features()
+                or start_feature_backfill()
+
+        Per-file stage timings of the scan are available from stats() afterwards.
 
         Returns:
             Number of videos processed
         """
         start_time = time.time()
         logger.info(f"开始扫描视频库: {directory_path}")
+        self.scan_stats = ScanStats()
 
         directory = Path(directory_path)
         if not directory.exists():
@@ -149,173 +447,928 @@ class VideoAnalyzer:
 
         # 首先查找所有视频文件
         logger.info("正在查找视频文件...")
-        video_files = self._find_video_files(directory)
+        video_files = self._find_video_files(directory, reuse_listings=not rescan)
         total_files = len(video_files)
         logger.info(f"找到 {total_files} 个视频文件")
 
+        plans, count, failed_count, missing = self._plan_library(directory, video_files)
+        if rescan and missing:
+            self._purge_videos(missing)
+
         if total_files == 0:
             logger.warning(f"在目录 {directory_path} 中未找到任何支持的视频文件")
+            self.update_feature_snapshot()
             return 0
 
-        # 处理视频文件
+        logger.info(f"需要分析 {len(plans)} 个视频文件，{count} 个已是最新")
+        if plans:
+            stored, failed = self._probe_library(plans, start_time)
+            count += stored
+            failed_count += failed
+            self._update_query_statistics()
+        logger.info(f"元数据扫描完成！成功处理 {count} 个视频，失败 {failed_count} 个，"
+                    f"耗时 {time.time() - start_time:.2f}秒")
+
+        if features:
+            self.extract_pending_features(directory_path, workers=workers)
+
+        total_time = time.time() - start_time
+        logger.info(f"扫描完成！成功处理 {count} 个视频，失败 {failed_count} 个，总耗时 {total_time:.2f}秒")
+
+        if failed_count > 0:
+            logger.warning(f"有 {failed_count} 个文件处理失败，请检查日志获取详细信息")
+        if self.scan_stats.timings:
+            logger.info(f"各阶段耗时统计 (毫秒):\n{self.scan_stats.format_table()}")
+
+        self.update_feature_snapshot()
+        return count
+
+    def _update_query_statistics(self):
+        """
+        Refresh the planner statistics (sqlite_stat1) of video_metadata.
+
+        Without them SQLite guesses which filter index is most selective and
+        may scan the duration index for a query that the aspect ratio index
+        answers in a fraction of the rows.
+        """
+        conn = self.db.connection()
+        # analysis_limit 限制每个索引抽查的行数，百万条记录也只需几十毫秒
+        conn.execute("PRAGMA analysis_limit = 400")
+        conn.execute("ANALYZE video_metadata")
+        conn.commit()
+
+    def extract_pending_features(self, directory_path: Optional[str] = None, workers: int = 1) -> int:
+        """
+        Phase 2 of a scan: decode the videos whose metadata is stored but
+        whose features are still pending, and store their features.
+
+        Files that cannot be decoded are marked FEATURES_FAILED; files that
+        fail unexpectedly (e.g. removed since phase 1) stay pending.
+
+        Args:
+            directory_path: Only process videos under this directory; None
+                processes the whole library
+            workers: Number of worker processes for decoding and feature
+                extraction; 1 processes files in the current process
+
+        Returns:
+            Number of videos whose features were stored
+        """
+        start_time = time.time()
+        plans = self._load_pending_plans(Path(directory_path) if directory_path else None)
+        if not plans:
+            return 0
+
+        logger.info(f"开始提取 {len(plans)} 个视频的特征")
+        if workers > 1:
+            stored, failed = self._scan_parallel(plans, workers, start_time)
+        else:
+            stored, failed = self._scan_serial(plans, start_time)
+        logger.info(f"特征提取完成！成功 {stored} 个，失败 {failed} 个，耗时 {time.time() - start_time:.2f}秒")
+        return stored
+
+    def start_feature_backfill(self, directory_path: Optional[str] = None, workers: int = 1) -> threading.Thread:
+        """
+        Run extract_pending_features() in a background thread.
+
+        The thread uses its own database connection; composition can select
+        the metadata-only rows meanwhile. The thread does not touch the
+        in-memory feature index, which follows the new features on its next
+        refresh; call update_feature_snapshot() after join() to save them.
+
+        Returns:
+            The started thread; join() it to wait for the features
+        """
+        def backfill():
+            try:
+                self.extract_pending_features(directory_path, workers=workers)
+                logger.info("后台特征提取完成")
+            except Exception as e:
+                logger.error(f"后台特征提取失败: {e}")
+            finally:
+                self.db.close()
+
+        thread = threading.Thread(target=backfill, name='feature-backfill')
+        thread.start()
+        return thread
+
+    def _plan_library(self, directory: Path,
+                      video_files: List[Tuple[str, Optional[os.stat_result]]]) -> Tuple[List[Dict[str, Any]], int, int, List[int]]:
+        """
+        Diff the files found under a directory against their stored state.
+
+        Returns:
+            Tuple (plans, up_to_date, failed, missing): plans of the files that
+            need analysis, the number of unchanged files, the number of files
+            that could not be read and the IDs of stored videos under the
+            directory whose files no longer exist
+        """
+        cursor = self.db.connection().cursor()
+        known = self._load_known_files(cursor, directory)
+        logger.debug(f"数据库中该目录下有 {len(known)} 个视频记录")
+
+        plans = []
+        up_to_date = 0
+        failed = 0
+        unfingerprinted = []
+        for file_path, file_stats in video_files:
+            row = known.pop(file_path, None)
+            try:
+                plan = self._make_plan(file_path, row, file_stats)
+            except Exception as e:
+                failed += 1
+                logger.error(f"处理文件失败 {file_path}: {e}")
+                continue
+            if plan['up_to_date']:
+                up_to_date += 1
+                if row[4] is None:
+                    unfingerprinted.append(plan)
+            else:
+                plans.append(plan)
+
+        # 剩下的记录在文件系统中已不存在
+        missing = [row[0] for row in known.values()]
+
+        with self.db.transaction() as cursor:
+            # 新路径的文件可能是移动过来的或已有文件的副本，按内容指纹匹配已有记录
+            self._resolve_by_fingerprint(cursor, plans)
+            if unfingerprinted:
+                logger.info(f"为 {len(unfingerprinted)} 个已分析的视频补充内容指纹")
+                self._set_fingerprints(cursor, unfingerprinted)
+
+        resolved = [plan for plan in plans if plan['up_to_date']]
+        plans = [plan for plan in plans if not plan['up_to_date']]
+        repointed = {plan['video_id'] for plan in resolved} | {plan['video_id'] for plan in plans}
+        missing = [video_id for video_id in missing if video_id not in repointed]
+        if missing:
+            logger.info(f"有 {len(missing)} 个已分析的视频文件不存在")
+        return plans, up_to_date + len(resolved), failed, missing
+
+    def _set_fingerprints(self, cursor: sqlite3.Cursor, plans: List[Dict[str, Any]]):
+        """
+        Compute and store the content fingerprints of up-to-date videos
+        analysed before fingerprints existed.
+
+        The caller owns the transaction and commits.
+        """
+        rows = []
+        for plan in plans:
+            try:
+                rows.append((content_fingerprint(plan['file_path'], plan['file_size']), plan['video_id']))
+            except OSError as e:
+                logger.warning(f"无法计算内容指纹 {plan['file_path']}: {e}")
+        cursor.executemany("UPDATE video_metadata SET fingerprint = ? WHERE id = ?", rows)
+
+    def _resolve_by_fingerprint(self, cursor: sqlite3.Cursor, plans: List[Dict[str, Any]]):
+        """
+        Match files that need analysis to stored videos with the same content.
+
+        Every plan gets a 'fingerprint'. For a file at a new path, a stored
+        video with the same fingerprint whose file no longer exists is
+        re-pointed to the new path, keeping its features; if that video's
+        file still exists the new file is recorded as its alias. Resolved
+        plans get the video_id and 'up_to_date' set; a re-pointed video with
+        an old feature version keeps up_to_date False and is re-analysed in
+        place.
+
+        The caller owns the transaction and commits.
+        """
+        for plan in plans:
+            fingerprint_start = time.perf_counter()
+            try:
+                plan['fingerprint'] = content_fingerprint(plan['file_path'], plan['file_size'])
+            except OSError as e:
+                logger.warning(f"无法计算内容指纹 {plan['file_path']}: {e}")
+                plan['fingerprint'] = None
+            else:
+                self.scan_stats.record('fingerprint', time.perf_counter() - fingerprint_start)
+                self.scan_stats.count('fingerprint_bytes', min(plan['file_size'], 3 * FINGERPRINT_CHUNK_SIZE))
+
+        new_plans = [plan for plan in plans if plan['video_id'] is None and plan['fingerprint']]
+        if not new_plans:
+            return
+
+        # 指纹 -> 已有的非别名记录 (id, file_path, feature_version)
+        candidates: Dict[str, List[Tuple[int, str, Optional[str]]]] = {}
+        fingerprints = sorted({plan['fingerprint'] for plan in new_plans})
+        for start in range(0, len(fingerprints), 900):
+            chunk = fingerprints[start:start + 900]
+            cursor.execute(f'''
+            SELECT fingerprint, id, file_path, feature_version
+            FROM video_metadata
+            WHERE fingerprint IN ({','.join('?' * len(chunk))}) AND alias_of IS NULL
+            ''', chunk)
+            for fingerprint, video_id, file_path, feature_version in cursor.fetchall():
+                candidates.setdefault(fingerprint, []).append((video_id, file_path, feature_version))
+
+        moved = aliased = 0
+        for plan in new_plans:
+            matches = candidates.get(plan['fingerprint'])
+            if not matches:
+                continue
+            gone = [match for match in matches if not os.path.exists(match[1])]
+            if gone:
+                video_id, old_path, feature_version = gone[0]
+                logger.info(f"文件已移动，沿用原有记录: {old_path} -> {plan['file_path']}")
+                cursor.execute('''
+                UPDATE video_metadata SET file_path = ?, file_size = ?, last_modified = ?
+                WHERE id = ?
+                ''', (plan['file_path'], plan['file_size'], plan['last_modified'].isoformat(), video_id))
+                # 同一记录只能被移动一次
+                matches.remove(gone[0])
+                plan['video_id'] = video_id
+                plan['up_to_date'] = feature_version == self.current_feature_version
+                moved += 1
+            else:
+                video_id = matches[0][0]
+                logger.info(f"文件与已有视频内容相同，记为别名: {plan['file_path']} -> ID={video_id}")
+                cursor.execute(f'''
+                INSERT INTO video_metadata
+                (file_path, {', '.join(PROBED_COLUMNS)}, file_size, last_modified,
+                 feature_version, analyzed_at, fingerprint, alias_of, features_ready)
+                SELECT ?, {', '.join(PROBED_COLUMNS)}, ?, ?, feature_version, analyzed_at,
+                       fingerprint, id, features_ready
+                FROM video_metadata
+                WHERE id = ?
+                ''', (plan['file_path'], plan['file_size'], plan['last_modified'].isoformat(), video_id))
+                plan['video_id'] = cursor.lastrowid
+                plan['up_to_date'] = True
+                aliased += 1
+
+        if moved or aliased:
+            logger.info(f"按内容指纹识别: 移动 {moved} 个，重复 {aliased} 个")
+
+    def _load_known_files(self, cursor: sqlite3.Cursor,
+                          directory: Path) -> Dict[str, Tuple[int, int, Optional[str], Optional[str], Optional[str]]]:
+        """
+        Load the stored state of every video under a directory with one query.
+
+        Returns:
+            Dictionary file_path -> (video_id, file_size, last_modified, feature_version, fingerprint)
+        """
+        cursor.execute('''
+        SELECT file_path, id, file_size, last_modified, feature_version, fingerprint
+        FROM video_metadata
+        WHERE file_path >= ? AND file_path < ?
+        ''', _path_range(directory))
+        return {row[0]: row[1:] for row in cursor.fetchall()}
+
+    def _load_pending_plans(self, directory: Optional[Path]) -> List[Dict[str, Any]]:
+        """
+        Plans for the videos whose features are pending, optionally only
+        those under a directory, in path order.
+        """
+        query = '''
+        SELECT id, file_path, file_size
+        FROM video_metadata
+        WHERE features_ready = ? AND alias_of IS NULL
+        '''
+        params = [FEATURES_PENDING]
+        if directory is not None:
+            query += " AND file_path >= ? AND file_path < ?"
+            params.extend(_path_range(directory))
+        cursor = self.db.connection().cursor()
+        cursor.execute(query + " ORDER BY file_path", params)
+        return [{'file_path': file_path, 'name': os.path.basename(file_path), 'file_size': file_size,
+                 'video_id': video_id, 'up_to_date': False}
+                for video_id, file_path, file_size in cursor.fetchall()]
+
+    def _purge_videos(self, video_ids: List[int]):
+        """
+        Delete videos with their features and cached similarities in one transaction.
+
+        A video with an alias whose file still exists is re-pointed to that
+        file instead of being deleted.
+        """
+        with self.db.transaction() as cursor:
+            promoted = self._promote_aliases(cursor, video_ids)
+            video_ids = [video_id for video_id in video_ids if video_id not in promoted]
+            for video_id in video_ids:
+                SimilarityCache.invalidate(cursor, video_id)
+            cursor.executemany("DELETE FROM video_features WHERE video_id = ?",
+                               [(video_id,) for video_id in video_ids])
+            cursor.executemany("DELETE FROM video_metadata WHERE id = ?",
+                               [(video_id,) for video_id in video_ids])
+        logger.info(f"已删除 {len(video_ids)} 个不存在的视频记录")
+
+    def _promote_aliases(self, cursor: sqlite3.Cursor, video_ids: List[int]) -> List[int]:
+        """
+        Re-point videos whose file is gone to the file of one of their aliases.
+
+        The caller owns the transaction and commits.
+
+        Returns:
+            IDs of the re-pointed videos
+        """
+        promoted = []
+        for start in range(0, len(video_ids), 900):
+            chunk = video_ids[start:start + 900]
+            cursor.execute(f'''
+            SELECT id, file_path, file_size, last_modified, alias_of
+            FROM video_metadata
+            WHERE alias_of IN ({','.join('?' * len(chunk))})
+            ORDER BY id
+            ''', chunk)
+            for alias_id, file_path, file_size, last_modified, video_id in cursor.fetchall():
+                if video_id in promoted or not os.path.exists(file_path):
+                    continue
+                logger.info(f"原文件已不存在，视频 ID {video_id} 改为指向其副本: {file_path}")
+                cursor.execute("DELETE FROM video_metadata WHERE id = ?", (alias_id,))
+                cursor.execute('''
+                UPDATE video_metadata SET file_path = ?, file_size = ?, last_modified = ?
+                WHERE id = ?
+                ''', (file_path, file_size, last_modified, video_id))
+                promoted.append(video_id)
+        return promoted
+
+    def _probe_library(self, plans: List[Dict[str, Any]], start_time: float) -> Tuple[int, int]:
+        """
+        Phase 1 of a scan: run ffprobe on the files in a thread pool and
+        store their metadata in batched transactions, with the features
+        pending. Plans of stored files get their video_id set.
+
+        Returns:
+            Tuple (stored, failed)
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        total_files = len(plans)
         count = 0
         failed_count = 0
+        cursor = self.db.connection().cursor()
+        logger.info(f"使用 {self.probe_workers} 个线程读取 {total_files} 个视频文件的元数据")
 
-        for i, file_path in enumerate(video_files, 1):
-            try:
-                logger.info(f"处理进度: {i}/{total_files} - {file_path.name}")
-                self._process_video_file(file_path)
-                count += 1
+        batch = []
+        # ffprobe 在子进程中运行，线程只等待其输出
+        with ThreadPoolExecutor(max_workers=self.probe_workers) as executor:
+            probes = executor.map(self._probe_video_file, [plan['file_path'] for plan in plans])
+            for i, (plan, (metadata, probe_time, error)) in enumerate(zip(plans, probes), 1):
+                if error is not None:
+                    failed_count += 1
+                    self.scan_stats.count('failed_files')
+                    logger.error(f"提取元数据失败 {plan['file_path']}: {error}")
+                else:
+                    self.scan_stats.record('probe', probe_time)
+                    batch.append((plan, metadata))
+
+                if len(batch) >= self.write_batch_size:
+                    stored, failed = self._write_metadata(cursor, batch)
+                    count += stored
+                    failed_count += failed
+                    batch = []
+
+                if i % 100 == 0:
+                    self._log_scan_progress(i, total_files, start_time)
+
+        stored, failed = self._write_metadata(cursor, batch)
+        return count + stored, failed_count + failed
+
+    def _probe_video_file(self, file_path: str) -> Tuple[Optional[Dict[str, Any]], float, Optional[Exception]]:
+        """
+        Run _extract_video_metadata in a probe thread.
+
+        Returns:
+            Tuple (metadata, seconds, error); exactly one of metadata and error is None
+        """
+        probe_start = time.perf_counter()
+        try:
+            metadata = self._extract_video_metadata(file_path)
+        except Exception as e:
+            return None, time.perf_counter() - probe_start, e
+        return metadata, time.perf_counter() - probe_start, None
+
+    def _write_metadata(self, cursor: sqlite3.Cursor,
+                        batch: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> Tuple[int, int]:
+        """
+        Store a batch of probed metadata in one transaction.
+
+        Args:
+            cursor: Database cursor
+            batch: List of tuples (plan, metadata)
 
-                # 每处理10个文件记录一次进度
-                if i % 10 == 0:
-                    progress = (i / total_files) * 100
-                    elapsed = time.time() - start_time
-                    logger.info(f"已完成 {progress:.1f}% ({i}/{total_files})，耗时 {elapsed:.1f}秒")
+        Returns:
+            Tuple (stored, failed)
+        """
+        stored = 0
+        failed = 0
+        write_start = time.perf_counter()
+        try:
+            for plan, metadata in batch:
+                try:
+                    plan['video_id'] = self._store_metadata(cursor, plan, metadata)
+                    stored += 1
+                except sqlite3.Error as e:
+                    failed += 1
+                    logger.error(f"写入数据库失败 {plan['file_path']}: {e}")
+            cursor.connection.commit()
+        except sqlite3.Error as e:
+            cursor.connection.rollback()
+            logger.error(f"提交数据库事务失败，{len(batch)} 个文件未写入: {e}")
+            return 0, len(batch)
+        # 写入和提交的耗时平摊到本批写入的每个文件
+        write_time = time.perf_counter() - write_start
+        for _ in range(stored):
+            self.scan_stats.record('metadata_write', write_time / stored)
+        self.scan_stats.count('probed_files', stored)
+        return stored, failed
+
+    def _scan_serial(self, plans: List[Dict[str, Any]], start_time: float) -> Tuple[int, int]:
+        """
+        Extract the features of video files one at a time in the current
+        process, writing results in batched transactions.
+        """
+        total_files = len(plans)
+        count = 0
+        failed_count = 0
+        cursor = self.db.connection().cursor()
+        # 分析结果先缓存在内存中，批量写入，避免分析期间长时间持有写锁
+        batch = []
 
+        for i, plan in enumerate(plans, 1):
+            try:
+                logger.info(f"处理进度: {i}/{total_files} - {plan['name']}")
+                batch.append((plan, self._analyze_video_file(plan['file_path'], metadata=False)))
             except Exception as e:
                 failed_count += 1
-                logger.error(f"处理文件失败 {file_path}: {e}")
+                self.scan_stats.count('failed_files')
+                logger.error(f"处理文件失败 {plan['file_path']}: {e}")
+
+            if len(batch) >= self.write_batch_size:
+                stored, failed = self._write_results(cursor, batch)
+                count += stored
+                failed_count += failed
+                batch = []
+
+            # 每处理10个文件记录一次进度
+            if i % 10 == 0:
+                self._log_scan_progress(i, total_files, start_time)
+
+        stored, failed = self._write_results(cursor, batch)
+        return count + stored, failed_count + failed
+
+    def _scan_parallel(self, plans: List[Dict[str, Any]], workers: int, start_time: float) -> Tuple[int, int]:
+        """
+        Decode and extract features in a process pool, writing results from
+        this process in batched transactions.
+        """
+        total_files = len(plans)
+        count = 0
+        failed_count = 0
+        done = 0
+        cursor = self.db.connection().cursor()
+        logger.info(f"使用 {workers} 个工作进程分析 {total_files} 个视频文件")
+
+        batch = []
+        for plan, result, error in self._analyze_in_pool(plans, workers):
+            done += 1
+            logger.info(f"处理进度: {done}/{total_files} - {plan['name']}")
+
+            if error is not None:
+                failed_count += 1
+                self.scan_stats.count('failed_files')
+                logger.error(f"处理文件失败 {plan['file_path']}: {error}")
+            else:
+                batch.append((plan, result))
+
+            if len(batch) >= self.write_batch_size:
+                stored, failed = self._write_results(cursor, batch)
+                count += stored
+                failed_count += failed
+                batch = []
+
+            # 每处理10个文件记录一次进度
+            if done % 10 == 0:
+                self._log_scan_progress(done, total_files, start_time)
+
+        stored, failed = self._write_results(cursor, batch)
+        return count + stored, failed_count + failed
+
+    def _write_results(self, cursor: sqlite3.Cursor,
+                       batch: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> Tuple[int, int]:
+        """
+        Store a batch of analysis results in one transaction.
+
+        Args:
+            cursor: Database cursor
+            batch: List of tuples (plan, result)
+
+        Returns:
+            Tuple (stored, failed)
+        """
+        stored = 0
+        failed = 0
+        written = []
+        try:
+            for plan, result in batch:
+                store_start = time.perf_counter()
+                try:
+                    self._store_analysis_result(cursor, plan, result)
+                    stored += 1
+                    written.append((plan, result, time.perf_counter() - store_start))
+                except sqlite3.Error as e:
+                    failed += 1
+                    logger.error(f"写入数据库失败 {plan['file_path']}: {e}")
+            commit_start = time.perf_counter()
+            cursor.connection.commit()
+            commit_time = time.perf_counter() - commit_start
+        except sqlite3.Error as e:
+            cursor.connection.rollback()
+            logger.error(f"提交数据库事务失败，{len(batch)} 个文件未写入: {e}")
+            return 0, len(batch)
+        # 批量提交的耗时平摊到本批写入的每个文件
+        for plan, result, store_time in written:
+            self._record_file_stats(plan, result, store_time + commit_time / len(written))
+        if batch:
+            logger.debug(f"批量写入 {stored} 个视频的分析结果")
+        return stored, failed
+
+    def _record_file_stats(self, plan: Dict[str, Any], result: Dict[str, Any], db_write_time: float):
+        """Add the timings and counters of one stored analysis result to scan_stats."""
+        self.scan_stats.add_file(result.get('timings'), result.get('counters'))
+        self.scan_stats.record('db_write', db_write_time)
+        self.scan_stats.count('files')
+        self.scan_stats.count('input_bytes', plan['file_size'])
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Timing statistics of the files analysed by the last scan.
+
+        Covers scan_video_library() and the files processed one by one
+        afterwards (e.g. by the library watcher) until the next scan starts.
+
+        Returns:
+            Dictionary with 'stages' mapping each stage (fingerprint, probe,
+            metadata_write, open, decode, compute.<feature_type>, serialize,
+            db_write) to the count, total, mean, p50, p90, p99 and max of its
+            per-file seconds, and 'counters' (probed_files, files,
+            failed_files, feature_failures, frames, input_bytes,
+            fingerprint_bytes, feature_bytes)
+        """
+        return self.scan_stats.summary()
+
+    def _analyze_in_pool(self, plans: List[Dict[str, Any]],
+                         workers: int) -> Iterator[Tuple[Dict[str, Any], Optional[Dict[str, Any]], Optional[Exception]]]:
+        """
+        Run _analyze_video_file for each plan in a process pool, extracting
+        features only.
+
+        If a worker process dies, every file it may have been working on is
+        retried later in a single-worker pool, one at a time, so only the
+        file that really crashes the decoder is reported as failed.
+
+        Yields:
+            Tuples (plan, result, error); exactly one of result and error is None
+        """
+        from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+        from concurrent.futures.process import BrokenProcessPool
+
+        queue = deque(plans)
+        suspects = deque()
+
+        while queue or suspects:
+            isolate = not queue
+            source = suspects if isolate else queue
+            pool_size = 1 if isolate else workers
+            # 限制同时提交的任务数，进程崩溃时只影响窗口内的文件
+            window = 1 if isolate else workers * 2
+
+            with ProcessPoolExecutor(max_workers=pool_size, initializer=_init_scan_worker,
+                                     initargs=(self.db_path, self.sampling_mode,
+                                               self.decode_backend)) as executor:
+                in_flight = {}
+                broken = False
+                while source or in_flight:
+                    while source and len(in_flight) < window:
+                        plan = source.popleft()
+                        in_flight[executor.submit(_analyze_in_worker, plan['file_path'], False)] = plan
+
+                    finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        plan = in_flight.pop(future)
+                        try:
+                            result = future.result()
+                        except BrokenProcessPool as e:
+                            broken = True
+                            if isolate:
+                                yield plan, None, e
+                            else:
+                                suspects.append(plan)
+                        except Exception as e:
+                            yield plan, None, e
+                        else:
+                            yield plan, result, None
+
+                    if broken:
+                        suspects.extend(in_flight.values())
+                        logger.warning(f"工作进程异常退出，{len(suspects)} 个可能受影响的文件将单独重试")
+                        break
+
+    def _log_scan_progress(self, done: int, total_files: int, start_time: float):
+        """Log overall scan progress."""
+        progress = (done / total_files) * 100
+        elapsed = time.time() - start_time
+        logger.info(f"已完成 {progress:.1f}% ({done}/{total_files})，耗时 {elapsed:.1f}秒")
+    
+    def _find_video_files(self, directory: Path,
+                          reuse_listings: bool = True) -> List[Tuple[str, os.stat_result]]:
+        """
+        Find all video files in a directory recursively.
+
+        Directory listings are cached in the directory_state table; the
+        listing of a directory whose mtime did not change since the last
+        scan is reused instead of listing it again; its files are still
+        stat'ed.
+
+        Args:
+            directory: Directory to walk
+            reuse_listings: Reuse cached listings of unchanged directories;
+                False lists every directory
+
+        Returns:
+            List of tuples (absolute path, stat)
+        """
+        root = str(directory.absolute())
+        cache = DirectoryCache()
+        cache.load(self.db.connection().cursor(), root)
+        video_files = list(walk_video_files(root, SUPPORTED_VIDEO_FORMATS, cache, reuse=reuse_listings))
+        with self.db.transaction() as cursor:
+            cache.save(cursor, root)
+        return video_files
+    
+    def _process_video_file(self, file_path: Path) -> int:
+        """
+        Process a single video file: extract metadata and features.
+        
+        Args:
+            file_path: Path to the video file
+            
+        Returns:
+            video_id: The ID of the video in the database
+        """
+        conn = self.db.connection()
+        cursor = conn.cursor()
+        plan = self._plan_video_file(cursor, file_path)
+        if plan['up_to_date']:
+            return plan['video_id']
+
+        with self.db.transaction() as cursor:
+            self._resolve_by_fingerprint(cursor, [plan])
+        if plan['up_to_date']:
+            return plan['video_id']
+
+        result = self._analyze_video_file(plan['file_path'])
+        store_start = time.perf_counter()
+        try:
+            video_id = self._store_analysis_result(cursor, plan, result)
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        self._record_file_stats(plan, result, time.perf_counter() - store_start)
+
+        logger.debug(f"视频处理完成: {file_path.name}, ID={video_id}")
+        return video_id
+
+    def _plan_video_file(self, cursor: sqlite3.Cursor, file_path: Path) -> Dict[str, Any]:
+        """
+        Look up a video file in the database and decide whether it needs analysis.
+
+        Args:
+            cursor: Database cursor
+            file_path: Path to the video file
+
+        Returns:
+            Dictionary with the file's path, size, mtime, existing video_id and
+            an 'up_to_date' flag
+        """
+        str_path = str(file_path.absolute())
+        cursor.execute(
+            "SELECT id, file_size, last_modified, feature_version FROM video_metadata WHERE file_path = ?",
+            (str_path,)
+        )
+        return self._make_plan(str_path, cursor.fetchone())
+
+    def _make_plan(self, str_path: str, row: Optional[Tuple],
+                   file_stats: Optional[os.stat_result] = None) -> Dict[str, Any]:
+        """
+        Decide whether a video file needs analysis given its stored state.
+
+        Args:
+            str_path: Absolute path of the video file
+            row: Stored (video_id, file_size, last_modified, feature_version, ...), or None
+            file_stats: Stat result from the directory walk; None stats the file
+
+        Returns:
+            Dictionary with the file's path, size, mtime, existing video_id and
+            an 'up_to_date' flag
+        """
+        name = os.path.basename(str_path)
+        if file_stats is None:
+            file_stats = os.stat(str_path)
+        last_modified = datetime.fromtimestamp(file_stats.st_mtime)
+        file_size = file_stats.st_size
+        up_to_date = False
+
+        if row:
+            video_id, db_file_size, db_last_modified, db_feature_version = row[:4]
+            db_last_modified = datetime.fromisoformat(db_last_modified) if db_last_modified else None
+
+            if db_feature_version != self.current_feature_version:
+                # 特征版本不同，需要更新
+                logger.info(f"特征版本更新，需要重新分析视频: {name}")
+            elif db_file_size != file_size or db_last_modified != last_modified:
+                logger.info(f"视频文件已修改，需要重新分析: {name}")
+            else:
+                up_to_date = True
+        else:
+            # New video file
+            logger.info(f"处理新视频文件: {name}")
+            video_id = None
+
+        return {
+            'file_path': str_path,
+            'name': name,
+            'file_size': file_size,
+            'last_modified': last_modified,
+            'video_id': video_id,
+            'up_to_date': up_to_date
+        }
+
+    def _analyze_video_file(self, file_path: str, metadata: bool = True) -> Dict[str, Any]:
+        """
+        Extract metadata and features of a video file without touching the database.
+
+        Safe to run in a worker process.
+
+        Args:
+            file_path: Path to the video file
+            metadata: Also probe the metadata; the feature phase of a scan
+                passes False because phase 1 already stored it
+
+        Returns:
+            Dictionary with 'metadata' (None if not probed), 'features' (None
+            if feature extraction failed), and the 'timings' (seconds by
+            stage) and 'counters' of the file for scan_stats
+        """
+        name = Path(file_path).name
+        timings = {}
+        counters = {}
+
+        # Extract metadata
+        video_metadata = None
+        if metadata:
+            try:
+                logger.debug(f"开始提取视频元数据...")
+                probe_start = time.perf_counter()
+                video_metadata = self._extract_video_metadata(file_path)
+                timings['probe'] = time.perf_counter() - probe_start
+                logger.debug(f"元数据提取成功: 时长={video_metadata['duration']}秒, "
+                             f"分辨率={video_metadata['resolution']}")
+            except Exception as e:
+                logger.error(f"提取元数据失败 {name}: {e}")
+                raise
+        
+        # Extract features
+        try:
+            logger.debug(f"开始提取视频特征...")
+            features = self._extract_video_features(file_path, timings, counters)
+            logger.debug(f"特征提取成功: {', '.join(features.keys())}")
+        except Exception as e:
+            logger.error(f"提取特征失败 {name}: {e}")
+            # Continue with metadata only if feature extraction fails
+            features = None
+            counters['feature_failures'] = 1
+
+        return {'metadata': video_metadata, 'features': features, 'timings': timings, 'counters': counters}
+
+    def _register_feature_version(self, cursor: sqlite3.Cursor):
+        """
+        Record the current feature version and its parameters in feature_versions.
+
+        Done with the first stored result rather than on startup, so analyzers
+        that only read the library never write. The caller owns the transaction.
+        """
+        logger.debug(f"插入特征版本记录: {self.current_feature_version}")
+        cursor.execute('''
+        INSERT OR IGNORE INTO feature_versions (version, algorithm, parameters, created_at)
+        VALUES (?, ?, ?, ?)
+        ''', (self.current_feature_version, "phash+colorhist",
+              json.dumps(self.feature_parameters, sort_keys=True), datetime.now()))
+        self._feature_version_registered = True
+
+    def _store_analysis_result(self, cursor: sqlite3.Cursor, plan: Dict[str, Any],
+                               result: Dict[str, Any]) -> int:
+        """
+        Write the metadata (if probed) and features of an analysed video file.
+
+        The caller owns the transaction and commits.
+
+        Args:
+            cursor: Database cursor
+            plan: File information returned by _plan_video_file
+            result: Analysis result returned by _analyze_video_file
+
+        Returns:
+            video_id: The ID of the video in the database
+        """
+        video_id = plan['video_id']
+        if result['metadata'] is not None:
+            video_id = self._store_metadata(cursor, plan, result['metadata'])
+        self._store_features(cursor, video_id, result['features'])
+        return video_id
 
-        total_time = time.time() - start_time
-        logger.info(f"扫描完成！成功处理 {count} 个视频，失败 {failed_count} 个，总耗时 {total_time:.2f}秒")
+    def _store_metadata(self, cursor: sqlite3.Cursor, plan: Dict[str, Any],
+                        metadata: Dict[str, Any]) -> int:
+        """
+        Write the probed metadata of a video file with its features pending.
 
-        if failed_count > 0:
-            logger.warning(f"有 {failed_count} 个文件处理失败，请检查日志获取详细信息")
+        The stored features of an existing video are deleted, since they
+        belong to the previous content of the file. The caller owns the
+        transaction and commits.
 
-        return count
-    
-    def _find_video_files(self, directory: Path) -> List[Path]:
-        """Find all video files in a directory recursively."""
-        video_files = []
-        for file_path in directory.rglob('*'):
-            if file_path.is_file() and file_path.suffix.lower() in SUPPORTED_VIDEO_FORMATS:
-                video_files.append(file_path)
-        return video_files
-    
-    def _process_video_file(self, file_path: Path) -> int:
-        """
-        Process a single video file: extract metadata and features.
-        
-        Args:
-            file_path: Path to the video file
-            
         Returns:
             video_id: The ID of the video in the database
         """
-        str_path = str(file_path.absolute())
-        file_stats = file_path.stat()
-        last_modified = datetime.fromtimestamp(file_stats.st_mtime)
-        file_size = file_stats.st_size
-        
-        logger.debug(f"处理视频文件: {str_path}")
-        logger.debug(f"文件大小: {file_size} 字节, 最后修改时间: {last_modified}")
-        
-        # Check if video is already in the database and needs update
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT id, last_modified, feature_version FROM video_metadata WHERE file_path = ?", 
-            (str_path,)
-        )
-        result = cursor.fetchone()
-        
-        if result:
-            video_id, db_last_modified, db_feature_version = result
-            db_last_modified = datetime.fromisoformat(db_last_modified)
-            
-            logger.debug(f"在数据库中找到视频记录: ID={video_id}, 特征版本={db_feature_version}")
-            logger.debug(f"数据库中的最后修改时间: {db_last_modified}, 当前特征版本: {self.current_feature_version}")
-            
-            # 如果视频已经处理过且特征版本相同（没有升级算法），直接跳过处理
-            if db_feature_version == self.current_feature_version:
-                conn.close()
-                logger.debug(f"视频已处理过，跳过分析: {file_path.name}")
-                return video_id
-            
-            # 特征版本不同，需要更新
-            logger.info(f"特征版本更新，需要重新分析视频: {file_path.name}")
-        else:
-            # New video file
-            logger.info(f"处理新视频文件: {file_path.name}")
-            video_id = None
-        
-        # Extract metadata
-        try:
-            logger.debug(f"开始提取视频元数据...")
-            metadata = self._extract_video_metadata(str_path)
-            logger.debug(f"元数据提取成功: 时长={metadata['duration']}秒, 分辨率={metadata['resolution']}")
-        except Exception as e:
-            logger.error(f"提取元数据失败 {file_path.name}: {e}")
-            conn.close()
-            raise
-        
+        video_id = plan['video_id']
+        if not self._feature_version_registered:
+            self._register_feature_version(cursor)
+
+        probed = [metadata.get(column) for column in PROBED_COLUMNS]
         # Update or insert metadata
         if video_id:
             logger.debug(f"更新视频元数据: ID={video_id}")
-            cursor.execute('''
+            # 特征即将改变，缓存的相似度全部失效
+            SimilarityCache.invalidate(cursor, video_id)
+            cursor.execute("DELETE FROM video_features WHERE video_id = ?", (video_id,))
+            cursor.execute(f'''
             UPDATE video_metadata 
-            SET duration = ?, resolution = ?, file_size = ?, 
-                last_modified = ?, feature_version = ?, analyzed_at = ?
+            SET {', '.join(f'{column} = ?' for column in PROBED_COLUMNS)}, file_size = ?, 
+                last_modified = ?, feature_version = ?, analyzed_at = ?,
+                fingerprint = ?, alias_of = NULL, features_ready = ?
             WHERE id = ?
-            ''', (
-                metadata['duration'], metadata['resolution'], file_size,
-                last_modified.isoformat(), self.current_feature_version, 
-                datetime.now().isoformat(), video_id
-            ))
+            ''', probed + [
+                plan['file_size'], plan['last_modified'].isoformat(), self.current_feature_version,
+                datetime.now().isoformat(), plan.get('fingerprint'), FEATURES_PENDING, video_id
+            ])
         else:
             logger.debug(f"插入新视频元数据")
-            cursor.execute('''
+            cursor.execute(f'''
             INSERT INTO video_metadata 
-            (file_path, duration, resolution, file_size, last_modified, feature_version, analyzed_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                str_path, metadata['duration'], metadata['resolution'], file_size,
-                last_modified.isoformat(), self.current_feature_version, 
-                datetime.now().isoformat()
-            ))
+            (file_path, {', '.join(PROBED_COLUMNS)}, file_size, last_modified,
+             feature_version, analyzed_at, fingerprint, features_ready)
+            VALUES ({', '.join('?' * (len(PROBED_COLUMNS) + 7))})
+            ''', [plan['file_path']] + probed + [
+                plan['file_size'], plan['last_modified'].isoformat(), self.current_feature_version,
+                datetime.now().isoformat(), plan.get('fingerprint'), FEATURES_PENDING
+            ])
             video_id = cursor.lastrowid
             logger.debug(f"新视频ID: {video_id}")
-        
-        # Extract features
-        try:
-            logger.debug(f"开始提取视频特征...")
-            features = self._extract_video_features(str_path)
-            logger.debug(f"特征提取成功: {', '.join(features.keys())}")
-            
-            # Delete existing features if any
-            cursor.execute("DELETE FROM video_features WHERE video_id = ?", (video_id,))
-            logger.debug(f"已删除现有特征记录")
-            
-            # Insert new features
-            for feature_type, feature_data in features.items():
-                cursor.execute('''
-                INSERT INTO video_features (video_id, feature_type, feature_data)
-                VALUES (?, ?, ?)
-                ''', (video_id, feature_type, feature_data))
-                logger.debug(f"已插入特征类型: {feature_type}, 大小: {len(feature_data)} 字节")
-                
-        except Exception as e:
-            logger.error(f"提取特征失败 {file_path.name}: {e}")
-            # Continue with metadata only if feature extraction fails
-        
-        conn.commit()
-        conn.close()
-        logger.debug(f"视频处理完成: {file_path.name}, ID={video_id}")
         return video_id
-    
+
+    def _store_features(self, cursor: sqlite3.Cursor, video_id: int, features: Optional[Dict[str, bytes]]):
+        """
+        Write the features of a video and mark them ready, or mark them
+        failed when features is None.
+
+        analyzed_at is bumped so the feature index and similarity cache pick
+        up the change. The caller owns the transaction and commits.
+        """
+        # 待提取期间可能缓存了没有特征时的相似度
+        SimilarityCache.invalidate(cursor, video_id)
+        cursor.execute("DELETE FROM video_features WHERE video_id = ?", (video_id,))
+        if features is not None:
+            cursor.executemany('''
+            INSERT INTO video_features (video_id, feature_type, feature_data)
+            VALUES (?, ?, ?)
+            ''', [(video_id, feature_type, feature_data) for feature_type, feature_data in features.items()])
+            logger.debug(f"已插入特征: " + ", ".join(f"{feature_type} ({len(feature_data)} 字节)"
+                                                    for feature_type, feature_data in features.items()))
+        cursor.execute("UPDATE video_metadata SET features_ready = ?, analyzed_at = ? WHERE id = ?",
+                       (FEATURES_READY if features is not None else FEATURES_FAILED,
+                        datetime.now().isoformat(), video_id))
+
     def _extract_video_metadata(self, file_path: str) -> Dict[str, Any]:
         """
-        Extract metadata from a video file using ffmpeg.
+        Extract metadata from a video file using ffprobe.
+
+        One ffprobe call reads the container and stream headers plus the
+        packet flags of the first keyframe_probe_seconds, from which the
+        keyframe interval is measured without decoding.
         
         Args:
             file_path: Path to the video file
             
         Returns:
-            Dictionary containing video metadata
+            Dictionary containing video metadata: duration, resolution (coded
+            "WxH"), width, height and aspect_ratio (as displayed, i.e. after
+            rotation and sample aspect ratio), fps, codec, bitrate (bits/s),
+            has_audio and keyframe_interval (seconds); unknown values are None
         """
+        import ffmpeg
+
         try:
-            probe = ffmpeg.probe(file_path)
+            probe = ffmpeg.probe(file_path, show_entries='packet=stream_index,pts_time,flags',
+                                 read_intervals=f"%+{self.keyframe_probe_seconds}")
             video_stream = next((stream for stream in probe['streams'] 
                                 if stream['codec_type'] == 'video'), None)
             if video_stream is None:
@@ -326,157 +1379,259 @@ class VideoAnalyzer:
             width = int(video_stream['width'])
             height = int(video_stream['height'])
             resolution = f"{width}x{height}"
+            # 码率优先取容器的总码率，部分容器只在视频流上记录
+            bitrate = probe['format'].get('bit_rate') or video_stream.get('bit_rate')
+
+            # 显示尺寸：按像素宽高比拉伸，旋转 90 度的视频(如竖拍的手机视频)交换宽高
+            sample_aspect = _parse_ratio(video_stream.get('sample_aspect_ratio'), ':')
+            display_width, display_height = int(round(width * (sample_aspect or 1.0))), height
+            if _stream_rotation(video_stream) % 180 == 90:
+                display_width, display_height = display_height, display_width
             
             return {
                 'duration': duration,
                 'resolution': resolution,
-                'width': width,
-                'height': height
+                'width': display_width,
+                'height': display_height,
+                'aspect_ratio': display_width / display_height if display_height else None,
+                'fps': _parse_ratio(video_stream.get('avg_frame_rate')) or
+                       _parse_ratio(video_stream.get('r_frame_rate')),
+                'codec': video_stream.get('codec_name'),
+                'bitrate': int(bitrate) if bitrate and str(bitrate).isdigit() else None,
+                'has_audio': any(stream['codec_type'] == 'audio' for stream in probe['streams']),
+                'keyframe_interval': _keyframe_interval(probe.get('packets', []), video_stream['index'])
             }
         except ffmpeg.Error as e:
             logger.error(f"FFmpeg error: {e.stderr}")
             raise
-    
-    def _extract_video_features(self, file_path: str) -> Dict[str, bytes]:
+
+    def register_feature_extractor(self, feature_type: str,
+                                   frame_func: Callable[[np.ndarray], Any], dtype,
+                                   finalize: Optional[Callable[[List[Any]], np.ndarray]] = None,
+                                   transform: str = 'raw') -> None:
+        """
+        Register a per-frame feature extractor.
+
+        Every registered extractor receives the same sampled frames, so a video
+        is decoded only once no matter how many feature types are extracted.
+
+        Args:
+            feature_type: Name of the feature, used as video_features.feature_type
+            frame_func: Function computing the feature (or an intermediate
+                result) of one BGR frame
+            dtype: Numpy dtype of the final feature array
+            finalize: Optional function turning the list of per-frame results of
+                a whole video into the feature array in one batch; by default
+                the results are stacked as they are
+            transform: How the feature is stored, one of feature_codec.TRANSFORMS
+                ('delta' for hash sequences, 'uint8' or 'float16' to quantize
+                float features)
+        """
+        if transform not in TRANSFORMS:
+            raise ValueError(f"Unknown feature transform: {transform}")
+        logger.debug(f"注册特征提取器: {feature_type}")
+        self.feature_extractors[feature_type] = (frame_func, dtype, finalize)
+        self.feature_transforms[feature_type] = transform
+
+    def _extract_video_features(self, file_path: str, timings: Optional[Dict[str, float]] = None,
+                                counters: Optional[Dict[str, int]] = None) -> Dict[str, bytes]:
         """
         Extract features from a video file.
 
+        The file is decoded once by a shared FrameSampler and each sampled
+        frame is passed to every registered feature extractor.
+
         Args:
             file_path: Path to the video file
+            timings: Optional dictionary receiving the seconds spent in the
+                'open' (until the first sampled frame), 'decode',
+                'compute.<feature_type>' and 'serialize' stages
+            counters: Optional dictionary receiving the 'frames' and
+                'feature_bytes' counts
 
         Returns:
             Dictionary mapping feature types to feature data
         """
         logger.debug(f"开始提取视频特征: {Path(file_path).name}")
-        start_time = time.time()
+        start_time = time.perf_counter()
         features = {}
 
         try:
-            # Extract perceptual hash features
-            logger.debug("提取感知哈希特征...")
-            phash_start = time.time()
-            phash_features = self._extract_phash_features(file_path)
-            phash_time = time.time() - phash_start
-            features['phash'] = self._serialize_feature(phash_features)
-            logger.debug(f"感知哈希特征提取完成，提取了 {len(phash_features)} 个特征，耗时 {phash_time:.2f}秒")
-
-            # Extract color histogram features
-            logger.debug("提取颜色直方图特征...")
-            hist_start = time.time()
-            color_hist_features = self._extract_color_histogram_features(file_path)
-            hist_time = time.time() - hist_start
-            features['colorhist'] = self._serialize_feature(color_hist_features)
-            logger.debug(f"颜色直方图特征提取完成，提取了 {len(color_hist_features)} 个特征，耗时 {hist_time:.2f}秒")
+            sampler = FrameSampler(sample_rate=self.sample_rate, mode=self.sampling_mode,
+                                   backend=self.decode_backend, frame_size=self.decode_frame_size)
+            frame_results = {feature_type: [] for feature_type in self.feature_extractors}
+            compute_times = {feature_type: 0.0 for feature_type in self.feature_extractors}
+            frame_count = 0
+            open_time = None
 
-            total_time = time.time() - start_time
+            for frame in sampler.iter_frames(file_path):
+                if open_time is None:
+                    # 打开文件并解码到第一个采样帧的耗时
+                    open_time = time.perf_counter() - start_time
+                frame_count += 1
+                for feature_type, (frame_func, _, _) in self.feature_extractors.items():
+                    compute_start = time.perf_counter()
+                    frame_results[feature_type].append(frame_func(frame))
+                    compute_times[feature_type] += time.perf_counter() - compute_start
+
+            sampling_time = time.perf_counter() - start_time
+            if open_time is None:
+                open_time = sampling_time
+            decode_time = sampling_time - open_time - sum(compute_times.values())
+            logger.debug(f"帧采样完成，采样了 {frame_count} 帧，解码耗时 {decode_time:.2f}秒")
+
+            serialize_time = 0.0
+            for feature_type, (_, dtype, finalize) in self.feature_extractors.items():
+                compute_start = time.perf_counter()
+                if finalize is not None:
+                    feature = finalize(frame_results[feature_type])
+                else:
+                    feature = np.array(frame_results[feature_type], dtype=dtype)
+                serialize_start = time.perf_counter()
+                compute_times[feature_type] += serialize_start - compute_start
+                features[feature_type] = self._serialize_feature(feature, self.feature_transforms[feature_type])
+                serialize_time += time.perf_counter() - serialize_start
+                logger.debug(f"{feature_type} 特征提取完成，提取了 {len(feature)} 个特征，"
+                             f"计算耗时 {compute_times[feature_type]:.2f}秒")
+
+            total_time = time.perf_counter() - start_time
             logger.debug(f"视频特征提取完成，总耗时 {total_time:.2f}秒")
 
+            if timings is not None:
+                timings['open'] = open_time
+                timings['decode'] = decode_time
+                for feature_type, compute_time in compute_times.items():
+                    timings[f'compute.{feature_type}'] = compute_time
+                timings['serialize'] = serialize_time
+            if counters is not None:
+                counters['frames'] = frame_count
+                counters['feature_bytes'] = sum(len(data) for data in features.values())
+
         except Exception as e:
             logger.error(f"特征提取过程中发生错误: {e}")
             raise
 
         return features
-    
+
+    def _prepare_phash_frame(self, frame: np.ndarray) -> np.ndarray:
+        """Convert one BGR frame to the 32x32 float32 image hashed by pHash."""
+        import cv2
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return np.float32(cv2.resize(gray, (32, 32)))
+
+    def _compute_phash_batch(self, resized_frames: List[np.ndarray]) -> np.ndarray:
+        """
+        Compute the 64-bit perceptual hashes of a whole video in one batch.
+
+        Bit-identical to _compute_frame_phash: the 2D DCT is done as two
+        cv2.dct(DCT_ROWS) passes over all stacked frames, and only the 8 low
+        frequency columns are transformed in the second pass.
+
+        Args:
+            resized_frames: 32x32 float32 images from _prepare_phash_frame
+
+        Returns:
+            Array of perceptual hash values
+        """
+        n = len(resized_frames)
+        if n == 0:
+            return np.empty(0, dtype=np.uint64)
+
+        import cv2
+        stacked = np.stack(resized_frames).reshape(n * 32, 32)
+
+        # 行方向 DCT，只保留低频的前 8 列
+        rows = cv2.dct(stacked, flags=cv2.DCT_ROWS).reshape(n, 32, 32)[:, :, :8]
+
+        # 转置后再做一次行方向 DCT，即列方向 DCT
+        cols = np.ascontiguousarray(rows.transpose(0, 2, 1)).reshape(n * 8, 32)
+        dct_low = cv2.dct(cols, flags=cv2.DCT_ROWS).reshape(n, 8, 32)[:, :, :8].transpose(0, 2, 1)
+
+        # Threshold against the per-frame mean, bit i * 8 + j holds dct_low[i, j]
+        means = np.ascontiguousarray(dct_low).reshape(n, 64).mean(axis=1)
+        bits = dct_low.reshape(n, 64) > means[:, None]
+        packed = np.packbits(bits, axis=1, bitorder='little')
+        return packed.view('<u8').astype(np.uint64).ravel()
+
+    def _compute_frame_phash(self, frame: np.ndarray) -> int:
+        """
+        Compute the 64-bit perceptual hash of one BGR frame.
+
+        Reference implementation of the v1.0 hash; scans use the batched
+        _compute_phash_batch.
+        """
+        import cv2
+        # Convert to grayscale and resize
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        resized = cv2.resize(gray, (32, 32))
+
+        # Compute DCT
+        dct = cv2.dct(np.float32(resized))
+        dct_low = dct[:8, :8]
+
+        # Compute mean
+        mean = np.mean(dct_low)
+
+        # Compute hash
+        hash_value = 0
+        for i in range(8):
+            for j in range(8):
+                if dct_low[i, j] > mean:
+                    hash_value |= 1 << (i * 8 + j)
+
+        return hash_value
+
+    def _compute_frame_color_histogram(self, frame: np.ndarray) -> np.ndarray:
+        """Compute the normalized 8x8 hue/saturation histogram of one BGR frame."""
+        import cv2
+        # Convert to HSV
+        hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+
+        # Compute histogram
+        hist = cv2.calcHist([hsv], [0, 1], None, [8, 8], [0, 180, 0, 256])
+        return cv2.normalize(hist, hist).flatten()
+
     def _extract_phash_features(self, file_path: str, sample_rate: int = 1) -> np.ndarray:
         """
         Extract perceptual hash features from video frames.
-        
+
+        Decodes the file on its own; scans use _extract_video_features instead.
+
         Args:
             file_path: Path to the video file
             sample_rate: Sample one frame every N seconds
-            
+
         Returns:
             Array of perceptual hash values
         """
-        cap = cv2.VideoCapture(file_path)
-        if not cap.isOpened():
-            raise ValueError(f"Could not open video file: {file_path}")
-        
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        frame_interval = int(fps * sample_rate)
-        
-        phash_list = []
-        frame_count = 0
-        
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-                
-            if frame_count % frame_interval == 0:
-                # Convert to grayscale and resize
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                resized = cv2.resize(gray, (32, 32))
-                
-                # Compute DCT
-                dct = cv2.dct(np.float32(resized))
-                dct_low = dct[:8, :8]
-                
-                # Compute mean
-                mean = np.mean(dct_low)
-                
-                # Compute hash
-                hash_value = 0
-                for i in range(8):
-                    for j in range(8):
-                        if dct_low[i, j] > mean:
-                            hash_value |= 1 << (i * 8 + j)
-                
-                phash_list.append(hash_value)
-                
-            frame_count += 1
-            
-        cap.release()
-        return np.array(phash_list, dtype=np.uint64)
-    
+        sampler = FrameSampler(sample_rate=sample_rate)
+        resized_frames = [self._prepare_phash_frame(frame) for frame in sampler.iter_frames(file_path)]
+        return self._compute_phash_batch(resized_frames)
+
     def _extract_color_histogram_features(self, file_path: str, sample_rate: int = 1) -> np.ndarray:
         """
         Extract color histogram features from video frames.
-        
+
+        Decodes the file on its own; scans use _extract_video_features instead.
+
         Args:
             file_path: Path to the video file
             sample_rate: Sample one frame every N seconds
-            
+
         Returns:
             Array of color histograms
         """
-        cap = cv2.VideoCapture(file_path)
-        if not cap.isOpened():
-            raise ValueError(f"Could not open video file: {file_path}")
-        
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        frame_interval = int(fps * sample_rate)
-        
-        hist_list = []
-        frame_count = 0
-        
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-                
-            if frame_count % frame_interval == 0:
-                # Convert to HSV
-                hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-                
-                # Compute histogram
-                hist = cv2.calcHist([hsv], [0, 1], None, [8, 8], [0, 180, 0, 256])
-                hist = cv2.normalize(hist, hist).flatten()
-                
-                hist_list.append(hist)
-                
-            frame_count += 1
-            
-        cap.release()
+        sampler = FrameSampler(sample_rate=sample_rate)
+        hist_list = [self._compute_frame_color_histogram(frame) for frame in sampler.iter_frames(file_path)]
         return np.array(hist_list, dtype=np.float32)
-    
-    def _serialize_feature(self, feature: np.ndarray) -> bytes:
-        """Serialize a numpy array to bytes."""
-        return feature.tobytes()
+
+    def _serialize_feature(self, feature: np.ndarray, transform: str = 'raw') -> bytes:
+        """Serialize a numpy array to a self-describing feature_codec blob."""
+        return encode_feature(feature, transform, self.feature_compression)
     
     def _deserialize_feature(self, data: bytes, dtype) -> np.ndarray:
-        """Deserialize bytes to a numpy array."""
-        return np.frombuffer(data, dtype=dtype)
+        """Deserialize a feature blob; headerless v1.0 blobs are read as raw dtype values."""
+        return decode_feature(data, dtype)
     
     def get_video_metadata(self, video_id: int) -> Dict[str, Any]:
         """
@@ -486,32 +1641,64 @@ class VideoAnalyzer:
             video_id: ID of the video in the database
             
         Returns:
-            Dictionary containing video metadata
+            Dictionary containing video metadata, with the keys of METADATA_FIELDS
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = self.db.connection()
         cursor = conn.cursor()
         
-        cursor.execute('''
-        SELECT file_path, duration, resolution, file_size, last_modified
+        cursor.execute(f'''
+        SELECT {', '.join(METADATA_FIELDS)}
         FROM video_metadata
         WHERE id = ?
         ''', (video_id,))
         
         result = cursor.fetchone()
-        conn.close()
         
         if not result:
             raise ValueError(f"No video found with ID {video_id}")
         
-        file_path, duration, resolution, file_size, last_modified = result
-        return {
-            'id': video_id,
-            'file_path': file_path,
-            'duration': duration,
-            'resolution': resolution,
-            'file_size': file_size,
-            'last_modified': last_modified
-        }
+        return dict(zip(METADATA_FIELDS, result))
+
+    def query_candidates(self, min_duration: float = 0.0, max_duration: float = float('inf'),
+                         aspect_range: Optional[Tuple[float, float]] = None, min_height: Optional[int] = None,
+                         codec: Optional[str] = None, limit: Optional[int] = None,
+                         directory: Optional[str] = None,
+                         fields: Sequence[str] = METADATA_FIELDS) -> List[Dict[str, Any]]:
+        """
+        Videos matching metadata filters, selected in SQL through the indexes
+        on the typed metadata columns.
+
+        Aliases are excluded. Videos whose features are still pending are
+        included; see their 'features_ready'. Large result sets are
+        dominated by building the rows, so ask only for the fields needed.
+
+        Args:
+            min_duration: Minimum duration in seconds
+            max_duration: Maximum duration in seconds
+            aspect_range: (min, max) display aspect ratio, width / height,
+                both inclusive; e.g. (0.0, 1.0) for portrait videos
+            min_height: Minimum display height in pixels
+            codec: ffprobe codec name, e.g. 'h264'
+            limit: Maximum number of videos returned
+            directory: Only videos under this directory
+            fields: Fields of each returned video, a subset of METADATA_FIELDS
+
+        Returns:
+            List of dictionaries with the requested fields, in index order
+            (no particular order)
+        """
+        unknown = set(fields) - set(METADATA_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown metadata fields: {', '.join(sorted(unknown))}")
+        where, params = _candidate_filter(min_duration, max_duration, aspect_range, min_height, codec,
+                                          directory)
+        query = f"SELECT {', '.join(fields)} FROM video_metadata WHERE {where}"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        cursor = self.db.connection().cursor()
+        cursor.execute(query, params)
+        return [dict(zip(fields, row)) for row in cursor.fetchall()]
     
     def get_video_feature(self, video_id: int, feature_type: str) -> np.ndarray:
         """
@@ -524,7 +1711,7 @@ class VideoAnalyzer:
         Returns:
             Numpy array containing feature data
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = self.db.connection()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -534,232 +1721,397 @@ class VideoAnalyzer:
         ''', (video_id, feature_type))
         
         result = cursor.fetchone()
-        conn.close()
         
         if not result:
             raise ValueError(f"No {feature_type} feature found for video ID {video_id}")
         
-        feature_data = result[0]
-        
-        # Deserialize based on feature type
-        if feature_type == 'phash':
-            return self._deserialize_feature(feature_data, np.uint64)
-        elif feature_type == 'colorhist':
-            return self._deserialize_feature(feature_data, np.float32)
-        else:
+        return self._decode_feature(feature_type, result[0])
+
+    def _decode_feature(self, feature_type: str, feature_data: bytes) -> np.ndarray:
+        """Deserialize a stored feature based on its type."""
+        if feature_type not in self.feature_extractors:
             raise ValueError(f"Unknown feature type: {feature_type}")
-    
-    def find_similar_videos(self, video_id: int, threshold: float = 0.8) -> List[Tuple[int, float]]:
-        """
-        Find videos similar to the given video.
+        _, dtype, _ = self.feature_extractors[feature_type]
+        return self._deserialize_feature(feature_data, dtype)
 
-        Args:
-            video_id: ID of the reference video
-            threshold: Similarity threshold (0-1)
+    def _decode_features(self, feature_type: str, feature_blobs: List[bytes]) -> List[np.ndarray]:
+        """Deserialize many stored features of one type in a single batch."""
+        if feature_type not in self.feature_extractors:
+            raise ValueError(f"Unknown feature type: {feature_type}")
+        _, dtype, _ = self.feature_extractors[feature_type]
+        return decode_features(feature_blobs, dtype)
 
-        Returns:
-            List of tuples (video_id, similarity_score)
+    def _select_dissimilar_cached(self, video_ids: List[int], count: int,
+                                  similarity_threshold: float, excluded: Optional[set] = None) -> List[int]:
         """
-        start_time = time.time()
-        logger.info(f"开始查找与视频 ID {video_id} 相似的视频，相似度阈值: {threshold}")
+        Greedy dissimilar selection driven by the similarity cache.
 
-        # Get features of the reference video
-        try:
-            logger.debug(f"获取参考视频 {video_id} 的特征...")
-            ref_phash = self.get_video_feature(video_id, 'phash')
-            ref_colorhist = self.get_video_feature(video_id, 'colorhist')
-            logger.debug(f"参考视频特征获取成功，感知哈希: {len(ref_phash)} 个，颜色直方图: {len(ref_colorhist)} 个")
-        except Exception as e:
-            logger.error(f"无法获取视频 ID {video_id} 的特征: {e}")
-            return []
+        Same rule as FeatureIndex.select_dissimilar: a video is skipped when
+        it is similar to an already picked one. Each pick's cached neighbours
+        are excluded from the rest of the walk; pass the same excluded set
+        to continue a walk over more candidates. Returns the new picks.
+        """
+        conn = self.db.connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT MAX(analyzed_at) FROM video_metadata")
+        library_state = cursor.fetchone()[0]
+
+        selected = []
+        if excluded is None:
+            excluded = set()
+        for video_id in video_ids:
+            if len(selected) >= count:
+                break
+            if video_id in excluded:
+                continue
+            selected.append(video_id)
+            similar_videos = self.similarity_cache.get_similar(cursor, video_id, similarity_threshold,
+                                                               library_state)
+            excluded.update(vid for vid, _ in similar_videos)
 
-        # Get all video IDs
-        logger.debug("获取数据库中所有视频ID...")
-        conn = sqlite3.connect(self.db_path)
+        # 新计算的缓存行在一个事务中写入
+        self.similarity_cache.flush(cursor)
+        conn.commit()
+        return selected
+
+    def _get_videos_metadata(self, video_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Get metadata of several videos with one query per chunk, keyed by video ID."""
+        conn = self.db.connection()
         cursor = conn.cursor()
-        cursor.execute("SELECT id FROM video_metadata")
-        video_ids = [row[0] for row in cursor.fetchall()]
-        conn.close()
 
-        total_videos = len(video_ids) - 1  # 排除参考视频本身
-        logger.info(f"需要比较 {total_videos} 个视频")
+        metadata_by_id = {}
+        # SQLite 默认最多 999 个绑定参数，按块查询
+        for start in range(0, len(video_ids), 900):
+            chunk = video_ids[start:start + 900]
+            placeholders = ','.join('?' * len(chunk))
+            cursor.execute(f'''
+            SELECT id, file_path, duration, resolution, file_size, last_modified, features_ready
+            FROM video_metadata
+            WHERE id IN ({placeholders})
+            ''', chunk)
+            for video_id, file_path, duration, resolution, file_size, last_modified, features_ready \
+                    in cursor.fetchall():
+                metadata_by_id[video_id] = {
+                    'id': video_id,
+                    'file_path': file_path,
+                    'duration': duration,
+                    'resolution': resolution,
+                    'file_size': file_size,
+                    'last_modified': last_modified,
+                    'features_ready': features_ready
+                }
 
-        similar_videos = []
-        compared_count = 0
+        return metadata_by_id
 
-        for vid in video_ids:
-            if vid == video_id:
-                continue
+    def get_feature_index(self) -> FeatureIndex:
+        """
+        Get the in-memory feature index, loading it on first use and
+        refreshing it when the library changed.
+        """
+        if self.feature_index is None:
+            self.feature_index = FeatureIndex(self, bands=self.lsh_bands)
+        self.feature_index.refresh()
+        return self.feature_index
 
-            try:
-                # Get features of the comparison video
-                comp_phash = self.get_video_feature(vid, 'phash')
-                comp_colorhist = self.get_video_feature(vid, 'colorhist')
+    def get_feature_generation(self, cursor: Optional[sqlite3.Cursor] = None) -> int:
+        """Counter bumped by every write to video_features."""
+        cursor = cursor or self.db.connection().cursor()
+        cursor.execute("SELECT generation FROM feature_generation WHERE id = 0")
+        row = cursor.fetchone()
+        return row[0] if row else 0
+
+    def update_feature_snapshot(self) -> bool:
+        """
+        Bring the feature snapshot in snapshot_dir up to date with the database.
 
-                # Calculate similarity scores
-                phash_sim = self._calculate_phash_similarity(ref_phash, comp_phash)
-                colorhist_sim = self._calculate_histogram_similarity(ref_colorhist, comp_colorhist)
+        The feature index is refreshed incrementally (only videos changed
+        since the snapshot are decoded) and written as a new snapshot
+        generation when the database moved on.
+
+        Returns:
+            True if a new snapshot was written
+        """
+        if not self.snapshot_dir:
+            return False
+        index = self.get_feature_index()
+        manifest = read_manifest(self.snapshot_dir)
+        if manifest is not None and manifest.get('generation') == index.generation:
+            return False
+        index.save_snapshot(self.snapshot_dir)
+        return True
+    
+    def find_similar_videos(self, video_id: int, threshold: float = 0.8,
+                            exhaustive: bool = False, aligned: bool = False,
+                            min_overlap: float = 0.5) -> List[Tuple]:
+        """
+        Find videos similar to the given video.
 
-                # Combine scores (weighted average)
-                combined_sim = 0.7 * phash_sim + 0.3 * colorhist_sim
+        Thresholds covered by the similarity cache are answered from the
+        video_similarity table. Otherwise libraries with at least
+        lsh_min_videos videos only score the LSH candidates of the reference
+        video; see lsh_probe_radius.
 
-                compared_count += 1
+        Args:
+            video_id: ID of the reference video
+            threshold: Similarity threshold (0-1)
+            exhaustive: Compare against every video even in large libraries
+            aligned: Score every video at its best temporal offset, so that
+                trimmed or shifted copies are found; never uses the cache
+            min_overlap: In aligned mode, the fraction of the shorter video
+                that must overlap the other at an offset
 
-                if combined_sim >= threshold:
-                    similar_videos.append((vid, combined_sim))
-                    logger.debug(f"找到相似视频 ID {vid}，相似度: {combined_sim:.3f}")
+        Returns:
+            List of tuples (video_id, similarity_score); in aligned mode
+            tuples (video_id, similarity_score, offset_seconds), where the
+            video's start lines up with offset_seconds into the reference video
+        """
+        start_time = time.time()
+        logger.info(f"开始查找与视频 ID {video_id} 相似的视频，相似度阈值: {threshold}")
 
-                # 每比较100个视频记录一次进度
-                if compared_count % 100 == 0:
-                    progress = (compared_count / total_videos) * 100
-                    logger.debug(f"相似度比较进度: {progress:.1f}% ({compared_count}/{total_videos})")
+        if not aligned and self.use_similarity_cache and self.similarity_cache.covers(threshold):
+            conn = self.db.connection()
+            cursor = conn.cursor()
+            similar_videos = self.similarity_cache.get_similar(cursor, video_id, threshold)
+            self.similarity_cache.flush(cursor)
+            conn.commit()
+            # 缓存行中可能仍有已删除的视频
+            existing = self._get_videos_metadata([vid for vid, _ in similar_videos])
+            similar_videos = [(vid, score) for vid, score in similar_videos if vid in existing]
+            total_time = time.time() - start_time
+            logger.info(f"相似视频查找完成！从相似度缓存找到 {len(similar_videos)} 个相似视频，耗时 {total_time:.2f}秒")
+            return similar_videos
 
-            except ValueError:
-                logger.debug(f"跳过视频 ID {vid}，无法获取特征")
-                continue
+        index = self.get_feature_index()
+        if video_id not in index:
+            logger.error(f"无法获取视频 ID {video_id} 的特征")
+            return []
 
-        # Sort by similarity (highest first)
-        similar_videos.sort(key=lambda x: x[1], reverse=True)
+        library_size = len(index) - 1  # 排除参考视频本身
+        use_lsh = not exhaustive and library_size + 1 >= self.lsh_min_videos
+        logger.debug(f"在特征索引中查找 {library_size} 个视频，{'使用 LSH 候选' if use_lsh else '穷举比较'}")
+        if aligned:
+            similar_videos = [(vid, score, offset * self.sample_rate) for vid, score, offset in
+                              index.find_similar_aligned(video_id, threshold,
+                                                         probe_radius=self.lsh_probe_radius if use_lsh else None,
+                                                         min_band_hits=self.lsh_min_band_hits,
+                                                         min_overlap=min_overlap)]
+        else:
+            similar_videos = index.find_similar(video_id, threshold,
+                                                probe_radius=self.lsh_probe_radius if use_lsh else None,
+                                                min_band_hits=self.lsh_min_band_hits)
 
         total_time = time.time() - start_time
-        logger.info(f"相似视频查找完成！找到 {len(similar_videos)} 个相似视频，比较了 {compared_count} 个视频，耗时 {total_time:.2f}秒")
+        logger.info(f"相似视频查找完成！找到 {len(similar_videos)} 个相似视频，库中共 {library_size} 个视频，耗时 {total_time:.2f}秒")
 
         return similar_videos
     
+    def compare_videos(self, video_id1: int, video_id2: int, aligned: bool = True,
+                       min_overlap: float = 0.5) -> Tuple[float, float]:
+        """
+        Combined similarity of two videos.
+
+        Args:
+            video_id1: ID of the first video
+            video_id2: ID of the second video
+            aligned: Find the temporal offset at which the videos match best
+                instead of comparing frame i with frame i
+            min_overlap: Fraction of the shorter video that must overlap the
+                other at an offset
+
+        Returns:
+            Tuple (similarity_score, offset_seconds): the second video's
+            start lines up with offset_seconds into the first one (always 0
+            when not aligned)
+        """
+        phash1 = self.get_video_feature(video_id1, 'phash')
+        hist1 = self.get_video_feature(video_id1, 'colorhist')
+        phash2 = self.get_video_feature(video_id2, 'phash')
+        hist2 = self.get_video_feature(video_id2, 'colorhist')
+        if not aligned:
+            return (PHASH_WEIGHT * self._calculate_phash_similarity(phash1, phash2) +
+                    COLORHIST_WEIGHT * self._calculate_histogram_similarity(hist1, hist2)), 0.0
+        score, offset = video_similarity_aligned(phash1, hist1, phash2, hist2, min_overlap=min_overlap)
+        return score, offset * self.sample_rate
+
     def _calculate_phash_similarity(self, phash1: np.ndarray, phash2: np.ndarray) -> float:
         """Calculate similarity between two sets of perceptual hashes."""
-        # If arrays have different lengths, use the shorter one
-        min_len = min(len(phash1), len(phash2))
-        if min_len == 0:
-            return 0.0
-            
-        phash1 = phash1[:min_len]
-        phash2 = phash2[:min_len]
-        
-        # Calculate Hamming distance
-        distances = np.zeros(min_len)
-        for i in range(min_len):
-            xor = phash1[i] ^ phash2[i]
-            # Count bits set to 1 (popcount)
-            distances[i] = bin(xor).count('1')
-        
-        # Convert to similarity (0-1)
-        # Maximum distance is 64 bits
-        similarities = 1.0 - distances / 64.0
-        return float(np.mean(similarities))
+        return phash_similarity(phash1, phash2)
+
+    def _calculate_phash_similarity_many(self, ref_phash: np.ndarray,
+                                         candidates: List[np.ndarray]) -> np.ndarray:
+        """Calculate the perceptual hash similarity of one video against many candidates."""
+        return phash_similarity_many(ref_phash, candidates)
     
     def _calculate_histogram_similarity(self, hist1: np.ndarray, hist2: np.ndarray) -> float:
         """Calculate similarity between two sets of color histograms."""
-        # If arrays have different lengths, use the shorter one
-        min_len = min(len(hist1), len(hist2))
-        if min_len == 0:
-            return 0.0
-            
-        hist1 = hist1[:min_len]
-        hist2 = hist2[:min_len]
-        
-        # Calculate histogram intersection
-        similarities = np.zeros(min_len)
-        for i in range(min_len):
-            similarities[i] = cv2.compareHist(
-                hist1[i].reshape(8, 8), 
-                hist2[i].reshape(8, 8), 
-                cv2.HISTCMP_INTERSECT
-            )
-        
-        # Normalize to 0-1
-        return float(np.mean(similarities))
+        return histogram_similarity(hist1, hist2)
+
+    def _calculate_histogram_similarity_many(self, ref_hist: np.ndarray,
+                                             candidates: List[np.ndarray]) -> np.ndarray:
+        """Calculate the color histogram similarity of one video against many candidates."""
+        return histogram_similarity_many(ref_hist, candidates)
     
-    def get_random_videos(self, count: int, min_duration: float = 1.0, max_duration: float = float('inf')) -> List[Dict[str, Any]]:
+    def get_random_videos(self, count: int, min_duration: float = 1.0, max_duration: float = float('inf'),
+                          weighting: str = 'uniform') -> List[Dict[str, Any]]:
         """
         Get random videos from the database.
+
+        Rows are drawn by LibrarySampler, so the cost grows with count rather
+        than with the library size.
         
         Args:
             count: Number of videos to retrieve
             min_duration: Minimum video duration in seconds
             max_duration: Maximum video duration in seconds
+            weighting: One of library_sampler.WEIGHTINGS: 'uniform', or draw
+                videos in proportion to their 'duration' or to 1 / (1 + uses)
+                ('inverse_usage', see record_usage())
             
         Returns:
             List of dictionaries containing video metadata
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-        SELECT id, file_path, duration, resolution
-        FROM video_metadata
-        WHERE duration >= ? AND duration <= ?
-        ORDER BY RANDOM()
-        LIMIT ?
-        ''', (min_duration, max_duration, count))
-        
-        results = cursor.fetchall()
-        conn.close()
-        
-        videos = []
-        for video_id, file_path, duration, resolution in results:
-            videos.append({
-                'id': video_id,
-                'file_path': file_path,
-                'duration': duration,
-                'resolution': resolution
-            })
-            
-        return videos
+        fields = ('id', 'file_path', 'duration', 'resolution')
+        where, params = _candidate_filter(min_duration, max_duration)
+        rows = self.sampler.sample(count, where, params, fields, weighting)
+        return [dict(zip(fields, row)) for row in rows]
     
-    def get_random_dissimilar_videos(self, count: int, similarity_threshold: float = 0.5) -> List[Dict[str, Any]]:
+    def get_random_dissimilar_videos(self, count: int, similarity_threshold: float = 0.5,
+                                     min_duration: float = 0.0, max_duration: float = float('inf'),
+                                     aspect_range: Optional[Tuple[float, float]] = None,
+                                     min_height: Optional[int] = None,
+                                     codec: Optional[str] = None,
+                                     weighting: str = 'uniform') -> List[Dict[str, Any]]:
         """
         Get random videos that are not similar to each other.
+
+        Videos with features are compared by their features. Videos whose
+        features are not extracted yet (or failed) are included too, with
+        the cheaper check of _select_dissimilar_by_metadata, so a freshly
+        probed library can be composed from before its features are ready.
+
+        Candidates are drawn by LibrarySampler in rounds that double in size
+        until enough dissimilar videos are picked or the matching videos run
+        out. Each round continues the greedy pick of the previous ones, so
+        this equals a greedy walk over a random order of the whole library
+        without reading all of it.
         
         Args:
             count: Number of videos to retrieve
             similarity_threshold: Maximum similarity threshold between videos
+            min_duration, max_duration, aspect_range, min_height, codec:
+                Candidate filters, as in query_candidates()
+            weighting: Order in which candidates are tried, one of
+                library_sampler.WEIGHTINGS (see get_random_videos())
             
         Returns:
-            List of dictionaries containing video metadata
+            List of dictionaries containing video metadata, in draw order
         """
-        # Get all videos
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT id FROM video_metadata ORDER BY RANDOM()")
-        all_video_ids = [row[0] for row in cursor.fetchall()]
-        conn.close()
-        
-        if not all_video_ids:
-            return []
-        
-        # Start with a random video
-        selected_ids = [all_video_ids[0]]
-        remaining_ids = all_video_ids[1:]
-        
-        # Select videos until we have enough or run out of candidates
-        while len(selected_ids) < count and remaining_ids:
-            candidate_id = remaining_ids.pop(0)
-            
-            # Check if candidate is similar to any already selected video
-            is_similar = False
-            for selected_id in selected_ids:
-                similar_videos = self.find_similar_videos(selected_id, threshold=similarity_threshold)
-                similar_ids = [vid for vid, _ in similar_videos]
-                
-                if candidate_id in similar_ids:
-                    is_similar = True
-                    break
-            
-            if not is_similar:
-                selected_ids.append(candidate_id)
-        
+        # 别名是已有视频的副本，不参与选择
+        where, params = _candidate_filter(min_duration, max_duration, aspect_range, min_height, codec)
+        draws = self.sampler.iter_rows(where, params, ('id', 'features_ready', 'duration', 'resolution'),
+                                       weighting)
+
+        start_time = time.time()
+        rows: List[Tuple[int, int, float, str]] = []
+        ready_picks: List[int] = []
+        fallback_picks: List[int] = []
+        excluded: set = set()  # 与已选视频相似的视频 (相似度缓存)
+        batch = max(count * 2, 64)
+        while len(ready_picks) + len(fallback_picks) < count:
+            drawn = list(islice(draws, batch))
+            if not drawn:
+                break
+            rows.extend(drawn)
+            batch = len(rows)
+
+            # 按抽样顺序贪心选择，新候选只与已选视频比较，不再对每个已选视频扫描全库
+            ready_ids = [video_id for video_id, features_ready, _, _ in drawn if features_ready == FEATURES_READY]
+            if ready_ids and len(ready_picks) < count:
+                if self.use_similarity_cache and self.similarity_cache.covers(similarity_threshold):
+                    ready_picks += self._select_dissimilar_cached(ready_ids, count - len(ready_picks),
+                                                                  similarity_threshold, excluded)
+                else:
+                    index = self.get_feature_index()
+                    ready_picks += index.select_dissimilar(ready_ids, count - len(ready_picks),
+                                                           similarity_threshold, ready_picks)
+            if len(ready_ids) < len(drawn):
+                # 没有特征的视频用元数据粗略去重
+                fallback_picks += self._select_dissimilar_by_metadata(rows, count - len(fallback_picks),
+                                                                      set(ready_picks + fallback_picks))
+
+        selected_ids = ready_picks
+        if fallback_picks:
+            # 与按特征选出的视频按抽样顺序合并
+            rank = {row[0]: position for position, row in enumerate(rows)}
+            selected_ids = sorted(ready_picks + fallback_picks, key=rank.__getitem__)[:count]
+            logger.debug(f"{len(fallback_picks)} 个候选视频尚无特征，按元数据去重")
+        logger.debug(f"从 {len(rows)} 个随机候选中选出 {len(selected_ids)} 个互不相似的视频，"
+                     f"耗时 {time.time() - start_time:.3f}秒")
+        metadata_by_id = self._get_videos_metadata(selected_ids)
+
         # Get metadata for selected videos
         videos = []
         for video_id in selected_ids:
-            try:
-                metadata = self.get_video_metadata(video_id)
-                videos.append(metadata)
-            except ValueError:
-                continue
-                
+            if video_id in metadata_by_id:
+                videos.append(metadata_by_id[video_id])
+
         return videos
 
+    def record_usage(self, video_ids: List[int]):
+        """
+        Count one more use of each video, e.g. after it went into a composition.
+
+        The counts drive the 'inverse_usage' weighting of the random selections.
+        """
+        with self.db.transaction() as cursor:
+            cursor.executemany("UPDATE video_metadata SET use_count = use_count + 1 WHERE id = ?",
+                               [(video_id,) for video_id in video_ids])
+
+    def _select_dissimilar_by_metadata(self, rows: List[Tuple[int, int, float, str]], count: int,
+                                       selected_ids: set) -> List[int]:
+        """
+        Greedy dissimilar selection for videos without features.
+
+        Two videos count as similar when they have the same resolution and
+        durations equal to 0.1 s, which catches re-exports of the same clip
+        but not edited copies.
+
+        Args:
+            rows: (id, features_ready, duration, resolution) of every candidate,
+                in the order they should be tried
+            count: Number of videos to pick
+            selected_ids: Videos already picked, by their features or in
+                earlier rounds
+
+        Returns:
+            Picked IDs of videos without features, in pick order
+        """
+        taken = {(resolution, round(duration or 0.0, 1))
+                 for video_id, _, duration, resolution in rows if video_id in selected_ids}
+        picked = []
+        for video_id, features_ready, duration, resolution in rows:
+            if len(picked) >= count:
+                break
+            key = (resolution, round(duration or 0.0, 1))
+            if features_ready == FEATURES_READY or key in taken:
+                continue
+            taken.add(key)
+            picked.append(video_id)
+        return picked
+
+# 并行扫描工作进程中使用的分析器实例
+_worker_analyzer = None
+
+def _init_scan_worker(db_path: str, sampling_mode: str, decode_backend: str):
+    """Create the per-process VideoAnalyzer used by parallel scans."""
+    global _worker_analyzer
+    _worker_analyzer = VideoAnalyzer(db_path=db_path, sampling_mode=sampling_mode,
+                                     decode_backend=decode_backend, init_database=False)
+
+def _analyze_in_worker(file_path: str, metadata: bool = True) -> Dict[str, Any]:
+    """Analyse one video file in a worker process."""
+    return _worker_analyzer._analyze_video_file(file_path, metadata=metadata)
+
 if __name__ == "__main__":
     import argparse
 
@@ -767,8 +2119,29 @@ if __name__ == "__main__":
     parser.add_argument("--video-dir", required=True, help="Directory containing video files")
     parser.add_argument("--db-path", default="video_library.db", help="Path to the database file")
     parser.add_argument("--debug", action="store_true", help="Enable debug logging")
+    parser.add_argument("--sampling-mode", default="grab", choices=SAMPLING_MODES,
+                        help="Frame sampling mode for feature extraction")
+    parser.add_argument("--decode-backend", default="opencv", choices=DECODE_BACKENDS,
+                        help="Frame decode backend for feature extraction")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes for feature extraction")
+    parser.add_argument("--rescan", action="store_true",
+                        help="Also remove deleted files from the library database")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running and index files as they are added, changed or removed")
+    parser.add_argument("--watch-debounce", type=float, default=2.0,
+                        help="Seconds a file must be quiet before it is processed in watch mode")
+    parser.add_argument("--poll-interval", type=float, default=5.0,
+                        help="Seconds between directory polls when inotify (watchdog) is unavailable")
+    parser.add_argument("--snapshot-dir", default=None,
+                        help="Write a memory-mapped feature snapshot to this directory after scanning")
+    parser.add_argument("--stats-json", default=None,
+                        help="Write per-stage timing statistics of the scan to this JSON file")
+    parser.add_argument("--quick", action="store_true",
+                        help="Only probe metadata with ffprobe before returning; features are extracted in the background")
 
     args = parser.parse_args()
+    configure_logging()
 
     # 如果启用调试模式，设置调试级别日志
     if args.debug:
@@ -787,12 +2160,26 @@ if __name__ == "__main__":
         logger.info(f"数据库路径: {args.db_path}")
         logger.debug(f"调试模式: {'已启用' if args.debug else '未启用'}")
 
-        analyzer = VideoAnalyzer(db_path=args.db_path)
-        count = analyzer.scan_video_library(args.video_dir)
+        analyzer = VideoAnalyzer(db_path=args.db_path, sampling_mode=args.sampling_mode,
+                                 decode_backend=args.decode_backend, snapshot_dir=args.snapshot_dir)
+        count = analyzer.scan_video_library(args.video_dir, workers=args.workers, rescan=args.rescan,
+                                            features=not args.quick)
+        backfill = analyzer.start_feature_backfill(args.video_dir, workers=args.workers) if args.quick else None
 
         logger.info("=== 分析完成 ===")
         print(f"成功处理了 {count} 个视频文件")
 
+        if args.watch:
+            from library_watcher import LibraryWatcher
+            LibraryWatcher(analyzer, args.video_dir, debounce=args.watch_debounce,
+                           poll_interval=args.poll_interval).run()
+        if backfill is not None:
+            # 元数据已可用于合成，等待后台特征提取完成
+            backfill.join()
+            analyzer.update_feature_snapshot()
+        if args.stats_json:
+            analyzer.scan_stats.write_json(args.stats_json)
+
     except Exception as e:
         logger.error(f"程序执行失败: {e}")
         print(f"错误: {e}")
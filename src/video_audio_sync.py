@@ -8,14 +8,11 @@ import argparse
 from pathlib import Path
 from typing import Dict, Any
 
-from video_analyzer import VideoAnalyzer, set_debug_logging
-from video_composer import VideoComposer
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+from frame_sampler import SAMPLING_MODES, DECODE_BACKENDS
+from library_sampler import WEIGHTINGS
+from logging_setup import configure_logging, set_debug_logging
+
+# 分析器、合成器等模块在执行命令时才导入，--help 和参数错误不加载它们
 logger = logging.getLogger('video_audio_sync')
 
 def parse_arguments():
@@ -30,6 +27,8 @@ def parse_arguments():
                         help="Path to the database file")
     parser.add_argument("--debug", action="store_true",
                         help="Enable debug logging")
+    parser.add_argument("--snapshot-dir", default=None,
+                        help="Memory-mapped feature snapshot directory, updated after analysis and used by composition")
     
     # Create subparsers for different commands
     subparsers = parser.add_subparsers(dest="command", help="Command to execute")
@@ -38,6 +37,24 @@ def parse_arguments():
     analyzer_parser = subparsers.add_parser("analyze", help="Analyze video library")
     analyzer_parser.add_argument("--video-dir", required=True,
                                help="Directory containing video files")
+    analyzer_parser.add_argument("--sampling-mode", default="grab", choices=SAMPLING_MODES,
+                               help="Frame sampling mode for feature extraction")
+    analyzer_parser.add_argument("--decode-backend", default="opencv", choices=DECODE_BACKENDS,
+                               help="Frame decode backend for feature extraction")
+    analyzer_parser.add_argument("--workers", type=int, default=1,
+                               help="Number of worker processes for feature extraction")
+    analyzer_parser.add_argument("--rescan", action="store_true",
+                               help="Also remove deleted files from the library database")
+    analyzer_parser.add_argument("--stats-json", default=None,
+                               help="Write per-stage timing statistics of the scan to this JSON file")
+    analyzer_parser.add_argument("--quick", action="store_true",
+                               help="Only probe metadata with ffprobe before returning; features are extracted in the background")
+    analyzer_parser.add_argument("--watch", action="store_true",
+                               help="Keep running and index files as they are added, changed or removed")
+    analyzer_parser.add_argument("--watch-debounce", type=float, default=2.0,
+                               help="Seconds a file must be quiet before it is processed in watch mode")
+    analyzer_parser.add_argument("--poll-interval", type=float, default=5.0,
+                               help="Seconds between directory polls when inotify (watchdog) is unavailable")
     
     # Composer command
     composer_parser = subparsers.add_parser("compose", help="Compose video from segments")
@@ -53,6 +70,14 @@ def parse_arguments():
                                help="Minimum segment duration in seconds")
     composer_parser.add_argument("--max-segment", type=float, default=10.0,
                                help="Maximum segment duration in seconds")
+    composer_parser.add_argument("--aspect-range", type=float, nargs=2, metavar=("MIN", "MAX"), default=None,
+                               help="Only use videos whose aspect ratio (width / height) is within this range")
+    composer_parser.add_argument("--min-height", type=int, default=None,
+                               help="Only use videos at least this many pixels high")
+    composer_parser.add_argument("--codec", default=None,
+                               help="Only use videos in this codec (ffprobe name, e.g. h264)")
+    composer_parser.add_argument("--weighting", default="uniform", choices=sorted(WEIGHTINGS),
+                               help="How candidate videos are drawn: uniformly, by duration, or favouring rarely used videos")
     composer_parser.add_argument("--export-draft", action="store_true",
                                help="Export CapCut/JianYing draft files")
     composer_parser.add_argument("--draft-dir", default="./drafts",
@@ -62,6 +87,18 @@ def parse_arguments():
     pipeline_parser = subparsers.add_parser("pipeline", help="Run full pipeline (analyze + compose)")
     pipeline_parser.add_argument("--video-dir", required=True,
                                help="Directory containing video files")
+    pipeline_parser.add_argument("--sampling-mode", default="grab", choices=SAMPLING_MODES,
+                               help="Frame sampling mode for feature extraction")
+    pipeline_parser.add_argument("--decode-backend", default="opencv", choices=DECODE_BACKENDS,
+                               help="Frame decode backend for feature extraction")
+    pipeline_parser.add_argument("--workers", type=int, default=1,
+                               help="Number of worker processes for feature extraction")
+    pipeline_parser.add_argument("--rescan", action="store_true",
+                               help="Also remove deleted files from the library database")
+    pipeline_parser.add_argument("--stats-json", default=None,
+                               help="Write per-stage timing statistics of the scan to this JSON file")
+    pipeline_parser.add_argument("--quick", action="store_true",
+                               help="Only probe metadata with ffprobe before returning; features are extracted in the background")
     pipeline_parser.add_argument("--audio", required=False,
                                help="Path to the audio file (optional)")
     pipeline_parser.add_argument("--duration", type=float, required=False,
@@ -74,6 +111,14 @@ def parse_arguments():
                                help="Minimum segment duration in seconds")
     pipeline_parser.add_argument("--max-segment", type=float, default=10.0,
                                help="Maximum segment duration in seconds")
+    pipeline_parser.add_argument("--aspect-range", type=float, nargs=2, metavar=("MIN", "MAX"), default=None,
+                               help="Only use videos whose aspect ratio (width / height) is within this range")
+    pipeline_parser.add_argument("--min-height", type=int, default=None,
+                               help="Only use videos at least this many pixels high")
+    pipeline_parser.add_argument("--codec", default=None,
+                               help="Only use videos in this codec (ffprobe name, e.g. h264)")
+    pipeline_parser.add_argument("--weighting", default="uniform", choices=sorted(WEIGHTINGS),
+                               help="How candidate videos are drawn: uniformly, by duration, or favouring rarely used videos")
     pipeline_parser.add_argument("--export-draft", action="store_true",
                                help="Export CapCut/JianYing draft files")
     pipeline_parser.add_argument("--draft-dir", default="./drafts",
@@ -94,17 +139,56 @@ def parse_arguments():
         
     return args
 
-def run_analyzer(args):
-    """Run the video analyzer module."""
+def _scan_library(args):
+    """
+    Scan the video library.
+
+    With --quick only the metadata phase runs here and the features are
+    extracted in a background thread, so composition can start at once.
+
+    Returns:
+        Tuple (analyzer, count, backfill thread or None)
+    """
+    from video_analyzer import VideoAnalyzer
+
     logger.info(f"Analyzing video library at {args.video_dir}")
-    analyzer = VideoAnalyzer(db_path=args.db_path)
-    count = analyzer.scan_video_library(args.video_dir)
+    analyzer = VideoAnalyzer(db_path=args.db_path, sampling_mode=args.sampling_mode,
+                             decode_backend=args.decode_backend, snapshot_dir=args.snapshot_dir)
+    count = analyzer.scan_video_library(args.video_dir, workers=args.workers, rescan=args.rescan,
+                                        features=not args.quick)
     logger.info(f"Processed {count} videos")
+    backfill = None
+    if args.quick:
+        logger.info("元数据已写入，可以开始合成；特征在后台继续提取")
+        backfill = analyzer.start_feature_backfill(args.video_dir, workers=args.workers)
+    return analyzer, count, backfill
+
+def _finish_scan(args, analyzer, backfill):
+    """Wait for background feature extraction, then save the snapshot and statistics."""
+    if backfill is not None:
+        backfill.join()
+        analyzer.update_feature_snapshot()
+    if args.stats_json:
+        analyzer.scan_stats.write_json(args.stats_json)
+
+def run_analyzer(args):
+    """Run the video analyzer module."""
+    analyzer, count, backfill = _scan_library(args)
+
+    if getattr(args, 'watch', False):
+        # 首次增量扫描之后持续监视目录变化
+        from library_watcher import LibraryWatcher
+        watcher = LibraryWatcher(analyzer, args.video_dir, debounce=args.watch_debounce,
+                                 poll_interval=args.poll_interval)
+        watcher.run()
+    _finish_scan(args, analyzer, backfill)
     return count
 
 def run_composer(args):
     """Run the video composer module."""
-    composer = VideoComposer(db_path=args.db_path)
+    from video_composer import VideoComposer
+
+    composer = VideoComposer(db_path=args.db_path, snapshot_dir=args.snapshot_dir)
     
     # 确定视频时长
     if args.audio:
@@ -121,7 +205,11 @@ def run_composer(args):
         audio_duration=video_duration,
         similarity_threshold=args.similarity_threshold,
         min_segment_duration=args.min_segment,
-        max_segment_duration=args.max_segment
+        max_segment_duration=args.max_segment,
+        aspect_range=tuple(args.aspect_range) if args.aspect_range else None,
+        min_height=args.min_height,
+        codec=args.codec,
+        weighting=args.weighting
     )
     
     if not video_segments:
@@ -151,18 +239,22 @@ def run_composer(args):
 def run_pipeline(args):
     """Run the full pipeline (analyze + compose)."""
     # First run the analyzer
-    count = run_analyzer(args)
-    if count == 0:
-        logger.error("未找到或处理视频。请检查您的视频目录。")
-        return None
-    
-    # Then run the composer
-    output_path = run_composer(args)
-    return output_path
+    analyzer, count, backfill = _scan_library(args)
+    try:
+        if count == 0:
+            logger.error("未找到或处理视频。请检查您的视频目录。")
+            return None
+
+        # Then run the composer; with --quick the features are extracted meanwhile
+        output_path = run_composer(args)
+        return output_path
+    finally:
+        _finish_scan(args, analyzer, backfill)
 
 def main():
     """Main entry point."""
     args = parse_arguments()
+    configure_logging()
     
     # 设置调试日志级别
     if args.debug:
@@ -11,9 +11,9 @@ from pathlib import Path
 from typing import List, Dict, Tuple, Optional, Any, Union
 
 import numpy as np
-import ffmpeg
 
-from video_analyzer import VideoAnalyzer
+from video_analyzer import VideoAnalyzer, FEATURES_READY
+from logging_setup import configure_logging
 
 # Lazy import for moviepy to avoid import issues
 def _import_moviepy():
@@ -26,26 +26,30 @@ def _import_moviepy():
         logger.error("Please install moviepy: pip install moviepy>=2.0.0")
         raise ImportError("moviepy is required but not properly installed") from e
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger('video_composer')
 
 class VideoComposer:
     """Video composition module for selecting, cutting, and composing videos."""
     
-    def __init__(self, db_path: str = 'video_library.db'):
+    def __init__(self, db_path: str = 'video_library.db', snapshot_dir: Optional[str] = None):
         """
         Initialize the VideoComposer with a database path.
         
         Args:
             db_path: Path to the SQLite database file
+            snapshot_dir: Feature snapshot directory to load the feature index from
         """
         self.db_path = db_path
-        self.analyzer = VideoAnalyzer(db_path=db_path)
+        self.snapshot_dir = snapshot_dir
+        self._analyzer: Optional[VideoAnalyzer] = None
         self.temp_dir = None
+
+    @property
+    def analyzer(self) -> VideoAnalyzer:
+        """The VideoAnalyzer reading the library, created on first use."""
+        if self._analyzer is None:
+            self._analyzer = VideoAnalyzer(db_path=self.db_path, snapshot_dir=self.snapshot_dir)
+        return self._analyzer
     
     def analyze_audio(self, audio_path: str) -> Dict[str, Any]:
         """
@@ -57,6 +61,8 @@ class VideoComposer:
         Returns:
             Dictionary containing audio metadata
         """
+        import ffmpeg
+
         try:
             probe = ffmpeg.probe(audio_path)
             audio_stream = next((stream for stream in probe['streams'] 
@@ -83,15 +89,29 @@ class VideoComposer:
                      audio_duration: float, 
                      similarity_threshold: float = 0.5,
                      min_segment_duration: float = 1.0,
-                     max_segment_duration: float = 10.0) -> List[Dict[str, Any]]:
+                     max_segment_duration: float = 10.0,
+                     aspect_range: Optional[Tuple[float, float]] = None,
+                     min_height: Optional[int] = None,
+                     codec: Optional[str] = None,
+                     weighting: str = 'uniform') -> List[Dict[str, Any]]:
         """
         Select videos to compose a video of the given duration.
+
+        Videos whose features are not extracted yet (a library scanned with
+        features=False) are eligible too; they are kept apart by a cheaper
+        metadata check instead of their features.
         
         Args:
             audio_duration: Duration of the audio file in seconds
             similarity_threshold: Maximum similarity threshold between videos
             min_segment_duration: Minimum duration of each video segment
             max_segment_duration: Maximum duration of each video segment
+            aspect_range: Only use videos whose display aspect ratio (width /
+                height) is within (min, max)
+            min_height: Only use videos at least this many pixels high
+            codec: Only use videos in this codec (ffprobe name, e.g. 'h264')
+            weighting: How candidates are drawn, one of library_sampler.WEIGHTINGS;
+                'inverse_usage' favours videos used in fewer compositions
             
         Returns:
             List of dictionaries containing video segment information
@@ -103,17 +123,24 @@ class VideoComposer:
         # Get random dissimilar videos
         # We request more videos than we might need
         estimated_segments = int(audio_duration / min_segment_duration) * 2
+        # 时长、画幅、分辨率和编码在 SQL 中按索引筛选
         candidate_videos = self.analyzer.get_random_dissimilar_videos(
             count=estimated_segments, 
-            similarity_threshold=similarity_threshold
+            similarity_threshold=similarity_threshold,
+            min_duration=min_segment_duration,
+            aspect_range=aspect_range,
+            min_height=min_height,
+            codec=codec,
+            weighting=weighting
         )
         
         if not candidate_videos:
             raise ValueError("No videos found in the database. Run the video analyzer first.")
+        pending = sum(1 for video in candidate_videos if video['features_ready'] != FEATURES_READY)
+        if pending:
+            logger.info(f"{pending} 个候选视频尚未提取特征，按元数据去重")
         
-        # Shuffle videos for randomness
-        random.shuffle(candidate_videos)
-        
+        # 候选视频已按抽样顺序排列，加权抽样时靠前的是权重大的视频，不再打乱
         # Select videos until we reach the target duration
         while total_duration < audio_duration and candidate_videos:
             video = candidate_videos.pop(0)
@@ -174,6 +201,8 @@ class VideoComposer:
         Returns:
             Path to the cut video
         """
+        import ffmpeg
+
         try:
             # Ensure output directory exists
             os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
@@ -267,6 +296,9 @@ class VideoComposer:
             for clip in clips:
                 clip.close()
                 
+            # 记录使用次数，供 'inverse_usage' 加权抽样优先选择较少使用的视频
+            self.analyzer.record_usage([segment['video_id'] for segment in video_segments
+                                        if segment.get('video_id') is not None])
             logger.info(f"Composed video saved to {output_path}")
             return output_path
             
@@ -427,10 +459,13 @@ if __name__ == "__main__":
                         help="Export CapCut/JianYing draft files")
     parser.add_argument("--draft-dir", default="./drafts", 
                         help="Directory to save draft files")
+    parser.add_argument("--snapshot-dir", default=None,
+                        help="Feature snapshot directory written by the analyzer")
     
     args = parser.parse_args()
+    configure_logging()
     
-    composer = VideoComposer(db_path=args.db_path)
+    composer = VideoComposer(db_path=args.db_path, snapshot_dir=args.snapshot_dir)
     
     # Analyze audio
     audio_metadata = composer.analyze_audio(args.audio)